@@ -0,0 +1,95 @@
+# Preference-extraction benchmark: how many sample utterances still need the LLM, and what
+# that does to latency, with and without the local fast path. The LLM is stubbed with a
+# fixed delay so the numbers don't depend on the network.
+#
+#   cd backend && python -m benchmarks.extraction --llm-latency 1.2
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import utils
+
+SAMPLE_UTTERANCES = [
+    "pop", "happy", "no preference", "fast", "taylor swift", "rock", "sad", "slow", "chill",
+    "something happy", "I want some pop music", "sad songs please", "calm", "energetic",
+    "hip hop", "r&b", "jazz and slow", "something upbeat", "medium tempo", "romantic",
+    "fast rock", "I'm feeling nostalgic", "melancholy", "hapy", "rok", "something good",
+    "drake", "ed sheeran", "play me some coldplay", "songs like the weeknd", "similar to adele",
+    "I just got dumped", "music for studying", "hi", "what can you do?", "whatever", "anything",
+    "latin", "dreamy vibes", "angry metal", "uplifting", "more energy", "something sad",
+    "country", "electronic fast", "mellow jazz", "I love bad bunny", "lofi", "pop", "happy",
+]
+
+EMPTY_EXTRACTION = json.dumps({"genre": None, "mood": None, "tempo": None, "artist_or_song": None})
+
+
+class StubLLM:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    async def complete(self, messages, api_key, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return EMPTY_EXTRACTION
+
+
+def load_artist_matcher():
+    try:
+        from recommender_eng import catalog
+        return catalog.artist_matcher if len(catalog.artist_matcher) else None
+    except Exception as e:
+        print("[BENCH] Catalog unavailable, artist resolution disabled:", e)
+        return None
+
+
+async def run(utterances, artist_matcher, local: bool, llm: StubLLM) -> dict:
+    utils.LOCAL_EXTRACTION_ENABLED = local
+    utils.EXTRACTION_CACHE.clear()
+    llm.calls = 0
+    latencies = []
+    for message in utterances:
+        start = time.perf_counter()
+        await utils.extract_preferences_from_message(message, "bench", artist_matcher)
+        latencies.append(time.perf_counter() - start)
+    latencies_ms = sorted(x * 1000 for x in latencies)
+    return {
+        "local_fast_path": local,
+        "utterances": len(utterances),
+        "llm_calls": llm.calls,
+        "llm_call_rate": round(llm.calls / len(utterances), 3),
+        "mean_ms": round(statistics.mean(latencies_ms), 2),
+        "p50_ms": round(latencies_ms[len(latencies_ms) // 2], 2),
+        "p95_ms": round(latencies_ms[min(len(latencies_ms) - 1, int(len(latencies_ms) * 0.95))], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preference-extraction benchmark with and without the local fast path")
+    parser.add_argument("--llm-latency", type=float, default=1.2, help="stubbed LLM round trip, seconds")
+    parser.add_argument("--corpus", help="optional file with one utterance per line")
+    parser.add_argument("--show", action="store_true", help="print which utterances stay local")
+    args = parser.parse_args()
+
+    utterances = SAMPLE_UTTERANCES
+    if args.corpus:
+        with open(args.corpus) as f:
+            utterances = [line.strip() for line in f if line.strip()]
+    artist_matcher = load_artist_matcher()
+    llm = StubLLM(args.llm_latency)
+    utils.llm = llm
+
+    results = [asyncio.run(run(utterances, artist_matcher, local, llm)) for local in (False, True)]
+    for result in results:
+        print(json.dumps(result))
+    if args.show:
+        for message in utterances:
+            prefs, confidence = utils.extract_preferences_locally(message, artist_matcher)
+            route = "local" if confidence >= utils.LOCAL_CONFIDENCE_THRESHOLD else "llm"
+            print(f"{route:5} {confidence:.2f} {message!r} -> {prefs}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# Local stand-in for the chat-completions endpoint, for load tests that must not depend on (or
+# pay for) OpenAI. Requests are classified by their system prompt (preference extraction, mood
+# vector, song blurb, follow-up question) and answered with deterministic, well-formed content
+# after a configurable delay; a share of them fail or stall. Streaming requests get SSE deltas
+# one word at a time. GET /stats returns call counts per kind; POST /stats/reset clears them.
+#
+#   cd backend && python -m benchmarks.fake_openai --port 8001 --latency-ms 600 --error-rate 0.02
+#   OPENAI_API_URL=http://127.0.0.1:8001/v1/chat/completions OPENAI_API_KEY=fake uvicorn main:app
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from collections import Counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from utils import GENRES, MOODS
+
+TEMPOS = {"slow": "slow", "medium": "medium", "fast": "fast", "upbeat": "fast", "chill": "slow"}
+KIND_MARKERS = (
+    ("extract", "extracts ONLY music preferences"),
+    ("mood_vector", "mapping musical moods"),
+    ("blurb", "helpful music assistant"),
+    ("followup", "conversational AI music assistant"),
+)
+BLURB_TEXT = "Here's a track that fits your vibe perfectly, give it a spin and let me know what you think!"
+FOLLOWUP_TEXT = "Sounds great! What genre are you in the mood for today, or do you have no preference?"
+
+
+class FakeOpenAI:
+    def __init__(
+        self,
+        latency_ms: float = 500,
+        jitter_ms: float = 200,
+        token_ms: float = 15,
+        error_rate: float = 0.0,
+        stall_rate: float = 0.0,
+        stall_ms: float = 30000,
+        seed: int = 0,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_ms = stall_ms
+        self.rng = random.Random(seed)
+        self.reset()
+
+    def reset(self):
+        self.calls = Counter()
+        self.errors = Counter()
+        self.stalls = Counter()
+        self.streams = 0
+        self.started = time.time()
+
+    def stats(self) -> dict:
+        return {
+            "calls": dict(self.calls),
+            "errors": dict(self.errors),
+            "stalls": dict(self.stalls),
+            "streams": self.streams,
+            "total_calls": sum(self.calls.values()),
+            "uptime_s": round(time.time() - self.started, 1),
+        }
+
+    @staticmethod
+    def kind(messages: list) -> str:
+        system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+        for kind, marker in KIND_MARKERS:
+            if marker in system:
+                return kind
+        return "other"
+
+    @staticmethod
+    def content(kind: str, messages: list) -> str:
+        prompt = messages[-1].get("content", "") if messages else ""
+        if kind == "extract":
+            # Pick preferences out of the quoted input by vocabulary, like a well-behaved model
+            match = re.search(r'Input: "(.*)"\.', prompt, re.S)
+            words = re.findall(r"[a-z&']+", (match.group(1) if match else prompt).lower())
+            return json.dumps({
+                "genre": next((w for w in words if w in GENRES), None),
+                "mood": next((w for w in words if w in MOODS), None),
+                "tempo": next((TEMPOS[w] for w in words if w in TEMPOS), None),
+                "artist_or_song": None,
+            })
+        if kind == "mood_vector":
+            # Stable per mood, so repeated runs rank the same songs
+            match = re.search(r"The mood '([^']*)'", prompt)
+            digest = hashlib.sha256((match.group(1) if match else prompt).encode()).digest()
+            return json.dumps([round(b / 255, 3) for b in digest[:5]])
+        if kind == "followup":
+            return FOLLOWUP_TEXT
+        return BLURB_TEXT
+
+    async def delay(self, kind: str) -> bool:
+        # Sleeps for the simulated model latency; True when this call should fail
+        roll = self.rng.random()
+        if roll < self.stall_rate:
+            self.stalls[kind] += 1
+            await asyncio.sleep(self.stall_ms / 1000)
+        else:
+            await asyncio.sleep(max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+        if roll >= 1 - self.error_rate:
+            self.errors[kind] += 1
+            return True
+        return False
+
+    async def chunks(self, text: str):
+        for i, word in enumerate(text.split(" ")):
+            delta = word if i == 0 else " " + word
+            yield f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': delta}}]})}\n\n"
+            await asyncio.sleep(self.token_ms / 1000)
+        yield "data: [DONE]\n\n"
+
+    async def handle(self, body: dict):
+        messages = body.get("messages") or []
+        kind = self.kind(messages)
+        self.calls[kind] += 1
+        if await self.delay(kind):
+            return JSONResponse(status_code=503, content={"error": {"message": "Simulated upstream error"}})
+        text = self.content(kind, messages)
+        if body.get("stream"):
+            self.streams += 1
+            return StreamingResponse(self.chunks(text), media_type="text/event-stream")
+        return {
+            "id": f"chatcmpl-fake-{sum(self.calls.values())}",
+            "object": "chat.completion",
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        }
+
+
+def create_app(fake: FakeOpenAI) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        return await fake.handle(await request.json())
+
+    @app.get("/stats")
+    def stats():
+        return fake.stats()
+
+    @app.post("/stats/reset")
+    def reset():
+        fake.reset()
+        return fake.stats()
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=500, help="mean time before the first byte")
+    parser.add_argument("--jitter-ms", type=float, default=200, help="latency varies uniformly by +/- this much")
+    parser.add_argument("--token-ms", type=float, default=15, help="delay between streamed deltas")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with HTTP 503")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="share of calls that hang for --stall-ms first")
+    parser.add_argument("--stall-ms", type=float, default=30000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import uvicorn
+    fake = FakeOpenAI(args.latency_ms, args.jitter_ms, args.token_ms, args.error_rate, args.stall_rate, args.stall_ms, args.seed)
+    uvicorn.run(create_app(fake), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
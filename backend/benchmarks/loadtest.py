@@ -0,0 +1,255 @@
+# End-to-end load test: virtual users replay scripted conversations (collecting preferences,
+# a recommendation, "no", "another", "change genre", positive feedback, reset) against a running
+# app, at one or more concurrency levels. Reports throughput, latency percentiles per endpoint
+# and per script step, and LLM calls per turn as counted by benchmarks.fake_openai. --spawn
+# starts the fake LLM and the app itself, so nothing leaves the machine.
+#
+#   cd backend && python -m benchmarks.loadtest --spawn --concurrency 1,8,32,64 --duration 30
+#   cd backend && python -m benchmarks.loadtest --app http://127.0.0.1:10000 --llm http://127.0.0.1:8001 --stream
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+# (step, endpoint, payload); /recommend payloads are preference fields, /command ones the text
+CONVERSATIONS = {
+    "collect_and_browse": [
+        ("mood", "recommend", {"mood": "I'm feeling happy"}),
+        ("genre", "recommend", {"genre": "pop"}),
+        ("tempo", "recommend", {"tempo": "something fast"}),
+        ("recommend", "recommend", {"artist_or_song": "no preference"}),
+        ("no", "command", "no"),
+        ("another", "command", "another one"),
+        ("change_genre", "command", "change genre"),
+        ("new_genre", "recommend", {"genre": "rock"}),
+        ("yes", "command", "yes"),
+        ("reset", "reset", None),
+    ],
+    "vague_then_specific": [
+        ("vague", "recommend", {"mood": "songs for a rainy sunday drive"}),
+        ("mood", "recommend", {"mood": "melancholy"}),
+        ("genre", "recommend", {"genre": "indie please"}),
+        ("tempo", "recommend", {"tempo": "slow"}),
+        ("recommend", "recommend", {"artist_or_song": "whatever"}),
+        ("no", "command", "nah"),
+        ("no", "command", "try again"),
+        ("reset", "command", "start over"),
+    ],
+}
+STREAM_PATHS = {"recommend": "/recommend/stream", "command": "/command/stream"}
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summarize(latencies: list) -> dict:
+    return {
+        "count": len(latencies),
+        "mean_ms": round(statistics.mean(latencies), 1),
+        "p50_ms": round(percentile(latencies, 0.5), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "max_ms": round(max(latencies), 1),
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.first_byte = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.turns = 0
+        self.conversations = 0
+
+    def add(self, key: str, elapsed_ms: float, first_byte_ms: float = None):
+        self.latencies[key].append(elapsed_ms)
+        if first_byte_ms is not None:
+            self.first_byte[key].append(first_byte_ms)
+
+
+async def send(client: httpx.AsyncClient, endpoint: str, payload, session_id: str, stream: bool) -> tuple:
+    # (elapsed ms, first byte ms or None, HTTP status)
+    if endpoint == "recommend":
+        body = {"session_id": session_id, **payload}
+    else:
+        body = {"session_id": session_id, "command": payload or "reset"}
+    start = time.perf_counter()
+    if stream and endpoint in STREAM_PATHS:
+        first_byte = None
+        async with client.stream("POST", STREAM_PATHS[endpoint], json=body) as response:
+            async for _ in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = (time.perf_counter() - start) * 1000
+        return (time.perf_counter() - start) * 1000, first_byte, response.status_code
+    response = await client.post(f"/{endpoint}", json=body)
+    return (time.perf_counter() - start) * 1000, None, response.status_code
+
+
+async def virtual_user(user: int, client: httpx.AsyncClient, recorder: Recorder, deadline: float, stream: bool, tag: str):
+    names = sorted(CONVERSATIONS)
+    n = 0
+    while time.perf_counter() < deadline:
+        name = names[(user + n) % len(names)]
+        session_id = f"load-{tag}-{user}-{n}"
+        n += 1
+        for step, endpoint, payload in CONVERSATIONS[name]:
+            try:
+                elapsed, first_byte, status = await send(client, endpoint, payload, session_id, stream)
+            except httpx.HTTPError as e:
+                recorder.errors[f"{endpoint}:{type(e).__name__}"] += 1
+                break
+            recorder.turns += 1
+            if status != 200:
+                recorder.errors[f"{endpoint}:{status}"] += 1
+                continue
+            path = STREAM_PATHS[endpoint] if stream and endpoint in STREAM_PATHS else f"/{endpoint}"
+            recorder.add(path, elapsed, first_byte)
+            recorder.add(f"{name}/{step}", elapsed, first_byte)
+        else:
+            recorder.conversations += 1
+
+
+async def llm_stats(client: httpx.AsyncClient, reset: bool = False) -> dict:
+    try:
+        response = await (client.post("/stats/reset") if reset else client.get("/stats"))
+        return response.json()
+    except httpx.HTTPError:
+        return None
+
+
+async def run_level(args, concurrency: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=args.app, timeout=args.timeout, limits=limits) as client, \
+            httpx.AsyncClient(base_url=args.llm, timeout=5) as llm_client:
+        await llm_stats(llm_client, reset=True)
+        recorder = Recorder()
+        start = time.perf_counter()
+        deadline = start + args.duration
+        tag = f"{concurrency}-{int(time.time())}"
+        await asyncio.gather(*(virtual_user(u, client, recorder, deadline, args.stream, tag) for u in range(concurrency)))
+        wall = time.perf_counter() - start
+        llm = await llm_stats(llm_client)
+
+    report = {
+        "concurrency": concurrency,
+        "wall_s": round(wall, 1),
+        "turns": recorder.turns,
+        "conversations": recorder.conversations,
+        "turns_per_s": round(recorder.turns / wall, 1),
+        "errors": dict(recorder.errors),
+        "endpoints": {},
+        "steps": {},
+    }
+    for key, latencies in sorted(recorder.latencies.items()):
+        summary = summarize(latencies)
+        if recorder.first_byte.get(key):
+            summary["first_byte_p50_ms"] = round(percentile(recorder.first_byte[key], 0.5), 1)
+            summary["first_byte_p95_ms"] = round(percentile(recorder.first_byte[key], 0.95), 1)
+        report["endpoints" if key.startswith("/") else "steps"][key] = summary
+    if llm is not None:
+        turns = max(recorder.turns, 1)
+        report["llm_calls_per_turn"] = round(llm["total_calls"] / turns, 3)
+        report["llm_calls_per_turn_by_kind"] = {kind: round(n / turns, 3) for kind, n in sorted(llm["calls"].items())}
+        report["llm_errors"] = llm["errors"]
+    return report
+
+
+def wait_until_up(url: str, path: str, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url + path, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def spawn(args) -> list:
+    # The fake LLM and the app as child processes, logging to a scratch directory; the app's mood
+    # vectors go there too so fake vectors never land in data/mood_vectors.json
+    work_dir = tempfile.mkdtemp(prefix="moodify-load-")
+    log = open(os.path.join(work_dir, "server.log"), "w")
+    fake = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_openai", "--port", str(args.llm_port),
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--error-rate", str(args.error_rate), "--stall-rate", str(args.stall_rate),
+    ], stdout=log, stderr=subprocess.STDOUT)
+    env = dict(
+        os.environ,
+        OPENAI_API_URL=f"http://127.0.0.1:{args.llm_port}/v1/chat/completions",
+        OPENAI_API_KEY="fake-key",
+        MOOD_VECTOR_CACHE_PATH=os.path.join(work_dir, "mood_vectors.json"),
+    )
+    if args.workers > 1:
+        # Each worker would otherwise keep its own in-memory sessions, and a conversation's turns
+        # land on different workers; share them through a scratch SQLite file instead
+        env["MOODIFY_SESSION_BACKEND"] = "sqlite"
+        env["SESSION_DB_PATH"] = os.path.join(work_dir, "sessions.db")
+    if args.catalog_rows:
+        from benchmarks.synthetic import write_catalog
+        from catalog_build import build_catalog_artifact
+        from catalog import FEATURES
+        csv_path = write_catalog(args.catalog_rows, os.path.join(work_dir, "songs.csv"))
+        build_catalog_artifact(csv_path, os.path.join(work_dir, "catalog"), FEATURES)
+        env["CATALOG_DIR"] = os.path.join(work_dir, "catalog")
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.app_port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    print(f"[LOAD] Server logs: {log.name}")
+    args.app = f"http://127.0.0.1:{args.app_port}"
+    args.llm = f"http://127.0.0.1:{args.llm_port}"
+    try:
+        wait_until_up(args.llm, "/stats", 30)
+        wait_until_up(args.app, "/test-cors", 120)
+    except Exception:
+        for process in (app, fake):
+            process.terminate()
+        raise
+    return [app, fake]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversation load test")
+    parser.add_argument("--app", default="http://127.0.0.1:10000")
+    parser.add_argument("--llm", default="http://127.0.0.1:8001", help="fake_openai server, for LLM call counts")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated virtual user counts, run in turn")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per concurrency level")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--stream", action="store_true", help="use the SSE endpoints and record time to first byte")
+    parser.add_argument("--spawn", action="store_true", help="start fake_openai and the app as subprocesses")
+    parser.add_argument("--app-port", type=int, default=10100)
+    parser.add_argument("--llm-port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=1, help="with --spawn, app workers; above 1 they share SQLite sessions")
+    parser.add_argument("--catalog-rows", type=int, help="with --spawn, serve a synthetic catalog of this size")
+    parser.add_argument("--latency-ms", type=float, default=500)
+    parser.add_argument("--jitter-ms", type=float, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    processes = spawn(args) if args.spawn else []
+    try:
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            print(json.dumps(asyncio.run(run_level(args, concurrency))))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# Recommender benchmark suite: latency percentiles and peak traced memory per stage (catalog
+# build, artifact build/open, artist matching, scoring, recommend_engine per preference mix)
+# on synthetic catalogs. Nothing here talks to the LLM: mood vectors are seeded into the local
+# store and recommend_engine only ever reads that. Baselines are plain JSON, so a saved run
+# can be compared against later ones.
+#
+#   cd backend && python -m benchmarks.recommender --rows 10000,100000 --save-baseline bench.json
+#   cd backend && python -m benchmarks.recommender --rows 10000,100000 --compare bench.json
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import recommender_eng
+import utils
+from benchmarks.synthetic import write_catalog
+from catalog import CatalogIndex, FEATURES
+from catalog_build import build_catalog, build_catalog_artifact
+from memory import SessionStore
+
+MOOD_VECTORS = {
+    "happy": [0.9, 0.8, 0.8, 0.2, 0.7],
+    "sad": [0.1, 0.2, 0.3, 0.8, 0.3],
+    "calm": [0.4, 0.2, 0.3, 0.7, 0.2],
+}
+PREFERENCE_MIXES = {
+    "broad": {"genre": "pop", "mood": "happy", "tempo": "fast", "artist_or_song": None},
+    "no_preferences": {"genre": None, "mood": None, "tempo": None, "artist_or_song": None},
+    "artist": {"genre": None, "mood": "sad", "tempo": None, "artist_or_song": "taylor swift"},
+    "similar_to": {"genre": "rap", "mood": None, "tempo": "slow", "artist_or_song": "similar to drake"},
+    "long_history": {"genre": "rock", "mood": "calm", "tempo": None, "artist_or_song": None},
+    "misspelled_artist": {"genre": None, "mood": "happy", "tempo": None, "artist_or_song": "tayler swfit"},
+}
+ARTIST_QUERIES = {"exact": "taylor swift", "misspelled": "tayler swfit", "title": "summer love", "no_match": "zzqx vrrp"}
+ROW_SAMPLE = 1000
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def measure(fn, runs: int) -> dict:
+    # Latency untraced, then one traced call for peak memory above what was already allocated
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "runs": runs,
+        "mean_ms": round(statistics.mean(latencies), 3),
+        "p50_ms": round(percentile(latencies, 0.5), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "peak_kb": round((peak - baseline) / 1024, 1),
+    }
+
+
+def preferences(mix: str, catalog: CatalogIndex, rng) -> dict:
+    prefs = dict(PREFERENCE_MIXES[mix])
+    for key in ("genre", "mood", "tempo", "artist_or_song"):
+        prefs[f"no_pref_{key}"] = prefs[key] is None
+    prefs["history"] = []
+    if mix == "long_history":
+        # A session at its history cap
+        prefs["history"] = rng.choice(catalog.size, min(SessionStore.HISTORY_LIMIT, catalog.size), replace=False).tolist()
+    return prefs
+
+
+def row_dicts(catalog: CatalogIndex, positions) -> list:
+    # The row shape the single-row weighted_score reads
+    labels = catalog.labels
+    return [
+        {
+            "mode_category": labels["mood"][catalog.label_codes["mood"][p]],
+            "playlist_genre": labels["genre"][catalog.label_codes["genre"][p]],
+            "tempo_category": labels["tempo"][catalog.label_codes["tempo"][p]],
+            "track_artist": catalog.track_artist[p],
+            "track_name": catalog.track_name[p],
+            "track_popularity": catalog.score_popularity[p] * 100,
+        }
+        for p in positions
+    ]
+
+
+def bench_size(rows: int, work_dir: str, runs: int, seed: int) -> dict:
+    results = {}
+    csv_path = os.path.join(work_dir, f"songs-{rows}-{seed}.csv")
+    if not os.path.exists(csv_path):
+        write_catalog(rows, csv_path, seed)
+
+    results["build_catalog"] = measure(lambda: build_catalog(csv_path, FEATURES, flag_words=recommender_eng.SCORE_FLAGS), 1)
+    artifact_root = os.path.join(work_dir, f"catalog-{rows}-{seed}")
+    artifact = {}
+    results["build_artifact"] = measure(lambda: artifact.update(path=build_catalog_artifact(csv_path, artifact_root, FEATURES)), 1)
+
+    def open_artifact():
+        index = CatalogIndex.open(artifact["path"], flag_words=recommender_eng.SCORE_FLAGS)
+        index.warm()
+        return index
+    results["open_artifact"] = measure(open_artifact, 3)
+
+    catalog = open_artifact()
+    recommender_eng.catalog = catalog
+    rng = np.random.default_rng(seed)
+
+    for name, query in ARTIST_QUERIES.items():
+        results[f"match_artist_song/{name}"] = measure(lambda: catalog.match_artist_song(query), runs)
+
+    broad = preferences("broad", catalog, rng)
+    every_row = np.arange(catalog.size)
+    results["weighted_scores/all_rows"] = measure(lambda: recommender_eng.weighted_scores(every_row, broad, catalog), max(3, runs // 10))
+    sample = row_dicts(catalog, rng.choice(catalog.size, min(ROW_SAMPLE, catalog.size), replace=False))
+    results[f"weighted_score/{len(sample)}_rows"] = measure(lambda: [recommender_eng.weighted_score(row, broad) for row in sample], max(3, runs // 10))
+
+    for mix in PREFERENCE_MIXES:
+        prefs = preferences(mix, catalog, rng)
+        results[f"recommend_engine/{mix}"] = measure(
+            lambda: recommender_eng.recommend_engine(dict(prefs, history=list(prefs["history"])), None), runs
+        )
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for key, current in sorted(results.items()):
+        before = baseline.get(key)
+        if not before:
+            continue
+        change = (current["p50_ms"] - before["p50_ms"]) / max(before["p50_ms"], 1e-6)
+        flag = "REGRESSION" if change > tolerance else ""
+        print(f"{key:50} p50 {before['p50_ms']:>10.3f} -> {current['p50_ms']:>10.3f} ms ({change:+.0%}) {flag}")
+        if flag:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommender benchmarks on synthetic catalogs")
+    parser.add_argument("--rows", default="10000,100000,1000000", help="comma-separated catalog sizes")
+    parser.add_argument("--runs", type=int, default=50, help="timed runs per per-request stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "moodify-bench"))
+    parser.add_argument("--save-baseline", help="write this run's results to a JSON file")
+    parser.add_argument("--compare", help="compare against a saved baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="p50 slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    for mood, vec in MOOD_VECTORS.items():
+        utils.MOOD_VECTORS.put(mood, vec, persist=False)
+
+    results = {}
+    for rows in [int(r) for r in args.rows.split(",")]:
+        for stage, summary in bench_size(rows, args.work_dir, args.runs, args.seed).items():
+            results[f"{rows}/{stage}"] = summary
+            print(json.dumps({"rows": rows, "stage": stage, **summary}))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"[BENCH] Baseline saved to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"[BENCH] {len(regressions)} stage(s) slower than baseline by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Synthetic song catalogs with the columns catalog_build reads from data/songs.csv, so
+# benchmarks don't depend on whichever CSV is on disk. Artists follow a long-tail distribution
+# and a few well-known names are always present for artist-specific preference mixes.
+#
+#   cd backend && python -m benchmarks.synthetic --rows 100000 --out /tmp/songs-100k.csv
+import argparse
+
+import numpy as np
+import pandas as pd
+
+GENRES = ["pop", "rock", "rap", "r&b", "latin", "edm"]
+KNOWN_ARTISTS = [
+    "Taylor Swift", "Ed Sheeran", "Drake", "Adele", "The Weeknd", "Billie Eilish",
+    "Coldplay", "Bad Bunny", "Queen", "Dua Lipa", "Kendrick Lamar", "Shakira",
+]
+TITLE_WORDS = [
+    "love", "night", "summer", "heart", "fire", "dream", "city", "rain", "gold", "dance",
+    "blue", "home", "wild", "light", "river", "shadow", "sky", "forever", "young", "road",
+]
+CATALOG_COLUMNS = [
+    "track_id", "track_name", "track_artist", "track_popularity", "playlist_genre",
+    "mode_category", "tempo_category", "valence", "energy", "danceability", "acousticness", "tempo",
+]
+ID_CHARS = np.frombuffer(b"0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ", dtype=np.uint8)
+
+
+def generate_catalog(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    n_artists = max(len(KNOWN_ARTISTS), rows // 25)
+    artists = np.array(KNOWN_ARTISTS + [f"Artist {i}" for i in range(n_artists - len(KNOWN_ARTISTS))])
+    # Long tail: a few artists have many tracks, most have a handful
+    weights = 1.0 / np.arange(1, n_artists + 1) ** 0.8
+    artist = artists[rng.choice(n_artists, rows, p=weights / weights.sum())]
+
+    words = np.array(TITLE_WORDS)
+    titles = np.char.add(np.char.add(words[rng.integers(0, len(words), rows)], " "), words[rng.integers(0, len(words), rows)])
+    titles = np.char.add(np.char.add(titles, " "), rng.integers(1, 500, rows).astype(str))
+    # 22-character base62 ids, the shape recommend_engine turns into Spotify links
+    track_id = ID_CHARS[rng.integers(0, len(ID_CHARS), (rows, 22))].view("S22").ravel().astype(str)
+
+    valence, energy, danceability, acousticness = rng.random((4, rows))
+    tempo = rng.normal(118, 28, rows).clip(50, 220).round(3)
+    mood = np.where(valence > 0.5, rng.choice(["Happy", "Energetic", "Romantic"], rows), rng.choice(["Sad", "Calm", "Melancholy"], rows))
+    mode_category = np.char.add(np.char.add(mood, " "), np.where(energy > 0.5, "Energetic", "Calm"))
+    tempo_category = np.where(tempo < 90, "Slow", np.where(tempo <= 120, "Medium", "Fast"))
+
+    df = pd.DataFrame({
+        "track_id": track_id,
+        "track_name": titles,
+        "track_artist": artist,
+        "track_popularity": rng.integers(0, 101, rows),
+        "playlist_genre": rng.choice(GENRES, rows),
+        "mode_category": mode_category,
+        "tempo_category": tempo_category,
+        "valence": valence.round(4),
+        "energy": energy.round(4),
+        "danceability": danceability.round(4),
+        "acousticness": acousticness.round(4),
+        "tempo": tempo,
+    })
+    return df[CATALOG_COLUMNS]
+
+
+def write_catalog(rows: int, path: str, seed: int = 0) -> str:
+    generate_catalog(rows, seed).to_csv(path, index=False)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic songs CSV")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_catalog(args.rows, args.out, args.seed)
+    print(f"[BENCH] Wrote {args.rows} rows to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+import hashlib
+import json
+import os
+import shutil
+from functools import cached_property
+
+import numpy as np
+
+from utils import convert_tempo_to_bpm
+from text_index import PhraseMatcher, TrigramIndex
+
+TEMPO_BUCKETS = ("slow", "medium", "fast")
+LABEL_COLUMNS = ("mood", "genre", "tempo")
+TRACK_COLUMNS = ("track_id", "track_name", "track_artist", "playlist_genre")
+CATALOG_FORMAT_VERSION = 3
+SONGS_CSV_PATH = "data/songs.csv"
+CATALOG_DIR = os.getenv("CATALOG_DIR", "data/catalog")
+FEATURES = ['valence', 'energy', 'danceability', 'acousticness', 'tempo']
+CONTAINS_CACHE_SIZE = 1024
+
+
+# Strings packed into one UTF-8 buffer plus offsets, so a column of text can live in a
+# memory-mapped file. Missing values (NaN/None in the CSV) come back as None.
+class StringTable:
+    def __init__(self, data: np.ndarray, offsets: np.ndarray, present: np.ndarray = None):
+        self.data = data
+        self.offsets = offsets
+        self.present = present
+
+    @classmethod
+    def from_values(cls, values):
+        encoded, present = [], []
+        for value in values:
+            missing = value is None or (isinstance(value, float) and value != value)
+            present.append(not missing)
+            encoded.append(b"" if missing else str(value).encode("utf-8"))
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8).copy()
+        present = np.array(present, dtype=bool)
+        return cls(data, offsets, None if present.all() else present)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _get(self, i: int):
+        if self.present is not None and not self.present[i]:
+            return None
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            return self._get(int(i))
+        return np.array([self._get(int(j)) for j in np.arange(len(self))[i]], dtype=object)
+
+    def tolist(self) -> list:
+        return [self._get(i) for i in range(len(self))]
+
+    def to_arrays(self, prefix: str) -> dict:
+        arrays = {f"{prefix}.data": self.data, f"{prefix}.offsets": self.offsets}
+        if self.present is not None:
+            arrays[f"{prefix}.present"] = self.present
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, prefix: str):
+        return cls(arrays[f"{prefix}.data"], arrays[f"{prefix}.offsets"], arrays.get(f"{prefix}.present"))
+
+
+def bucket_arrays(label_codes: dict, score_popularity: np.ndarray) -> dict:
+    # Rows grouped by their (genre, mood, tempo) scorer labels; the mood label is the full
+    # mode_category, so it already carries the energy half. Every row in a bucket gets the same
+    # label-based part of weighted_scores, which is what lets the ranker bound whole buckets.
+    codes = [label_codes[column].astype(np.int64) for column in ("genre", "mood", "tempo")]
+    sizes = [int(c.max()) + 1 if len(c) else 1 for c in codes]
+    combined = (codes[0] * sizes[1] + codes[1]) * sizes[2] + codes[2]
+    keys, bucket_of_row = np.unique(combined, return_inverse=True)
+    rows = np.argsort(bucket_of_row, kind="stable").astype(np.int32)
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(bucket_of_row, minlength=len(keys)), out=offsets[1:])
+    max_popularity = np.maximum.reduceat(score_popularity[rows], offsets[:-1]) if len(rows) else np.zeros(0)
+    return {
+        "buckets.rows": rows,
+        "buckets.offsets": offsets,
+        "buckets.max_popularity": max_popularity.astype(np.float64),
+    }
+
+
+# Columnar view of the catalog. Everything lives in flat numpy arrays (see catalog_build for how
+# they are derived from the CSV), so the same index can be built in memory or memory-mapped
+# from a prebuilt artifact shared by every worker. Filters return boolean masks over row positions.
+class CatalogIndex:
+
+    def __init__(self, arrays: dict, flag_words: dict = None, manifest: dict = None):
+        self.arrays = arrays
+        self.manifest = manifest or {}
+        self._contains_cache = {}
+        self.features = arrays["features"]
+        self.size = len(self.features)
+        self.unit_features = arrays["unit_features"]
+        self.tempo_raw = arrays["tempo_raw"]
+
+        self.track_id, self.track_name, self.track_artist, self.playlist_genre = (
+            StringTable.from_arrays(arrays, name) for name in TRACK_COLUMNS
+        )
+
+        self.genre_codes = arrays["genre_codes"]
+        self.genre_labels = StringTable.from_arrays(arrays, "genre_labels").tolist()
+        self.artist_codes = arrays["artist_codes"]
+        self.artist_labels = StringTable.from_arrays(arrays, "artist_labels").tolist()
+        self.tempo_codes = arrays["tempo_codes"]
+        self.name_codes = arrays["name_codes"]
+        self.name_labels = StringTable.from_arrays(arrays, "name_labels")
+        # Same code for every row of the same title and artist
+        self.track_codes = arrays["track_codes"]
+
+        # Labels the scorer matches against, one code per row
+        self.label_codes = {column: arrays[f"label_codes.{column}"] for column in LABEL_COLUMNS}
+        self.labels = {column: StringTable.from_arrays(arrays, f"labels.{column}").tolist() for column in LABEL_COLUMNS}
+        # Per-row class flags, e.g. {"mood_sad": ("mood", SAD_MOODS)} -> rows whose mood label contains any of the words
+        self.flags = {
+            name: self.label_flag(column, words) for name, (column, words) in (flag_words or {}).items()
+        }
+        self.score_popularity = arrays["score_popularity"]
+        self.popularity_order = arrays["popularity_order"]
+        # Rows returned when a fuzzy artist/title lookup finds nothing
+        self.fallback_rows = arrays["fallback_rows"]
+
+        # Candidate buckets: rows of bucket b are bucket_rows[bucket_offsets[b]:bucket_offsets[b + 1]]
+        self.bucket_rows = arrays["buckets.rows"]
+        self.bucket_offsets = arrays["buckets.offsets"]
+        self.bucket_max_popularity = arrays["buckets.max_popularity"]
+        self.bucket_count = len(self.bucket_offsets) - 1
+
+        # Fuzzy search over distinct artists and titles; ids in each index are label codes
+        self.artist_search = self._trigram_index("artist_search", self.artist_labels)
+        self.title_search = self._trigram_index("title_search", self.name_labels)
+
+    def _trigram_index(self, prefix: str, strings) -> TrigramIndex:
+        a = self.arrays
+        return TrigramIndex.from_arrays(
+            strings, StringTable.from_arrays(a, f"{prefix}.grams").tolist(), a[f"{prefix}.offsets"],
+            a[f"{prefix}.ids"], a[f"{prefix}.counts"], a[f"{prefix}.lengths"],
+        )
+
+    # Lookups and the artist automaton are pure Python structures; build them on first use
+    @cached_property
+    def _genre_lookup(self) -> dict:
+        return {label: i for i, label in enumerate(self.genre_labels)}
+
+    @cached_property
+    def _artist_lookup(self) -> dict:
+        return {label: i for i, label in enumerate(self.artist_labels)}
+
+    @cached_property
+    def _name_lookup(self) -> dict:
+        return {label: i for i, label in enumerate(self.name_labels.tolist())}
+
+    @cached_property
+    def artist_names(self) -> list:
+        # Distinct artist names in catalog order, original casing
+        return StringTable.from_arrays(self.arrays, "artist_names").tolist()
+
+    @cached_property
+    def artist_matcher(self) -> PhraseMatcher:
+        # Finds any catalog artist mentioned in free text
+        return PhraseMatcher((str(name).lower(), name) for name in self.artist_names)
+
+    def warm(self):
+        # Build the lazy structures up front, e.g. in a background thread at startup
+        for name in ("artist_matcher", "_genre_lookup", "_artist_lookup", "_name_lookup", "bucket_of_row"):
+            getattr(self, name)
+        for search in (self.artist_search, self.title_search):
+            search.char_counts
+
+    @property
+    def version(self) -> str:
+        # Names the catalog content; an artifact built from the same CSV lives in root/<version>
+        sha = self.manifest.get("source", {}).get("sha256", "nosource")
+        return f"v{CATALOG_FORMAT_VERSION}-{sha[:12]}"
+
+    @cached_property
+    def row_keys(self) -> list:
+        # What identifies a row across rebuilds: its track columns plus how many earlier rows
+        # share them, since the same track can be listed once per playlist
+        seen = {}
+        keys = []
+        columns = (self.track_id, self.track_name, self.track_artist, self.playlist_genre)
+        for key in zip(*(table.tolist() for table in columns)):
+            n = seen.get(key, 0)
+            seen[key] = n + 1
+            keys.append(key + (n,))
+        return keys
+
+    @cached_property
+    def row_lookup(self) -> dict:
+        return {key: row for row, key in enumerate(self.row_keys)}
+
+    def select_all(self) -> np.ndarray:
+        return np.ones(self.size, dtype=bool)
+
+    def rows_mask(self, positions) -> np.ndarray:
+        mask = np.zeros(self.size, dtype=bool)
+        mask[positions] = True
+        return mask
+
+    def bucket(self, b: int) -> np.ndarray:
+        return self.bucket_rows[self.bucket_offsets[b]:self.bucket_offsets[b + 1]]
+
+    @cached_property
+    def bucket_of_row(self) -> np.ndarray:
+        of_row = np.empty(self.size, dtype=np.int32)
+        of_row[self.bucket_rows] = np.repeat(np.arange(self.bucket_count, dtype=np.int32), np.diff(self.bucket_offsets))
+        return of_row
+
+    @cached_property
+    def rows_by_bucket_popularity(self) -> np.ndarray:
+        # Row positions grouped by bucket like bucket_rows, most popular first within each bucket
+        return np.lexsort((-self.score_popularity, self.bucket_of_row)).astype(np.int32)
+
+    def bucket_leaders(self, n: int) -> np.ndarray:
+        # The n most popular rows of every bucket
+        rows = self.rows_by_bucket_popularity
+        rank = np.arange(len(rows)) - self.bucket_offsets[self.bucket_of_row[rows]]
+        return rows[rank < n]
+
+    def bucket_representatives(self) -> np.ndarray:
+        # First row of every bucket; all rows of a bucket share its labels
+        return self.bucket_rows[self.bucket_offsets[:-1]]
+
+    def genre_code(self, genre: str):
+        # None when no row has this genre
+        return self._genre_lookup.get(genre.lower())
+
+    def genre_mask(self, genre: str, positions: np.ndarray = None) -> np.ndarray:
+        # Over the whole catalog, or just over positions when given
+        codes = self.genre_codes if positions is None else self.genre_codes[positions]
+        code = self.genre_code(genre)
+        if code is None:
+            return np.zeros(len(codes), dtype=bool)
+        return codes == code
+
+    def tempo_mask(self, tempo: str, positions: np.ndarray = None) -> np.ndarray:
+        tempo = tempo.lower()
+        if tempo in TEMPO_BUCKETS:
+            codes = self.tempo_codes if positions is None else self.tempo_codes[positions]
+            return codes == TEMPO_BUCKETS.index(tempo)
+        low, high = convert_tempo_to_bpm(tempo)
+        bpm = self.tempo_raw if positions is None else self.tempo_raw[positions]
+        return (bpm >= low) & (bpm <= high)
+
+    def artist_mask(self, artist: str) -> np.ndarray:
+        code = self._artist_lookup.get(artist.lower())
+        if code is None:
+            return np.zeros(self.size, dtype=bool)
+        return self.artist_codes == code
+
+    def name_mask(self, name: str) -> np.ndarray:
+        code = self._name_lookup.get(name.lower())
+        if code is None:
+            return np.zeros(self.size, dtype=bool)
+        return self.name_codes == code
+
+    def artist_lower(self, position: int) -> str:
+        code = self.artist_codes[position]
+        return self.artist_labels[code] if code >= 0 else ""
+
+    def match_artist_song(self, query, cutoff: float = 0.6) -> np.ndarray:
+        # Exact artist/title first, then the fuzzy artist and title search, then the top rows
+        if not isinstance(query, str):
+            print(f"[CATALOG] Invalid query type for match_artist_song: {type(query)}")
+            return self.rows_mask(np.arange(min(5, self.size)))
+        query = query.lower().strip()
+        if not query:
+            return self.rows_mask(np.arange(min(5, self.size)))
+        strict = self.artist_mask(query) | self.name_mask(query)
+        if strict.any():
+            return strict
+        artist_matches = self.artist_search.search(query, n=5, cutoff=cutoff)
+        if artist_matches:
+            return np.isin(self.artist_codes, artist_matches)
+        song_matches = self.title_search.search(query, n=5, cutoff=cutoff)
+        if song_matches:
+            return np.isin(self.name_codes, song_matches)
+        return self.rows_mask(self.fallback_rows)
+
+    def label_flag(self, column: str, words) -> np.ndarray:
+        per_label = np.array([any(w in label for w in words) for label in self.labels[column]], dtype=bool)
+        return per_label[self.label_codes[column]]
+
+    def _contains_table(self, column: str, text: str) -> np.ndarray:
+        # Per-label "text in label" flags, remembered so scoring a request in batches builds them once
+        key = (column, text)
+        table = self._contains_cache.get(key)
+        if table is None:
+            if column in ("artist", "name"):
+                search = self.artist_search if column == "artist" else self.title_search
+                # One spare False at the end, which is what artist code -1 (no artist) indexes
+                table = np.zeros(len(search.strings) + 1, dtype=bool)
+                table[search.containing(text)] = True
+            else:
+                table = np.array([text in label for label in self.labels[column]], dtype=bool)
+            if len(self._contains_cache) >= CONTAINS_CACHE_SIZE:
+                self._contains_cache.clear()
+            self._contains_cache[key] = table
+        return table
+
+    def label_contains(self, column: str, text: str, positions: np.ndarray) -> np.ndarray:
+        return self._contains_table(column, text)[self.label_codes[column][positions]]
+
+    def artist_or_name_contains(self, text: str, positions: np.ndarray) -> np.ndarray:
+        in_artist = self._contains_table("artist", text)[self.artist_codes[positions]]
+        return in_artist | self._contains_table("name", text)[self.name_codes[positions]]
+
+    def similarity(self, mood_vec, positions: np.ndarray) -> np.ndarray:
+        query = np.asarray(mood_vec, dtype=np.float64)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return np.zeros(len(positions))
+        return self.unit_features[positions] @ (query / norm)
+
+    def save(self, path: str):
+        # One .npy per array plus manifest.json; written to a temp dir and renamed into place
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        for name, array in self.arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), np.asarray(array), allow_pickle=False)
+        manifest = dict(self.manifest, format_version=CATALOG_FORMAT_VERSION, rows=self.size, arrays=sorted(self.arrays))
+        with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def open(cls, path: str, flag_words: dict = None, mmap: bool = True):
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != CATALOG_FORMAT_VERSION:
+            raise ValueError(f"catalog format {manifest.get('format_version')} != {CATALOG_FORMAT_VERSION}")
+        arrays = {}
+        for name in manifest["arrays"]:
+            file = os.path.join(path, f"{name}.npy")
+            # Empty files can't be mapped
+            mode = "r" if mmap and os.path.getsize(file) > 128 else None
+            array = np.load(file, mmap_mode=mode, allow_pickle=False)
+            # Plain ndarray view over the same mapping, without memmap's per-slice bookkeeping
+            arrays[name] = array.view(np.ndarray) if mode else array
+        return cls(arrays, flag_words=flag_words, manifest=manifest)
+
+
+def file_fingerprint(path: str, with_hash: bool = True) -> dict:
+    stat = os.stat(path)
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_hash:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        fingerprint["sha256"] = digest.hexdigest()
+    return fingerprint
+
+
+def _source_matches(source: dict, path: str) -> bool:
+    if not source or not os.path.exists(path):
+        # Deployed without the CSV: the artifact is all there is
+        return True
+    if source.get("path") and os.path.abspath(source["path"]) != os.path.abspath(path):
+        # Built from another file on purpose (e.g. POST /catalog/reload); CURRENT is what counts
+        return True
+    quick = file_fingerprint(path, with_hash=False)
+    if quick["size"] != source.get("size"):
+        return False
+    if quick["mtime_ns"] == source.get("mtime_ns"):
+        return True
+    # Same size, new mtime (e.g. a fresh checkout): only the content hash can tell
+    return file_fingerprint(path)["sha256"] == source.get("sha256")
+
+
+def current_artifact_path(root: str):
+    try:
+        with open(os.path.join(root, "CURRENT")) as f:
+            return os.path.join(root, f.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+def load_catalog_artifact(root: str, features: list, flag_words: dict = None, source_path: str = None):
+    # Memory-map the artifact named by root/CURRENT; None if missing, stale or unreadable
+    path = current_artifact_path(root)
+    if path is None:
+        return None
+    try:
+        catalog = CatalogIndex.open(path, flag_words=flag_words)
+    except Exception as e:
+        print("[CATALOG] Failed to open catalog artifact:", e)
+        return None
+    if catalog.manifest.get("features") != list(features):
+        print("[CATALOG] Catalog artifact was built for different features; ignoring it")
+        return None
+    if source_path and not _source_matches(catalog.manifest.get("source"), source_path):
+        print(f"[CATALOG] {source_path} changed since the catalog artifact was built; ignoring it")
+        return None
+    return catalog
+
+
+def translate_rows(rows, source: CatalogIndex, target: CatalogIndex) -> list:
+    # Row ids of source -> the row ids of the same tracks in target, None where target lacks one
+    if source is target or source.version == target.version:
+        return [int(row) for row in rows]
+    keys, lookup = source.row_keys, target.row_lookup
+    return [lookup.get(keys[row]) if 0 <= row < source.size else None for row in rows]
@@ -0,0 +1,191 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+
+from utils import convert_tempo_to_bpm
+from catalog import (
+    CatalogIndex,
+    StringTable,
+    TEMPO_BUCKETS,
+    TRACK_COLUMNS,
+    LABEL_COLUMNS,
+    bucket_arrays,
+    CATALOG_FORMAT_VERSION,
+    CATALOG_DIR,
+    FEATURES,
+    SONGS_CSV_PATH,
+    file_fingerprint,
+)
+from text_index import TrigramIndex
+
+# CSV -> catalog arrays. Only this module needs pandas and sklearn; workers that find a prebuilt
+# artifact never import it. Build one with: python catalog_build.py [--csv data/songs.csv] [--out data/catalog]
+
+
+def _column(df: pd.DataFrame, name: str) -> pd.Series:
+    if name in df.columns:
+        return df[name]
+    return pd.Series([None] * len(df), index=df.index, dtype=object)
+
+
+def _lowered(series: pd.Series) -> np.ndarray:
+    return series.fillna("").astype(str).str.lower().to_numpy(dtype=object)
+
+
+def _encode(series: pd.Series):
+    # Lowercased labels -> (int32 codes, label list); missing values get -1
+    lowered = series.where(series.isna(), series.astype(str).str.lower())
+    codes, labels = pd.factorize(lowered, use_na_sentinel=True)
+    return codes.astype(np.int32), [str(label) for label in labels]
+
+
+def _normalized_codes(series: pd.Series):
+    # Stripped, lowercased labels as used by the scorer; missing values become ""
+    codes, labels = pd.factorize(series.fillna("").astype(str).str.strip().str.lower())
+    return codes.astype(np.int32), [str(label) for label in labels]
+
+
+def _tempo_bucket_codes(tempo_raw: np.ndarray) -> np.ndarray:
+    codes = np.full(len(tempo_raw), -1, dtype=np.int8)
+    for code, bucket in enumerate(TEMPO_BUCKETS):
+        low, high = convert_tempo_to_bpm(bucket)
+        codes[(tempo_raw >= low) & (tempo_raw <= high)] = code
+    return codes
+
+
+def _strings(arrays: dict, name: str, values):
+    arrays.update(StringTable.from_values(values).to_arrays(name))
+
+
+def _trigrams(arrays: dict, name: str, strings, counts):
+    index = TrigramIndex(strings, counts)
+    postings = index.to_arrays()
+    _strings(arrays, f"{name}.grams", postings.pop("grams"))
+    for key, value in postings.items():
+        arrays[f"{name}.{key}"] = value
+
+
+def load_songs_frame(csv_path: str, features: list):
+    # Parse and min-max scale the catalog CSV; returns the frame and the fitted scaler
+    try:
+        df = pd.read_csv(csv_path)
+    except Exception as e:
+        print("[RECOMMENDER] Failed to load CSV:", e)
+        df = pd.DataFrame(columns=features)
+
+    df["tempo_raw"] = pd.to_numeric(df.get("tempo", 100), errors="coerce")
+    df = df.dropna(subset=features)
+    df[features] = df[features].apply(pd.to_numeric, errors='coerce')
+    df = df.dropna(subset=features).reset_index(drop=True)
+    scaler = MinMaxScaler()
+    if len(df):
+        df[features] = scaler.fit_transform(df[features])
+    return df, scaler
+
+
+def catalog_arrays(df: pd.DataFrame, features: list) -> dict:
+    arrays = {}
+    size = len(df)
+    scaled = df[features].to_numpy(dtype=np.float64) if size else np.zeros((0, len(features)))
+    norms = np.linalg.norm(scaled, axis=1, keepdims=True)
+    arrays["features"] = scaled.astype(np.float32)
+    arrays["unit_features"] = np.divide(scaled, norms, out=np.zeros_like(scaled), where=norms > 0).astype(np.float32)
+    tempo_raw = pd.to_numeric(_column(df, "tempo_raw"), errors="coerce").to_numpy(dtype=np.float64)
+    arrays["tempo_raw"] = tempo_raw
+    arrays["tempo_codes"] = _tempo_bucket_codes(tempo_raw)
+
+    for name in TRACK_COLUMNS:
+        _strings(arrays, name, _column(df, name).tolist())
+
+    arrays["genre_codes"], genre_labels = _encode(_column(df, "playlist_genre"))
+    _strings(arrays, "genre_labels", genre_labels)
+    artist_codes, artist_labels = _encode(_column(df, "track_artist"))
+    arrays["artist_codes"] = artist_codes
+    _strings(arrays, "artist_labels", artist_labels)
+    _strings(arrays, "artist_names", _column(df, "track_artist").dropna().unique().tolist())
+
+    # One code per distinct (title, artist), numbered by first appearance. The CSV lists a track
+    # once per playlist it is in, so history excludes by this code rather than by row
+    arrays["track_codes"] = (
+        df.groupby([_column(df, "track_name"), _column(df, "track_artist")], dropna=False, sort=False)
+        .ngroup().to_numpy(dtype=np.int32) if size else np.zeros(0, dtype=np.int32)
+    )
+
+    name_codes, name_labels = pd.factorize(_lowered(_column(df, "track_name")))
+    arrays["name_codes"] = name_codes.astype(np.int32)
+    name_labels = [str(label) for label in name_labels]
+    _strings(arrays, "name_labels", name_labels)
+
+    mood = _column(df, "mode_category").fillna("").astype(str).str.strip()
+    if "mood" in df.columns:
+        mood = mood.where(mood != "", df["mood"])
+    for column, series in (("mood", mood), ("genre", _column(df, "playlist_genre")), ("tempo", _column(df, "tempo_category"))):
+        arrays[f"label_codes.{column}"], labels = _normalized_codes(series)
+        _strings(arrays, f"labels.{column}", labels)
+
+    popularity_column = "track_popularity" if "track_popularity" in df.columns else "popularity"
+    arrays["score_popularity"] = np.nan_to_num(
+        pd.to_numeric(_column(df, popularity_column), errors="coerce").to_numpy(dtype=np.float64) / 100.0
+    )
+    pop_column = "popularity" if "popularity" in df.columns else "track_popularity"
+    global_pop = pd.to_numeric(_column(df, pop_column), errors="coerce").to_numpy(dtype=np.float64)
+    popularity_order = np.argsort(np.where(np.isnan(global_pop), np.inf, -global_pop), kind="stable").astype(np.int64)
+    arrays["popularity_order"] = popularity_order
+    if "popularity" in df.columns:
+        arrays["fallback_rows"] = popularity_order[:min(5, int(np.count_nonzero(~np.isnan(global_pop))))]
+    else:
+        arrays["fallback_rows"] = np.arange(min(5, size), dtype=np.int64)
+
+    arrays.update(bucket_arrays({c: arrays[f"label_codes.{c}"] for c in LABEL_COLUMNS}, arrays["score_popularity"]))
+    _trigrams(arrays, "artist_search", artist_labels, np.bincount(artist_codes[artist_codes >= 0], minlength=len(artist_labels)))
+    _trigrams(arrays, "title_search", name_labels, np.bincount(arrays["name_codes"], minlength=len(name_labels)))
+    return arrays
+
+
+def build_catalog(csv_path: str, features: list, flag_words: dict = None) -> CatalogIndex:
+    # In-memory build, used when no prebuilt artifact is available
+    df, scaler = load_songs_frame(csv_path, features)
+    return CatalogIndex(catalog_arrays(df, features), flag_words=flag_words, manifest=_manifest(csv_path, features, scaler))
+
+
+def _manifest(csv_path: str, features: list, scaler) -> dict:
+    manifest = {
+        "format_version": CATALOG_FORMAT_VERSION,
+        "features": list(features),
+        "feature_min": getattr(scaler, "data_min_", np.array([])).tolist(),
+        "feature_max": getattr(scaler, "data_max_", np.array([])).tolist(),
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    if os.path.exists(csv_path):
+        manifest["source"] = dict(file_fingerprint(csv_path), path=csv_path)
+    return manifest
+
+
+def build_catalog_artifact(csv_path: str, root: str, features: list) -> str:
+    # Writes root/v<format>-<sha>/ and then points root/CURRENT at it, so running workers keep
+    # their mapping of the previous version until they poll CURRENT and swap in the new one
+    catalog = build_catalog(csv_path, features)
+    if not catalog.size:
+        raise ValueError(f"{csv_path} has no usable rows")
+    version = catalog.version
+    os.makedirs(root, exist_ok=True)
+    catalog.save(os.path.join(root, version))
+    tmp_pointer = os.path.join(root, f"CURRENT.{os.getpid()}.tmp")
+    with open(tmp_pointer, "w") as f:
+        f.write(version)
+    os.replace(tmp_pointer, os.path.join(root, "CURRENT"))
+    return os.path.join(root, version)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the memory-mappable catalog artifact")
+    parser.add_argument("--csv", default=SONGS_CSV_PATH)
+    parser.add_argument("--out", default=CATALOG_DIR)
+    args = parser.parse_args()
+    started = time.perf_counter()
+    path = build_catalog_artifact(args.csv, args.out, FEATURES)
+    print(f"[CATALOG] Built {path} in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,166 @@
+import html
+import zlib
+
+# Local stand-ins for the one-and-a-half sentence LLM blurb, grouped by the mood the user asked for
+MOOD_GROUPS = {
+    "sad": {"sad", "melancholy", "melancholic", "bittersweet", "moody", "dark", "gloomy", "blue"},
+    "happy": {"happy", "uplifting", "bright", "playful", "hopeful", "funky", "groovy", "tropical"},
+    "calm": {"calm", "relaxed", "relaxing", "chill", "chilled", "mellow", "peaceful", "dreamy", "smooth", "atmospheric"},
+    "energetic": {"energetic", "intense", "powerful", "epic", "fierce", "angry", "rebellious", "gritty"},
+    "romantic": {"romantic", "passionate", "sensual", "soulful", "nostalgic"},
+}
+
+TEMPLATES = {
+    "sad": [
+        "💙 For a {mood} moment, \"{song}\" by {artist} is {genre_phrase} that sits with you just right.",
+        "🎵 When you're feeling {mood}, let \"{song}\" by {artist} keep you company.",
+        "💙 Here's {genre_phrase} for a {mood} mood: \"{song}\" by {artist}.",
+    ],
+    "happy": [
+        "☀️ Keep the good vibes going with \"{song}\" by {artist}, {genre_phrase} made for a {mood} mood!",
+        "🎉 \"{song}\" by {artist} is a {mood} pick you'll love — turn it up!",
+        "😊 Here's {genre_phrase} to match your {mood} mood: \"{song}\" by {artist}.",
+    ],
+    "calm": [
+        "🌙 Unwind with \"{song}\" by {artist}, {genre_phrase} with a {mood} feel.",
+        "🍃 For something {mood}, try \"{song}\" by {artist} and just breathe.",
+        "🎧 \"{song}\" by {artist} is {genre_phrase} that keeps things nice and {mood}.",
+    ],
+    "energetic": [
+        "⚡ Crank up \"{song}\" by {artist} — {genre_phrase} with all the {mood} energy you asked for!",
+        "🔥 \"{song}\" by {artist} brings the {mood} vibes you're after.",
+        "💥 Here's {genre_phrase} to fuel a {mood} mood: \"{song}\" by {artist}.",
+    ],
+    "romantic": [
+        "💜 Set the mood with \"{song}\" by {artist}, {genre_phrase} with a {mood} touch.",
+        "🌹 For a {mood} moment, \"{song}\" by {artist} is just the one.",
+        "💜 Here's something {mood} for you: \"{song}\" by {artist}.",
+    ],
+    "default": [
+        "🎵 Here's a great pick for you: \"{song}\" by {artist}, {genre_phrase} at a {tempo} tempo.",
+        "🎧 Give \"{song}\" by {artist} a spin — {genre_phrase} I think you'll enjoy!",
+        "🎶 Try \"{song}\" by {artist}, {genre_phrase} that fits what you're after.",
+    ],
+}
+
+
+# Genre families, matched as substrings of the track's playlist genre
+GENRE_FAMILIES = {
+    "rock": ("rock", "metal", "punk", "grunge", "indie"),
+    "hip-hop": ("hip hop", "hip-hop", "rap", "trap", "r&b", "urban"),
+    "electronic": ("edm", "electro", "house", "techno", "trance", "dance", "dubstep"),
+    "latin": ("latin", "reggaeton", "salsa", "bachata", "tropical"),
+}
+
+# Banks for a (mood group, genre family) pair; pairs without one use the mood group's bank
+GENRE_TEMPLATES = {
+    ("sad", "rock"): [
+        "🎸 For a {mood} moment, \"{song}\" by {artist} has the guitars to match.",
+        "🖤 \"{song}\" by {artist} is {genre_phrase} that turns a {mood} mood up loud.",
+    ],
+    ("sad", "hip-hop"): [
+        "🎤 When it's feeling {mood}, \"{song}\" by {artist} says it for you.",
+        "💙 Here's {genre_phrase} with a {mood} heart: \"{song}\" by {artist}.",
+    ],
+    ("happy", "latin"): [
+        "💃 \"{song}\" by {artist} is {genre_phrase} made for dancing through a {mood} day!",
+        "☀️ Keep the {mood} rhythm going with \"{song}\" by {artist}.",
+    ],
+    ("happy", "electronic"): [
+        "🪩 \"{song}\" by {artist} is {genre_phrase} to light up a {mood} mood!",
+        "🎉 Hit play on \"{song}\" by {artist} and let the {mood} drop land.",
+    ],
+    ("calm", "electronic"): [
+        "🌌 Drift off with \"{song}\" by {artist}, {genre_phrase} with a {mood} pulse.",
+        "🎧 \"{song}\" by {artist} keeps the beat low and {mood}.",
+    ],
+    ("energetic", "rock"): [
+        "🤘 Turn \"{song}\" by {artist} all the way up — {genre_phrase} with real {mood} bite!",
+        "🎸 \"{song}\" by {artist} brings the riffs for a {mood} mood.",
+    ],
+    ("energetic", "hip-hop"): [
+        "🔥 \"{song}\" by {artist} hits hard — {genre_phrase} with all the {mood} energy you asked for!",
+        "🎤 Run it up with \"{song}\" by {artist}, bars for a {mood} mood.",
+    ],
+    ("energetic", "electronic"): [
+        "⚡ \"{song}\" by {artist} is {genre_phrase} built for a {mood} night — wait for the drop!",
+        "🪩 Crank up \"{song}\" by {artist} and keep the {mood} energy pumping.",
+    ],
+    ("romantic", "hip-hop"): [
+        "💜 Slow it down with \"{song}\" by {artist}, {genre_phrase} with a {mood} groove.",
+        "🌹 \"{song}\" by {artist} sets a {mood} mood just right.",
+    ],
+    ("romantic", "latin"): [
+        "🌹 \"{song}\" by {artist} is {genre_phrase} for a {mood} night.",
+        "💃 Dance close to \"{song}\" by {artist} — something {mood} for you.",
+    ],
+    ("default", "rock"): [
+        "🎸 Give \"{song}\" by {artist} a spin — {genre_phrase} at a {tempo} tempo.",
+        "🤘 Try \"{song}\" by {artist}, {genre_phrase} I think you'll dig!",
+    ],
+    ("default", "hip-hop"): [
+        "🎤 Here's \"{song}\" by {artist}, {genre_phrase} at a {tempo} tempo.",
+        "🎧 Run \"{song}\" by {artist} — {genre_phrase} I think you'll enjoy!",
+    ],
+    ("default", "electronic"): [
+        "🪩 Try \"{song}\" by {artist}, {genre_phrase} at a {tempo} tempo.",
+        "🎧 \"{song}\" by {artist} is {genre_phrase} worth turning up!",
+    ],
+    ("default", "latin"): [
+        "💃 Here's \"{song}\" by {artist}, {genre_phrase} at a {tempo} tempo.",
+        "🎶 Give \"{song}\" by {artist} a spin — {genre_phrase} with a great rhythm!",
+    ],
+}
+
+
+def mood_group(mood) -> str:
+    mood = (mood or "").strip().lower()
+    for group, moods in MOOD_GROUPS.items():
+        if mood in moods:
+            return group
+    return "default"
+
+
+def genre_family(genre):
+    genre = (genre or "").strip().lower()
+    for family, keywords in GENRE_FAMILIES.items():
+        if any(keyword in genre for keyword in keywords):
+            return family
+    return None
+
+
+def render_chat_template(song: str, artist: str, mood=None, genre=None, tempo=None) -> str:
+    group = mood_group(mood)
+    templates = GENRE_TEMPLATES.get((group, genre_family(genre))) or TEMPLATES[group]
+    # Same track always gets the same wording; different tracks rotate through the bank
+    template = templates[zlib.crc32(f"{song}|{artist}".encode("utf-8")) % len(templates)]
+    genre = (genre or "").strip()
+    genre_phrase = f"a {html.escape(genre)} track" if genre and genre.lower() not in ("any", "unknown", "n/a") else "a track"
+    return template.format(
+        song=html.escape(str(song)),
+        artist=html.escape(str(artist)),
+        mood=html.escape((mood or "great").strip().lower()),
+        genre_phrase=genre_phrase,
+        tempo=html.escape((tempo or "easy").strip().lower()),
+    )
+
+
+# Opening line for a several-song reply; the songs follow as a list
+SET_TEMPLATES = {
+    "sad": "💙 Here are {count} songs to sit with a {mood} mood:",
+    "happy": "☀️ Here are {count} picks to keep the {mood} vibes going:",
+    "calm": "🌙 Here are {count} {mood} tracks to unwind with:",
+    "energetic": "⚡ Here are {count} tracks with all the {mood} energy you asked for:",
+    "romantic": "💜 Here are {count} songs for a {mood} moment:",
+    "default": "🎶 Here are {count} {genre_phrase} I think you'll enjoy:",
+}
+
+
+def render_set_template(count: int, mood=None, genre=None) -> str:
+    genre = (genre or "").strip()
+    genre_phrase = f"{html.escape(genre)} tracks" if genre and genre.lower() not in ("any", "unknown", "n/a") else "tracks"
+    return SET_TEMPLATES[mood_group(mood)].format(
+        count=count,
+        mood=html.escape((mood or "great").strip().lower()),
+        genre_phrase=genre_phrase,
+    )
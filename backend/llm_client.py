@@ -0,0 +1,208 @@
+import asyncio
+import json
+import os
+import random
+
+import httpx
+
+from metrics import METRICS, timed
+
+OPENAI_API_URL = os.getenv("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
+OPENAI_MODEL = "gpt-4o"
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+BACKOFF_BASE_SECONDS = 0.25
+BACKOFF_MAX_SECONDS = 4.0
+
+
+class LLMError(Exception):
+    pass
+
+
+class _Retryable(Exception):
+    pass
+
+
+# One keep-alive connection pool shared by every chat-completions call in the process.
+# Each call gets an overall deadline (covering retries), retries transient failures with
+# jittered exponential backoff, and waits on a semaphore so at most max_concurrency
+# requests are in flight upstream at once.
+class LLMClient:
+    def __init__(
+        self,
+        api_url: str = OPENAI_API_URL,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        max_retries: int = LLM_MAX_RETRIES,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+    ):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.calls = 0
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+
+    async def _ensure_client(self):
+        # The pool belongs to the event loop that created it; rebuild if we're on a new one
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            if self._client is not None:
+                await self._close_stale(self._client)
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client
+
+    @staticmethod
+    async def _close_stale(client):
+        # Its connections were opened on the old loop, which may already be closed
+        try:
+            await client.aclose()
+        except Exception as e:
+            print("[LLM] Failed to close the previous connection pool:", e)
+
+    @staticmethod
+    def _failed(message: str, error: Exception) -> LLMError:
+        METRICS.count("llm_failures")
+        return LLMError(f"{message}: {error}")
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+    @staticmethod
+    def _headers(api_key: str) -> dict:
+        return {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+
+    @timed("llm")
+    async def complete(
+        self,
+        messages: list,
+        api_key: str,
+        model: str = OPENAI_MODEL,
+        temperature: float = 0.7,
+        max_tokens: int = 200,
+        timeout: float = None,
+    ) -> str:
+        client = await self._ensure_client()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        headers = self._headers(api_key)
+        body = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                async with self._semaphore:
+                    self.calls += 1
+                    response = await asyncio.wait_for(
+                        client.post(self.api_url, headers=headers, json=body, timeout=remaining), remaining
+                    )
+                if response.status_code in RETRY_STATUS_CODES:
+                    raise _Retryable(f"HTTP {response.status_code}")
+                response.raise_for_status()
+                return response.json()["choices"][0]["message"]["content"].strip()
+            except (_Retryable, httpx.TransportError, asyncio.TimeoutError) as e:
+                last_error = e
+            except httpx.HTTPStatusError as e:
+                raise self._failed("LLM call rejected", e) from e
+            except (ValueError, LookupError, TypeError, AttributeError) as e:
+                raise self._failed("LLM response unreadable", e) from e
+            if attempt < self.max_retries:
+                METRICS.count("llm_retries")
+                await asyncio.sleep(min(self._backoff(attempt), max(0.0, deadline - loop.time())))
+        METRICS.count("llm_failures")
+        raise LLMError(f"LLM call failed after {attempt + 1} attempt(s): {last_error or 'deadline exceeded'}")
+
+    @timed("llm")
+    async def stream(
+        self,
+        messages: list,
+        api_key: str,
+        model: str = OPENAI_MODEL,
+        temperature: float = 0.7,
+        max_tokens: int = 200,
+        timeout: float = None,
+    ):
+        # Yields content deltas as they arrive. Transient failures are retried only until the
+        # first delta has been yielded; after that a failure surfaces as LLMError to the caller.
+        client = await self._ensure_client()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        body = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            started = False
+            try:
+                async with self._semaphore:
+                    self.calls += 1
+                    async with client.stream(
+                        "POST", self.api_url, headers=self._headers(api_key), json=body, timeout=remaining
+                    ) as response:
+                        if response.status_code in RETRY_STATUS_CODES:
+                            raise _Retryable(f"HTTP {response.status_code}")
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[5:].strip()
+                            if data == "[DONE]":
+                                return
+                            choices = json.loads(data).get("choices") or [{}]
+                            delta = (choices[0].get("delta") or {}).get("content")
+                            if delta:
+                                started = True
+                                yield delta
+                        return
+            except (_Retryable, httpx.TransportError) as e:
+                if started:
+                    raise self._failed("LLM stream interrupted", e) from e
+                last_error = e
+            except httpx.HTTPStatusError as e:
+                raise self._failed("LLM stream rejected", e) from e
+            except (ValueError, LookupError, TypeError, AttributeError) as e:
+                raise self._failed("LLM stream unreadable", e) from e
+            if attempt < self.max_retries:
+                METRICS.count("llm_retries")
+                await asyncio.sleep(min(self._backoff(attempt), max(0.0, deadline - loop.time())))
+        METRICS.count("llm_failures")
+        raise LLMError(f"LLM stream failed after {attempt + 1} attempt(s): {last_error or 'deadline exceeded'}")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+llm = LLMClient()
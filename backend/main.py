@@ -1,19 +1,56 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import os
 from dotenv import load_dotenv
-from typing import Optional
+from typing import List, Optional
+from contextlib import asynccontextmanager
+import asyncio
 import logging
 
-from recommender_eng import recommend_engine
-from memory import SessionMemory
-from utils import generate_chat_response, extract_preferences_from_message, next_ai_message
+from recommender_eng import (
+    recommend_engine,
+    recommend_candidates,
+    candidate_song,
+    fallback_song,
+    recommend_batch,
+    current_catalog,
+    pinned_catalog,
+    reload_catalog,
+    reload_if_current_changed,
+    translate_row_ids,
+    unseen_rows,
+)
+from memory import InstrumentedSessionStore, create_session_store
+from metrics import METRICS, MetricsMiddleware, detach
+from streaming import ChatReply, once
+from utils import (
+    generate_chat_response,
+    stream_chat_response,
+    stream_set_chat_response,
+    extract_preferences_from_message,
+    stream_next_ai_message,
+    prewarm_mood_vectors,
+    get_mood_vector,
+    EXTRACTION_CACHE,
+    CHAT_BLURB_CACHE,
+    MOOD_VECTORS,
+)
+from llm_client import llm
 
 # Load OpenAI key
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+PREWARM_MOOD_VECTORS = os.getenv("PREWARM_MOOD_VECTORS", "1") == "1"
+BATCH_MAX_SETS = int(os.getenv("BATCH_MAX_SETS", "1000"))
+BATCH_MAX_K = 50
+RECOMMEND_MAX_COUNT = 10
+# Seconds between checks of the catalog artifact pointer (0 turns polling off), and the token
+# POST /catalog/reload requires (unset turns the endpoint off)
+CATALOG_POLL_SECONDS = float(os.getenv("CATALOG_POLL_SECONDS", "30"))
+CATALOG_ADMIN_TOKEN = os.getenv("CATALOG_ADMIN_TOKEN")
 
 BUTTONS_HTML = """
 <br>
@@ -26,9 +63,57 @@ BUTTONS_HTML = """
   <button onclick="window.handleBotReply('change tempo')">Change tempo</button>
 </div>
 """
-
-app = FastAPI()
-memory = SessionMemory()
+FEEDBACK_HTML = f"<br>Are you happy with this recommendation?{BUTTONS_HTML}"
+
+@asynccontextmanager
+async def lifespan(app):
+    # Fill the on-disk mood vector store in the background so no request waits on a cold mood
+    prewarm = None
+    if PREWARM_MOOD_VECTORS and OPENAI_API_KEY:
+        prewarm = asyncio.create_task(prewarm_mood_vectors(OPENAI_API_KEY))
+    # The catalog is memory-mapped lazily; build its Python-side lookups off the event loop
+    warm_catalog = asyncio.create_task(asyncio.to_thread(current_catalog().warm))
+    watcher = asyncio.create_task(watch_catalog()) if CATALOG_POLL_SECONDS > 0 else None
+    yield
+    await warm_catalog
+    if watcher is not None:
+        watcher.cancel()
+    if prewarm is not None:
+        prewarm.cancel()
+    await llm.aclose()
+
+async def watch_catalog():
+    # Picks up an artifact that another worker's reload (or catalog_build.py) pointed CURRENT at
+    while True:
+        await asyncio.sleep(CATALOG_POLL_SECONDS)
+        try:
+            await asyncio.to_thread(reload_if_current_changed)
+        except Exception as e:
+            print("[CATALOG] Failed to load the new catalog artifact:", e)
+
+# Pins each request to the catalog snapshot current when it arrived, so a reload that lands
+# midway never mixes row ids from two catalogs (prefetch tasks started by it inherit the pin)
+class CatalogSnapshotMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with pinned_catalog():
+            await self.app(scope, receive, send)
+
+app = FastAPI(lifespan=lifespan)
+memory = InstrumentedSessionStore(create_session_store())
+
+async def run_store(method, *args):
+    # Session store calls from the async handlers. A backend that can block (SQLite waiting out
+    # another worker's write lock) runs in the threadpool so one slow lock doesn't stall every
+    # request in this worker; the in-memory store is only ever held briefly and runs inline.
+    if memory.blocking:
+        return await run_in_threadpool(method, *args)
+    return method(*args)
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,7 +121,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(CatalogSnapshotMiddleware)
 
 logging.basicConfig(level=logging.INFO)
 
@@ -46,11 +134,29 @@ class PreferenceInput(BaseModel):
     mood: Optional[str] = None
     tempo: Optional[str] = None
     artist_or_song: Optional[str] = None
+    # Several songs at once, picked for variety, with one combined message
+    count: Optional[int] = None
 
 class CommandInput(BaseModel):
     session_id: str
     command: str
 
+class BatchPreferences(BaseModel):
+    # A missing preference means "no preference"; history holds catalog row ids to skip
+    genre: Optional[str] = None
+    mood: Optional[str] = None
+    tempo: Optional[str] = None
+    artist_or_song: Optional[str] = None
+    history: List[int] = []
+
+class BatchRecommendInput(BaseModel):
+    preferences: List[BatchPreferences]
+    k: int = 5
+
+class CatalogReloadInput(BaseModel):
+    # A new or appended songs CSV; omitted, the current artifact or default CSV is re-read
+    csv_path: Optional[str] = None
+
 def has_all_preferences(session):
     required = ["genre", "mood", "tempo", "artist_or_song"]
     for key in required:
@@ -58,20 +164,154 @@ def has_all_preferences(session):
             return False
     return True
 
-def get_valid_recommendation(session):
-    attempts = 0
-    max_attempts = 20
-    last_songs = set(session.get("history", []))
-    while attempts < max_attempts:
-        song = recommend_engine(session, api_key=OPENAI_API_KEY)
-        if not song or song.get('song') == "N/A":
-            attempts += 1
-            continue
-        spotify_url = song.get("spotify_url")
-        # Always accept top song; embed if Spotify link, else return anyway
-        return song
-    # As absolute fallback, recommend most popular global song (from recommend_engine fallback)
-    return recommend_engine({k: None for k in ["genre","mood","tempo","artist_or_song"]}, api_key=OPENAI_API_KEY)
+PREFERENCE_FIELDS = ["genre", "mood", "tempo", "artist_or_song"]
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+_PREFETCH_TASKS = {}
+
+def preference_signature(session):
+    # Everything that shapes the ranking, including the catalog version its row ids belong to;
+    # candidates and prefetched blurbs are only valid for it
+    return (
+        [session.get(k) for k in PREFERENCE_FIELDS]
+        + [bool(session.get(f"no_pref_{k}")) for k in PREFERENCE_FIELDS]
+        + [session.get("catalog_version")]
+    )
+
+def _translate_session(session_id, index):
+    with memory.edit(session_id) as state:
+        version = state.get("catalog_version")
+        if version == index.version:
+            return
+        last_row_id = state.get("last_row_id")
+        rows = list(state["history"]) + ([last_row_id] if last_row_id is not None else [])
+        translated = translate_row_ids(rows, version, index) if version and rows else None
+        # An unknown version leaves the ids as they are, which is right when the CSV was only
+        # appended to: rows keep their positions
+        if translated is not None:
+            if last_row_id is not None:
+                state["last_row_id"] = translated.pop()
+            state["history"] = [row for row in translated if row is not None]
+        state["catalog_version"] = index.version
+
+async def get_catalog_session(session_id):
+    # Sessions store row ids of the catalog version they were last served from. After a reload
+    # they are translated to this request's snapshot by track; the new version in the signature
+    # drops the old cursor and prefetched song.
+    session = await run_store(memory.get_session, session_id)
+    index = current_catalog()
+    if session.get("catalog_version") == index.version:
+        return session
+    await run_in_threadpool(_translate_session, session_id, index)
+    return await run_store(memory.get_session, session_id)
+
+def _next_unseen(cursor, history):
+    # Index of the first candidate at or after the cursor whose track isn't in history, or None
+    rows, start = cursor["rows"], cursor["next"]
+    if start >= len(rows):
+        return None
+    fresh = unseen_rows(rows[start:], history)
+    return start + int(fresh.argmax()) if fresh.any() else None
+
+async def get_valid_recommendation(session_id, session, advance=True):
+    # Each session keeps a cursor over the ranked candidates for its preferences, so ranking
+    # runs once per preference set and every later "no"/"another" only moves the cursor. When
+    # the list runs out it is ranked again without everything it already offered (the next
+    # CANDIDATE_DEPTH rows, with tempo/genre filters relaxed as needed); when that is empty too
+    # the answer is the most popular song not yet offered. advance=False peeks at the next song.
+    if not has_all_preferences(session):
+        return None
+    signature = preference_signature(session)
+    history = set(session.get("history") or ())
+    cursor = session.get("candidates")
+    if not cursor or cursor["signature"] != signature:
+        cursor = {"signature": signature, "rows": [], "next": 0}
+    i = _next_unseen(cursor, history)
+    changed = advance
+    if i is None:
+        # The only network hop is the mood vector; ranking is CPU work, kept off the event loop
+        mood_vector = await get_mood_vector(session["mood"], OPENAI_API_KEY) if session.get("mood") else None
+        exclude = history | set(cursor["rows"])
+        rows = await run_in_threadpool(recommend_candidates, session, exclude, mood_vector)
+        cursor = {"signature": signature, "rows": rows, "next": 0}
+        i = _next_unseen(cursor, history)
+        changed = True
+        if i is None:
+            song = await run_in_threadpool(fallback_song, session, exclude)
+    if i is not None:
+        song = candidate_song(cursor["rows"][i], session)
+        if advance:
+            cursor["next"] = i + 1
+    if changed:
+        await run_store(_save_cursor, session_id, signature, cursor)
+    return song
+
+def _save_cursor(session_id, signature, cursor):
+    with memory.edit(session_id) as current:
+        if preference_signature(current) == signature:
+            current["candidates"] = cursor
+
+async def get_song_set(session_id, session, count):
+    # Diverse top-N in one ranking pass; every song goes into history so "no" moves past them
+    mood_vector = await get_mood_vector(session["mood"], OPENAI_API_KEY) if session.get("mood") else None
+    songs = await run_in_threadpool(recommend_engine, session, OPENAI_API_KEY, mood_vector, count)
+    # Newest last_song is the set's top pick
+    for song in reversed(songs or []):
+        await run_store(memory.update_last_song, session_id, song['song'], song['artist'], song.get('row_id'))
+    return songs or []
+
+async def _prefetch_next(session_id):
+    # With the cursor the next song is cheap; what's worth doing early is its chat blurb
+    detach()
+    session = await run_store(memory.get_session, session_id)
+    signature = preference_signature(session)
+    try:
+        song = await get_valid_recommendation(session_id, session, advance=False)
+        if not song or song.get("song", "").lower() == "n/a":
+            return
+        message = await generate_chat_response(song, session, OPENAI_API_KEY)
+    except Exception as e:
+        print("[PREFETCH] Failed to prefetch next recommendation:", e)
+        return
+    await run_store(_save_prefetched, session_id, signature, song, message)
+
+def _save_prefetched(session_id, signature, song, message):
+    with memory.edit(session_id) as current:
+        if preference_signature(current) == signature:
+            current["prefetched"] = {"signature": signature, "song": song, "message": message}
+
+async def discard_prefetch(session_id):
+    task = _PREFETCH_TASKS.pop(session_id, None)
+    if task is not None:
+        task.cancel()
+    await run_store(memory.update_session, session_id, "prefetched", None)
+
+async def schedule_prefetch(session_id):
+    # Work out the next candidate and its blurb while the user reads the current one
+    await discard_prefetch(session_id)
+    if not PREFETCH_ENABLED:
+        return
+    task = asyncio.create_task(_prefetch_next(session_id))
+    _PREFETCH_TASKS[session_id] = task
+    task.add_done_callback(lambda t: _PREFETCH_TASKS.pop(session_id, None) if _PREFETCH_TASKS.get(session_id) is t else None)
+
+def take_prefetched(session_id):
+    # Claim and clear in one edit so two workers can't both serve the same prefetched blurb
+    with memory.edit(session_id) as session:
+        prefetched = session.get("prefetched")
+        session["prefetched"] = None
+    if not prefetched or prefetched["signature"] != preference_signature(session):
+        return None
+    return prefetched
+
+async def next_recommendation(session_id, session):
+    # Next song off the cursor, with its prefetched blurb when one was made for that song
+    song = await get_valid_recommendation(session_id, session)
+    if not song or song.get("song", "").lower() == "n/a":
+        return None, None
+    prefetched = await run_store(take_prefetched, session_id)
+    if prefetched is not None and prefetched["song"].get("row_id") == song.get("row_id"):
+        return song, once(prefetched["message"])
+    return song, stream_chat_response(song, session, OPENAI_API_KEY)
 
 NO_PREF_WORDS = {
     "no", "none", "no preference", "nothing", "any", "whatever", "anything",
@@ -82,9 +322,8 @@ def user_message_is_no_pref(user_msg):
     user_msg_lower = user_msg.strip().lower()
     return any(word in user_msg_lower for word in NO_PREF_WORDS)
 
-@app.post("/recommend")
-def recommend(preference: PreferenceInput):
-    session = memory.get_session(preference.session_id)
+async def recommend_turn(preference: PreferenceInput) -> ChatReply:
+    session = await get_catalog_session(preference.session_id)
     all_fields = ["genre", "mood", "tempo", "artist_or_song"]
 
     user_message = (
@@ -97,32 +336,40 @@ def recommend(preference: PreferenceInput):
 
     # Never block recommendations just because of "awaiting_feedback"
     # Instead, if user sends new preference text, treat as feedback + update
-    extracted = extract_preferences_from_message(user_message, OPENAI_API_KEY)
+    extracted = await extract_preferences_from_message(user_message, OPENAI_API_KEY, current_catalog().artist_matcher)
 
     # Update preferences
+    updates = {}
     for key in all_fields:
         if session.get(key) is None and not session.get(f"no_pref_{key}", False):
             val = extracted.get(key)
             if val:
-                memory.update_session(preference.session_id, key, val)
-                memory.update_session(preference.session_id, f"no_pref_{key}", False)
+                updates[key] = val
+                updates[f"no_pref_{key}"] = False
             elif user_message_is_no_pref(user_message):
-                memory.update_session(preference.session_id, f"no_pref_{key}", True)
+                updates[f"no_pref_{key}"] = True
+    if updates:
+        await run_store(memory.update_many, preference.session_id, updates)
 
-    session = memory.get_session(preference.session_id)
+    session = await run_store(memory.get_session, preference.session_id)
 
     # Only recommend after all preferences are present/skipped
+    if has_all_preferences(session) and (preference.count or 1) > 1:
+        songs = await get_song_set(preference.session_id, session, min(preference.count, RECOMMEND_MAX_COUNT))
+        if not songs:
+            return ChatReply("<span style='color:green'>I couldn’t find a perfect match. Want to try a different mood, artist, or genre?</span>")
+        await run_store(memory.update_many, preference.session_id, {"awaiting_feedback": True, "followup_count": 0})
+        await schedule_prefetch(preference.session_id)
+        return ChatReply(songs=songs, chunks=stream_set_chat_response(songs, session, OPENAI_API_KEY), tail=FEEDBACK_HTML)
+
     if has_all_preferences(session):
-        song = get_valid_recommendation(session)
+        song = await get_valid_recommendation(preference.session_id, session)
         if not song or song.get("song", "").lower() == "n/a":
-            return {
-                "response": "<span style='color:green'>I couldn’t find a perfect match, but here’s something popular you might like. Want to try a different mood, artist, or genre?</span>"
-            }
-        memory.update_last_song(preference.session_id, song['song'], song['artist'])
-        gpt_message = generate_chat_response(song, session, OPENAI_API_KEY)
-        memory.update_session(preference.session_id, "awaiting_feedback", True)
-        memory.update_session(preference.session_id, "followup_count", 0)
-        return {"response": f"<span style='color:green'>{gpt_message}</span><br>Are you happy with this recommendation?{BUTTONS_HTML}"}
+            return ChatReply("<span style='color:green'>I couldn’t find a perfect match, but here’s something popular you might like. Want to try a different mood, artist, or genre?</span>")
+        await run_store(memory.update_last_song, preference.session_id, song['song'], song['artist'], song.get('row_id'))
+        await run_store(memory.update_many, preference.session_id, {"awaiting_feedback": True, "followup_count": 0})
+        await schedule_prefetch(preference.session_id)
+        return ChatReply(song=song, chunks=stream_chat_response(song, session, OPENAI_API_KEY), tail=FEEDBACK_HTML)
 
     # Otherwise, ask for the next missing one
     known_prefs = {k: session.get(k) for k in all_fields}
@@ -135,120 +382,182 @@ def recommend(preference: PreferenceInput):
         f"User said no preference for: {no_prefs}."
     )
 
-    ai_message = next_ai_message(session, user_message + "\n\n" + context, OPENAI_API_KEY)
-    memory.update_session(preference.session_id, "followup_count", session.get("followup_count", 0) + 1)
-    return {"response": f"<span style='color:green'>{ai_message}</span>"}
+    await run_store(memory.update_session, preference.session_id, "followup_count", session.get("followup_count", 0) + 1)
+    return ChatReply(chunks=stream_next_ai_message(session, user_message + "\n\n" + context, OPENAI_API_KEY))
 
-@app.post("/command")
-def handle_command(command_input: CommandInput):
+async def command_turn(command_input: CommandInput) -> ChatReply:
     cmd = command_input.command.lower().strip()
     session_id = command_input.session_id
-    session = memory.get_session(session_id)
+    session = await get_catalog_session(session_id)
     all_fields = ["genre", "mood", "tempo", "artist_or_song"]
 
     # Handle preference changes
     for pref in ["genre", "mood", "tempo", "artist"]:
         if f"change {pref}" in cmd or f"switch {pref}" in cmd or f"new {pref}" in cmd or (pref in cmd and "change" in cmd):
             field = "artist_or_song" if pref == "artist" else pref
-            memory.update_session(session_id, field, None)
-            memory.update_session(session_id, f"no_pref_{field}", False)
-            memory.update_session(session_id, "awaiting_feedback", False)
-            return {
-                "response": f"<span style='color:green'>Sure! What {pref} would you like instead?</span>"
-            }
+            await run_store(memory.update_many, session_id, {field: None, f"no_pref_{field}": False, "awaiting_feedback": False})
+            await discard_prefetch(session_id)
+            return ChatReply(f"<span style='color:green'>Sure! What {pref} would you like instead?</span>")
 
     # Hard reset
     if any(word in cmd for word in ["start over", "restart", "reset"]):
-        memory.reset_session(session_id)
-        return {
-            "response": (
-                "🔁 <span style='color:green'>Alright! Let’s start fresh. How are you feeling right now?</span>"
-            )
-        }
+        await discard_prefetch(session_id)
+        await run_store(memory.reset_session, session_id)
+        return ChatReply("🔁 <span style='color:green'>Alright! Let’s start fresh. How are you feeling right now?</span>")
 
     # "another" recommendation (recommend again with same prefs, different song)
     if any(word in cmd for word in ["another", "again", "next one"]):
-        session = memory.get_session(session_id)
-        session["history"] = [(session.get("last_song"), session.get("last_artist"))]
-        song = get_valid_recommendation(session)
-        if not song or song.get("song", "").lower() == "n/a":
-            return {"response": "<span style='color:green'>I couldn’t find another new song. Want to change mood, genre, artist, or tempo?</span>"}
-        memory.update_last_song(session_id, song['song'], song['artist'])
-        gpt_message = generate_chat_response(song, session, OPENAI_API_KEY)
-        memory.update_session(session_id, "awaiting_feedback", True)
-        return {"response": f"<span style='color:green'>{gpt_message}</span><br>Are you happy with this recommendation?{BUTTONS_HTML}"}
+        session = await run_store(memory.get_session, session_id)
+        last_row_id = session.get("last_row_id")
+        session["history"] = [last_row_id] if last_row_id is not None else []
+        song, chunks = await next_recommendation(session_id, session)
+        if not song:
+            return ChatReply("<span style='color:green'>I couldn’t find another new song. Want to change mood, genre, artist, or tempo?</span>")
+        await run_store(memory.update_last_song, session_id, song['song'], song['artist'], song.get('row_id'))
+        await run_store(memory.update_session, session_id, "awaiting_feedback", True)
+        await schedule_prefetch(session_id)
+        return ChatReply(song=song, chunks=chunks, tail=FEEDBACK_HTML)
 
     # Feedback after recommendation (locked state, but always actionable)
     if session.get("awaiting_feedback"):
         # Negative feedback: no/try again
         if any(word in cmd for word in ["no", "didn't", "not really", "did not", "nah", "not a good fit", "not fit", "try again"]):
-            last_song = session.get("last_song")
-            last_artist = session.get("last_artist")
-            if last_song and last_artist:
-                if (last_song, last_artist) not in session["history"]:
-                    session["history"].append((last_song, last_artist))
-            song = get_valid_recommendation(session)
-            if not song or song.get("song", "").lower() == "n/a":
-                memory.update_session(session_id, "awaiting_feedback", False)
-                return {
-                    "response": "<span style='color:green'>I couldn’t find another new song. Want to change mood, genre, artist, or tempo?</span>"
-                }
-            memory.update_last_song(session_id, song['song'], song['artist'])
-            gpt_message = generate_chat_response(song, session, OPENAI_API_KEY)
-            memory.update_session(session_id, "awaiting_feedback", True)
-            return {"response": f"<span style='color:green'>{gpt_message}</span><br>Are you happy with this recommendation?{BUTTONS_HTML}"}
+            last_row_id = session.get("last_row_id")
+            if last_row_id is not None and last_row_id not in session["history"]:
+                session["history"].append(last_row_id)
+            song, chunks = await next_recommendation(session_id, session)
+            if not song:
+                await run_store(memory.update_session, session_id, "awaiting_feedback", False)
+                return ChatReply("<span style='color:green'>I couldn’t find another new song. Want to change mood, genre, artist, or tempo?</span>")
+            await run_store(memory.update_last_song, session_id, song['song'], song['artist'], song.get('row_id'))
+            await run_store(memory.update_session, session_id, "awaiting_feedback", True)
+            await schedule_prefetch(session_id)
+            return ChatReply(song=song, chunks=chunks, tail=FEEDBACK_HTML)
         # Positive feedback
         if any(word in cmd for word in ["yes", "love", "liked", "good", "great", "perfect", "awesome", "sure"]):
-            memory.update_session(session_id, "awaiting_feedback", False)
-            return {
-                "response": (
-                    "😊 <span style='color:green'>Great! Glad you liked it. If you want to hear something else, just type 'reset' to start again any time!</span>"
-                )
-            }
+            await run_store(memory.update_session, session_id, "awaiting_feedback", False)
+            return ChatReply("😊 <span style='color:green'>Great! Glad you liked it. If you want to hear something else, just type 'reset' to start again any time!</span>")
         # Handle user specifying new preference while in feedback
-        extracted = extract_preferences_from_message(cmd, OPENAI_API_KEY)
+        extracted = await extract_preferences_from_message(cmd, OPENAI_API_KEY, current_catalog().artist_matcher)
         extracted_any = any(extracted.get(k) for k in ["genre", "mood", "tempo", "artist_or_song"])
         if extracted_any:
-            for key in ["genre", "mood", "tempo", "artist_or_song"]:
-                if extracted.get(key):
-                    memory.update_session(session_id, key, extracted[key])
-            song = get_valid_recommendation(session)
+            await run_store(memory.update_many, session_id, {key: extracted[key] for key in ["genre", "mood", "tempo", "artist_or_song"] if extracted.get(key)})
+            await discard_prefetch(session_id)
+            # session is a copy from before the update; rank and write with the new preferences
+            session = await run_store(memory.get_session, session_id)
+            song = await get_valid_recommendation(session_id, session)
             if not song or song.get("song", "").lower() == "n/a":
-                memory.update_session(session_id, "awaiting_feedback", False)
-                return {
-                    "response": "<span style='color:green'>I couldn’t find another new song. Want to change mood, genre, artist, or tempo?</span>"
-                }
-            memory.update_last_song(session_id, song['song'], song['artist'])
-            gpt_message = generate_chat_response(song, session, OPENAI_API_KEY)
-            memory.update_session(session_id, "awaiting_feedback", True)
-            return {"response": f"<span style='color:green'>{gpt_message}</span><br>Are you happy with this recommendation?{BUTTONS_HTML}"}
+                await run_store(memory.update_session, session_id, "awaiting_feedback", False)
+                return ChatReply("<span style='color:green'>I couldn’t find another new song. Want to change mood, genre, artist, or tempo?</span>")
+            await run_store(memory.update_last_song, session_id, song['song'], song['artist'], song.get('row_id'))
+            await run_store(memory.update_session, session_id, "awaiting_feedback", True)
+            await schedule_prefetch(session_id)
+            return ChatReply(song=song, chunks=stream_chat_response(song, session, OPENAI_API_KEY), tail=FEEDBACK_HTML)
         # Fallback
-        return {"response": "<span style='color:green'>You can say 'another one', 'change genre', 'change artist', 'change mood', 'change tempo', or 'reset' to start over.</span>"}
+        return ChatReply("<span style='color:green'>You can say 'another one', 'change genre', 'change artist', 'change mood', 'change tempo', or 'reset' to start over.</span>")
 
     if "change" in cmd or "something else" in cmd or "different" in cmd:
-        return {
-            "response": (
-                "<span style='color:green'>Which preference would you like to change? (genre, mood, tempo, or artist)</span>"
-            )
-        }
-    return {"response": "<span style='color:green'>You can say 'another one', 'change genre', 'change artist', 'change mood', 'change tempo', or 'reset' to start over.</span>"}
+        return ChatReply("<span style='color:green'>Which preference would you like to change? (genre, mood, tempo, or artist)</span>")
+    return ChatReply("<span style='color:green'>You can say 'another one', 'change genre', 'change artist', 'change mood', 'change tempo', or 'reset' to start over.</span>")
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@app.post("/recommend")
+async def recommend(preference: PreferenceInput):
+    reply = await recommend_turn(preference)
+    return {"response": await reply.render()}
+
+@app.post("/recommend/stream")
+async def recommend_stream(preference: PreferenceInput):
+    reply = await recommend_turn(preference)
+    return StreamingResponse(reply.events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/recommend/batch")
+async def recommend_batch_endpoint(batch: BatchRecommendInput):
+    # For offline jobs: ranked songs for many preference sets in one call, no sessions involved
+    if len(batch.preferences) > BATCH_MAX_SETS:
+        return JSONResponse(status_code=413, content={"message": f"At most {BATCH_MAX_SETS} preference sets per batch."})
+    k = min(max(batch.k, 1), BATCH_MAX_K)
+    preference_sets = []
+    for item in batch.preferences:
+        preferences = item.model_dump()
+        for key in PREFERENCE_FIELDS:
+            preferences[f"no_pref_{key}"] = preferences[key] is None
+        preference_sets.append(preferences)
+    moods = sorted({p["mood"].lower().strip() for p in preference_sets if p["mood"]})
+    vectors = dict(zip(moods, await asyncio.gather(*(get_mood_vector(m, OPENAI_API_KEY) for m in moods))))
+    mood_vectors = [vectors[p["mood"].lower().strip()] if p["mood"] else None for p in preference_sets]
+    results = await run_in_threadpool(recommend_batch, preference_sets, k, mood_vectors)
+    return {"results": results}
+
+@app.post("/command")
+async def handle_command(command_input: CommandInput):
+    reply = await command_turn(command_input)
+    return {"response": await reply.render()}
+
+@app.post("/command/stream")
+async def handle_command_stream(command_input: CommandInput):
+    reply = await command_turn(command_input)
+    return StreamingResponse(reply.events(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 @app.post("/reset")
-def reset_session(command_input: CommandInput):
+async def reset_session(command_input: CommandInput):
     session_id = command_input.session_id
-    memory.reset_session(session_id)
+    await discard_prefetch(session_id)
+    await run_store(memory.reset_session, session_id)
     return {
         "response": (
             "🔄 <span style='color:green'>Preferences reset! Tell me how you’re feeling or what type of music you want to hear.</span>"
         )
     }
 
+@app.post("/catalog/reload")
+async def reload_catalog_endpoint(body: CatalogReloadInput, x_admin_token: Optional[str] = Header(None)):
+    # Swaps in a new catalog snapshot while requests keep being served; sessions carry over
+    if not CATALOG_ADMIN_TOKEN or x_admin_token != CATALOG_ADMIN_TOKEN:
+        return JSONResponse(status_code=403, content={"message": "Catalog reload is not enabled."})
+    previous = current_catalog()
+    try:
+        index = await asyncio.to_thread(reload_catalog, body.csv_path)
+    except (OSError, ValueError) as e:
+        print("[CATALOG] Reload failed:", e)
+        return JSONResponse(status_code=400, content={"message": f"Catalog reload failed: {e}"})
+    return {
+        "version": index.version,
+        "rows": index.size,
+        "previous_version": previous.version,
+        "previous_rows": previous.size,
+        "changed": index.version != previous.version,
+    }
+
 @app.get("/session/{session_id}")
 def get_session(session_id: str):
-    return memory.get_session(session_id)
+    return memory.peek_session(session_id)
+
+@app.get("/stats")
+def get_stats():
+    return {
+        "extraction_cache": EXTRACTION_CACHE.stats(),
+        "chat_blurb_cache": CHAT_BLURB_CACHE.stats(),
+        "mood_vectors": MOOD_VECTORS.stats(),
+        "sessions": memory.stats(),
+        "catalog": {"version": current_catalog().version, "rows": current_catalog().size},
+    }
+
+@app.get("/metrics")
+def get_metrics():
+    # Prometheus text format: stage and request latency histograms, counters, cache gauges
+    caches = {"extraction": EXTRACTION_CACHE.stats(), "chat_blurb": CHAT_BLURB_CACHE.stats(), "mood_vectors": MOOD_VECTORS.stats()}
+    gauges = {
+        f"cache_{field}": {(("cache", name),): stats[field] for name, stats in caches.items()}
+        for field in ("size", "hits", "misses")
+    }
+    gauges["llm_upstream_calls"] = {(): llm.calls}
+    return PlainTextResponse(METRICS.render(gauges), media_type="text/plain; version=0.0.4")
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
+    METRICS.count("unhandled_errors")
     import traceback
     error_details = traceback.format_exc()
     print(f"[GLOBAL ERROR] Unhandled exception: {exc}\nDetails:\n{error_details}")
@@ -1,59 +1,319 @@
+import copy
+import os
+import sys
 import threading
-from collections import defaultdict
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
 
-class SessionMemory:
+from metrics import stage
+
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "10000"))
+SESSION_SHARDS = int(os.getenv("SESSION_SHARDS", "16"))
+SESSION_BACKEND = os.getenv("MOODIFY_SESSION_BACKEND", "memory")
+
+
+# One conversation's state. History is a dict used as an insertion-ordered set of catalog row
+# ids, so membership and dedup are O(1) and the oldest entry is the first key.
+class Session:
+    __slots__ = (
+        "genre", "mood", "tempo", "artist_or_song",
+        "no_pref_genre", "no_pref_mood", "no_pref_tempo", "no_pref_artist_or_song",
+        "awaiting_feedback", "followup_count", "history",
+        "last_song", "last_artist", "last_row_id", "prefetched", "candidates", "catalog_version", "last_seen",
+    )
+    FIELDS = __slots__[:-1]
+
+    def __init__(self, now: float = 0.0):
+        self.genre = None
+        self.mood = None
+        self.tempo = None
+        self.artist_or_song = None
+        self.no_pref_genre = False
+        self.no_pref_mood = False
+        self.no_pref_tempo = False
+        self.no_pref_artist_or_song = False
+        self.awaiting_feedback = False
+        self.followup_count = 0
+        self.history = {}
+        self.last_song = None
+        self.last_artist = None
+        self.last_row_id = None
+        self.prefetched = None
+        self.candidates = None
+        # Catalog version the row ids above belong to
+        self.catalog_version = None
+        self.last_seen = now
+
+    def set(self, key, value):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        if key == "history":
+            value = dict.fromkeys(value or ())
+        setattr(self, key, value)
+
+    def to_dict(self) -> dict:
+        # Handlers get a plain copy; mutating it never touches the stored session. The candidate
+        # cursor and prefetched song are dicts the handlers change in place, so they are copied too.
+        state = {key: getattr(self, key) for key in self.FIELDS}
+        state["history"] = list(self.history)
+        for key in ("candidates", "prefetched"):
+            if state[key] is not None:
+                state[key] = copy.deepcopy(state[key])
+        return state
+
+    def approx_bytes(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self.history)
+
+
+# What the API needs from a session backend. Handlers read a plain dict copy and write through
+# update_session / update_many; edit() is a read-modify-write that is atomic per session, so
+# several changes made by one handler land together even when workers share the store.
+class SessionStore(ABC):
     HISTORY_LIMIT = 100
+    # Whether a call can wait on I/O or another process's lock, so async callers should run it
+    # off the event loop
+    blocking = False
+
+    @abstractmethod
+    def get_session(self, session_id) -> dict:
+        ...
+
+    @abstractmethod
+    def peek_session(self, session_id) -> dict:
+        ...
+
+    @abstractmethod
+    def edit(self, session_id):
+        ...
+
+    @abstractmethod
+    def reset_session(self, session_id):
+        ...
+
+    @abstractmethod
+    def stats(self) -> dict:
+        ...
+
+    def sweep(self) -> int:
+        return 0
+
+    def update_session(self, session_id, key, value):
+        self.update_many(session_id, {key: value})
+
+    def update_many(self, session_id, updates: dict):
+        with self.edit(session_id) as state:
+            state.update(updates)
+
+    def update_last_song(self, session_id, song, artist, row_id=None):
+        with self.edit(session_id) as state:
+            state["last_song"] = song
+            state["last_artist"] = artist
+            state["last_row_id"] = row_id
+            history = dict.fromkeys(state["history"])
+            if row_id is not None:
+                history.setdefault(row_id)
+            state["history"] = list(history)[-self.HISTORY_LIMIT:]
+
+
+class _Shard:
+    __slots__ = ("lock", "sessions")
 
     def __init__(self):
-        self.sessions = defaultdict(self._empty_session)
         self.lock = threading.Lock()
+        # Least recently used first, so idle expiry and capacity eviction both pop from the front
+        self.sessions = OrderedDict()
+
+
+# Session store striped over independent locks by session id. Sessions expire after ttl seconds
+# without activity and the least recently used are evicted once max_sessions is reached, so
+# traffic that never comes back (crawlers, random ids) cannot grow the process without bound.
+class SessionMemory(SessionStore):
+    def __init__(
+        self,
+        ttl: float = SESSION_TTL_SECONDS,
+        max_sessions: int = SESSION_MAX_COUNT,
+        shards: int = SESSION_SHARDS,
+        clock=time.monotonic,
+    ):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._clock = clock
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self._shard_capacity = max(1, -(-max_sessions // len(self._shards)))
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _shard(self, session_id) -> _Shard:
+        return self._shards[hash(session_id) % len(self._shards)]
+
+    def _expire(self, shard: _Shard, now: float):
+        sessions = shard.sessions
+        while sessions:
+            session = next(iter(sessions.values()))
+            if now - session.last_seen < self.ttl:
+                break
+            sessions.popitem(last=False)
+            self.expired += 1
 
-    def _empty_session(self):
+    def _touch(self, shard: _Shard, session_id) -> Session:
+        # Caller holds shard.lock
+        now = self._clock()
+        self._expire(shard, now)
+        session = shard.sessions.get(session_id)
+        if session is None:
+            session = shard.sessions[session_id] = Session(now)
+            self.created += 1
+            while len(shard.sessions) > self._shard_capacity:
+                shard.sessions.popitem(last=False)
+                self.evicted += 1
+        else:
+            session.last_seen = now
+            shard.sessions.move_to_end(session_id)
+        return session
+
+    def get_session(self, session_id):
+        shard = self._shard(session_id)
+        with shard.lock:
+            return self._touch(shard, session_id).to_dict()
+
+    def peek_session(self, session_id):
+        # Read-only view that neither creates nor refreshes a session
+        shard = self._shard(session_id)
+        with shard.lock:
+            self._expire(shard, self._clock())
+            session = shard.sessions.get(session_id)
+            return (session or Session()).to_dict()
+
+    def update_session(self, session_id, key, value):
+        shard = self._shard(session_id)
+        with shard.lock:
+            self._touch(shard, session_id).set(key, value)
+
+    def update_many(self, session_id, updates: dict):
+        shard = self._shard(session_id)
+        with shard.lock:
+            session = self._touch(shard, session_id)
+            for key, value in updates.items():
+                session.set(key, value)
+
+    @contextmanager
+    def edit(self, session_id):
+        shard = self._shard(session_id)
+        with shard.lock:
+            session = self._touch(shard, session_id)
+            state = session.to_dict()
+            yield state
+            for key, value in state.items():
+                session.set(key, value)
+
+    def reset_session(self, session_id):
+        shard = self._shard(session_id)
+        with shard.lock:
+            session = self._touch(shard, session_id)
+            shard.sessions[session_id] = Session(session.last_seen)
+
+    def update_last_song(self, session_id, song, artist, row_id=None):
+        shard = self._shard(session_id)
+        with shard.lock:
+            s = self._touch(shard, session_id)
+            s.last_song = song
+            s.last_artist = artist
+            s.last_row_id = row_id
+            # Always add to history (never repeat); history holds catalog row ids
+            if row_id is not None:
+                s.history.setdefault(row_id)
+            while len(s.history) > self.HISTORY_LIMIT:
+                del s.history[next(iter(s.history))]
+
+    def sweep(self) -> int:
+        # Drop every idle session now rather than waiting for its shard to be touched
+        before = self.expired
+        now = self._clock()
+        for shard in self._shards:
+            with shard.lock:
+                self._expire(shard, now)
+        return self.expired - before
+
+    def __len__(self):
+        return sum(len(shard.sessions) for shard in self._shards)
+
+    def stats(self) -> dict:
+        count, history_entries, approx_bytes = 0, 0, 0
+        for shard in self._shards:
+            with shard.lock:
+                count += len(shard.sessions)
+                for session in shard.sessions.values():
+                    history_entries += len(session.history)
+                    approx_bytes += session.approx_bytes()
         return {
-            "genre": None,
-            "mood": None,
-            "tempo": None,
-            "artist_or_song": None,
-            "no_pref_genre": False,
-            "no_pref_mood": False,
-            "no_pref_tempo": False,
-            "no_pref_artist_or_song": False,
-            "awaiting_feedback": False,
-            "followup_count": 0,
-            "history": [],
-            "last_song": None,
-            "last_artist": None,
+            "backend": "memory",
+            "size": count,
+            "max_size": self.max_sessions,
+            "shards": len(self._shards),
+            "ttl_seconds": self.ttl,
+            "created": self.created,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "history_entries": history_entries,
+            "approx_bytes": approx_bytes,
         }
 
+
+# Times every call on another store as the "session_store" stage; edit() blocks include the
+# caller's read-modify-write, which is the time the session is held.
+class InstrumentedSessionStore(SessionStore):
+    def __init__(self, store: SessionStore):
+        self.store = store
+        self.HISTORY_LIMIT = store.HISTORY_LIMIT
+        self.blocking = store.blocking
+
     def get_session(self, session_id):
-        with self.lock:
-            return dict(self.sessions[session_id])  # Return a copy for safety
+        with stage("session_store"):
+            return self.store.get_session(session_id)
 
-    def update_session(self, session_id, key, value):
-        with self.lock:
-            self.sessions[session_id][key] = value
+    def peek_session(self, session_id):
+        with stage("session_store"):
+            return self.store.peek_session(session_id)
+
+    @contextmanager
+    def edit(self, session_id):
+        with stage("session_store"), self.store.edit(session_id) as state:
+            yield state
 
     def reset_session(self, session_id):
-        with self.lock:
-            self.sessions[session_id] = self._empty_session()
-
-    def update_last_song(self, session_id, song, artist):
-        with self.lock:
-            s = self.sessions[session_id]
-            s["last_song"] = song
-            s["last_artist"] = artist
-            # Always add to history (never repeat)
-            pair = (song, artist)
-            if pair not in s["history"]:
-                s["history"].append(pair)
-            # Deduplicate
-            seen = set()
-            unique = []
-            for p in reversed(s["history"]):
-                if p not in seen:
-                    unique.append(p)
-                    seen.add(p)
-            s["history"] = list(reversed(unique))
-            # Limit history size
-            if len(s["history"]) > self.HISTORY_LIMIT:
-                s["history"] = s["history"][-self.HISTORY_LIMIT:]
+        with stage("session_store"):
+            return self.store.reset_session(session_id)
+
+    def stats(self) -> dict:
+        return self.store.stats()
+
+    def sweep(self) -> int:
+        with stage("session_store"):
+            return self.store.sweep()
+
+    def update_session(self, session_id, key, value):
+        with stage("session_store"):
+            return self.store.update_session(session_id, key, value)
+
+    def update_many(self, session_id, updates: dict):
+        with stage("session_store"):
+            return self.store.update_many(session_id, updates)
+
+    def update_last_song(self, session_id, song, artist, row_id=None):
+        with stage("session_store"):
+            return self.store.update_last_song(session_id, song, artist, row_id)
+
+
+def create_session_store(backend: str = None) -> SessionStore:
+    # "memory" keeps sessions in this process; "sqlite" shares them between worker processes
+    backend = (backend or SESSION_BACKEND).lower()
+    if backend == "sqlite":
+        from session_sqlite import SQLiteSessionStore
+        return SQLiteSessionStore()
+    if backend != "memory":
+        raise ValueError(f"Unknown session backend: {backend}")
+    return SessionMemory()
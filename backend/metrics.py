@@ -0,0 +1,203 @@
+import asyncio
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_PREFIX = "moodify"
+# Seconds; spans cache hits (sub-millisecond) through slow LLM calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Stage -> seconds spent in it during the current request, for the Server-Timing header
+_request_timings = ContextVar("request_timings", default=None)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def copy(self):
+        histogram = Histogram(self.buckets)
+        histogram.counts, histogram.sum, histogram.count = self.counts[:], self.sum, self.count
+        return histogram
+
+    def samples(self, name: str, labels: str) -> list:
+        # Prometheus buckets are cumulative, ending with le="+Inf"
+        lines, running = [], 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            running += count
+            lines.append(_series(f"{name}_bucket", ",".join(filter(None, [labels, f'le="{bound}"']))) + f" {running}")
+        lines.append(_series(f"{name}_sum", labels) + f" {self.sum}")
+        lines.append(_series(f"{name}_count", labels) + f" {self.count}")
+        return lines
+
+
+def _labels(labels: dict) -> str:
+    return ",".join(f'{k}="{str(v)}"' for k, v in sorted(labels.items()))
+
+
+def _series(name: str, labels: str) -> str:
+    return f"{name}{{{labels}}}" if labels else name
+
+
+# Process-wide histograms and counters. Stage histograms time the pieces of a turn (extraction,
+# LLM calls, mood vectors, filtering, scoring, chat text, session store); request histograms
+# time whole responses per route. Everything is keyed by a rendered label string and guarded
+# by one lock, since observations come from the event loop and the threadpool alike.
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def count(self, name: str, n: int = 1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def render(self, gauges: dict = None) -> str:
+        # gauges: {name: {label dict as tuple of pairs: value}} sampled by the caller at scrape time
+        with self._lock:
+            histograms = {key: h.copy() for key, h in self.histograms.items()}
+            counters = dict(self.counters)
+        lines = []
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name} histogram")
+            for (key_name, labels), histogram in sorted(histograms.items(), key=lambda item: item[0]):
+                if key_name == name:
+                    lines.extend(histogram.samples(f"{METRICS_PREFIX}_{name}", labels))
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name}_total counter")
+            for (key_name, labels), value in sorted(counters.items()):
+                if key_name == name:
+                    lines.append(_series(f"{METRICS_PREFIX}_{name}_total", labels) + f" {value}")
+        for name, samples in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name} gauge")
+            for labels, value in samples.items():
+                lines.append(_series(f"{METRICS_PREFIX}_{name}", _labels(dict(labels))) + f" {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def record(name: str, seconds: float):
+    if not METRICS_ENABLED:
+        return
+    METRICS.observe("stage_seconds", seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if METRICS_ENABLED:
+            METRICS.count("stage_errors", stage=name)
+        raise
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed(name: str):
+    # Decorator form of stage() for plain functions, coroutines and async generators
+    def decorate(fn):
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def generator_wrapper(*args, **kwargs):
+                with stage(name):
+                    async for item in fn(*args, **kwargs):
+                        yield item
+            return generator_wrapper
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def detach():
+    # Background work started from a request (prefetch) still feeds the histograms, but not
+    # that request's Server-Timing header
+    _request_timings.set(None)
+
+
+def server_timing(timings: dict, total: float) -> str:
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+# Pure ASGI so streaming responses pass through untouched. Each HTTP request gets its own stage
+# timings; they go out as a Server-Timing header with the response start, so a streamed reply
+# only reports what ran before its first byte (the rest still lands in the histograms).
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        timings = {}
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(dict(timings), time.perf_counter() - start).encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            # Route templates, not raw paths, so /session/{session_id} stays one series
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            METRICS.observe("request_seconds", time.perf_counter() - start, route=route, method=scope["method"])
+            METRICS.count("responses", route=route, method=scope["method"], status=status)
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os
+import threading
+from collections import OrderedDict
+
+MOOD_CACHE_PATH = os.getenv("MOOD_VECTOR_CACHE_PATH", "data/mood_vectors.json")
+MOOD_CACHE_SIZE = int(os.getenv("MOOD_VECTOR_CACHE_SIZE", "512"))
+
+
+# Disk-backed LRU of mood -> 5-float feature vector. Every worker loads the same JSON file at
+# startup, so a mood only ever needs one upstream fetch; concurrent misses for the same mood
+# await a single in-flight fetch instead of each calling the API.
+class MoodVectorStore:
+    def __init__(self, path: str = MOOD_CACHE_PATH, max_size: int = MOOD_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self._vectors = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load()
+
+    @staticmethod
+    def _key(mood: str) -> str:
+        return mood.lower().strip()
+
+    def _read_file(self) -> dict:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            return {k: v for k, v in data.items() if isinstance(v, list) and len(v) == 5}
+        except Exception as e:
+            print("[MOOD CACHE] Failed to read mood vectors:", e)
+            return {}
+
+    def load(self):
+        with self._lock:
+            for mood, vec in self._read_file().items():
+                self._vectors[mood] = vec
+            self._evict()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                snapshot = dict(self._vectors)
+            # Merge with what other workers may have written since we loaded; ours are newest
+            merged = {k: v for k, v in self._read_file().items() if k not in snapshot}
+            merged.update(snapshot)
+            merged = dict(list(merged.items())[-self.max_size:])
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(tmp_path, "w") as f:
+                    json.dump(merged, f)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print("[MOOD CACHE] Failed to write mood vectors:", e)
+
+    def _evict(self):
+        while len(self._vectors) > self.max_size:
+            self._vectors.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, mood: str):
+        key = self._key(mood)
+        with self._lock:
+            vec = self._vectors.get(key)
+            if vec is not None:
+                self._vectors.move_to_end(key)
+            return vec
+
+    def put(self, mood: str, vec: list, persist: bool = True):
+        with self._lock:
+            self._vectors[self._key(mood)] = list(vec)
+            self._evict()
+        if persist:
+            self.save()
+
+    async def get_or_fetch(self, mood: str, fetch, persist: bool = True):
+        # fetch(mood) is a coroutine returning a vector or None; concurrent misses share one call
+        key = self._key(mood)
+        with self._lock:
+            vec = self._vectors.get(key)
+            if vec is not None:
+                self._vectors.move_to_end(key)
+                self.hits += 1
+                return vec
+            self.misses += 1
+            pending = self._inflight.get(key)
+            if pending is None:
+                pending = self._inflight[key] = asyncio.ensure_future(self._fetch(key, fetch, persist))
+        return await asyncio.shield(pending)
+
+    async def _fetch(self, key: str, fetch, persist: bool):
+        try:
+            vec = await fetch(key)
+            if vec is not None:
+                self.put(key, vec, persist=False)
+                if persist:
+                    await asyncio.to_thread(self.save)
+            return vec
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def prewarm(self, moods, fetch) -> int:
+        missing = [m for m in {self._key(m) for m in moods} if self.get(m) is None]
+        fetched = await asyncio.gather(*(self.get_or_fetch(m, fetch, persist=False) for m in missing))
+        if any(vec is not None for vec in fetched):
+            await asyncio.to_thread(self.save)
+        return sum(1 for vec in fetched if vec is not None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._vectors),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+if __name__ == "__main__":
+    # Pre-warm the on-disk store for the whole MOODS vocabulary: python mood_cache.py
+    from dotenv import load_dotenv
+    from utils import MOODS, prewarm_mood_vectors
+
+    load_dotenv()
+    count = asyncio.run(prewarm_mood_vectors(os.getenv("OPENAI_API_KEY")))
+    print(f"[MOOD CACHE] Fetched {count} mood vectors for {len(MOODS)} moods")
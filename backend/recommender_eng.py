@@ -1,41 +1,155 @@
-import pandas as pd
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
 import numpy as np
-import random
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import MinMaxScaler
+from catalog import CatalogIndex, CATALOG_DIR, FEATURES, SONGS_CSV_PATH, current_artifact_path, load_catalog_artifact, translate_rows
+from metrics import record, timed
 from utils import (
+    EXTRACTION_CACHE,
     convert_tempo_to_bpm,
     bpm_to_tempo_category,
-    fuzzy_match_artist_song,
-    generate_chat_response,
-    extract_preferences_from_message,
-    split_mode_category,
-    build_recommendation_key,
-    precompute_recommendation_map,
-    get_mood_vector,
+    lookup_mood_vector,
 )
 
-DATA_PATH = "data/songs.csv"
-try:
-    df = pd.read_csv(DATA_PATH)
-except Exception as e:
-    print("[RECOMMENDER] Failed to load CSV:", e)
-    df = pd.DataFrame([])
-
-df["tempo_raw"] = pd.to_numeric(df.get("tempo", 100), errors="coerce")
-features = ['valence', 'energy', 'danceability', 'acousticness', 'tempo']
-df = df.dropna(subset=features)
-df[features] = df[features].apply(pd.to_numeric, errors='coerce')
-df = df.dropna(subset=features)
-scaler = MinMaxScaler()
-df[features] = scaler.fit_transform(df[features])
-recommendation_map = precompute_recommendation_map(df)
-
 SAD_MOODS = {"sad", "melancholy", "down", "emotional", "blue", "heartbreak", "gloomy"}
 HAPPY_MOODS = {"happy", "joy", "energetic", "upbeat", "party", "celebrate", "excited"}
 UPBEAT_WORDS = {"upbeat", "party", "dance", "energetic", "celebrate", "hyped", "intense"}
 SLOW_WORDS = {"slow", "ballad", "chill", "calm"}
 
+# Row classes weighted_scores needs, precomputed once per catalog
+SCORE_FLAGS = {
+    "mood_sad": ("mood", SAD_MOODS),
+    "mood_happy": ("mood", HAPPY_MOODS),
+    "mood_bright": ("mood", HAPPY_MOODS | UPBEAT_WORDS),
+    "tempo_slow": ("tempo", SLOW_WORDS),
+    "tempo_upbeat": ("tempo", UPBEAT_WORDS),
+}
+
+DATA_PATH = SONGS_CSV_PATH
+features = FEATURES
+
+def load_catalog(csv_path: str = DATA_PATH) -> CatalogIndex:
+    # Workers memory-map the prebuilt artifact (python catalog_build.py); parsing the CSV is the fallback
+    index = load_catalog_artifact(CATALOG_DIR, features, flag_words=SCORE_FLAGS, source_path=csv_path)
+    if index is None:
+        from catalog_build import build_catalog
+        index = build_catalog(csv_path, features, flag_words=SCORE_FLAGS)
+    return index
+
+# The current catalog snapshot. A reload builds a new one and swaps this name; snapshots are
+# never modified, so a request pinned to the old one (pinned_catalog) finishes on it unchanged.
+catalog = load_catalog()
+_pinned_catalog = ContextVar("pinned_catalog", default=None)
+# Snapshots replaced by a reload, newest last, kept so session row ids can still be translated
+CATALOG_KEEP_VERSIONS = int(os.getenv("CATALOG_KEEP_VERSIONS", "3"))
+_retired_catalogs = OrderedDict()
+_retired_lock = threading.Lock()
+_reload_lock = threading.Lock()
+
+def current_catalog() -> CatalogIndex:
+    return _pinned_catalog.get() or catalog
+
+@contextmanager
+def pinned_catalog():
+    # Everything under this (including threadpool calls and tasks started from it, which copy
+    # the context) sees the snapshot that was current on entry
+    token = _pinned_catalog.set(current_catalog())
+    try:
+        yield
+    finally:
+        _pinned_catalog.reset(token)
+
+def catalog_snapshot(version: str):
+    # The current or a retired snapshot by version, else that version's artifact if it is still
+    # on disk (e.g. a session last served by a worker that reloaded first); None if neither
+    if version == catalog.version:
+        return catalog
+    retired = _retired_catalogs.get(version)
+    if retired is not None:
+        return retired
+    path = os.path.join(CATALOG_DIR, version)
+    if not os.path.exists(os.path.join(path, "manifest.json")):
+        return None
+    try:
+        index = CatalogIndex.open(path, flag_words=SCORE_FLAGS)
+    except Exception as e:
+        print("[RECOMMENDER] Failed to open catalog version", version, e)
+        return None
+    retire_catalog(index)
+    return index
+
+def retire_catalog(index: CatalogIndex):
+    with _retired_lock:
+        _retired_catalogs[index.version] = index
+        _retired_catalogs.move_to_end(index.version)
+        _retired_catalogs.pop(catalog.version, None)
+        while len(_retired_catalogs) > CATALOG_KEEP_VERSIONS:
+            _retired_catalogs.popitem(last=False)
+
+def translate_row_ids(rows, version: str, index: CatalogIndex = None):
+    # Row ids recorded against catalog version -> ids of the same tracks in index (default: the
+    # current snapshot), None for tracks it no longer has; None overall if version is unknown
+    index = index or current_catalog()
+    source = catalog_snapshot(version)
+    if source is None:
+        return None
+    return translate_rows(rows, source, index)
+
+def load_artifact_if_changed():
+    # The artifact CURRENT names, if that is not the snapshot being served
+    path = current_artifact_path(CATALOG_DIR)
+    if path is None or os.path.basename(path) == catalog.version:
+        return None
+    try:
+        return CatalogIndex.open(path, flag_words=SCORE_FLAGS)
+    except Exception as e:
+        print("[RECOMMENDER] Failed to open catalog artifact:", e)
+        return None
+
+def install_catalog(index: CatalogIndex) -> CatalogIndex:
+    # Makes index the current snapshot, unless it holds the same version; requests already
+    # running keep the one they were pinned to. Returns the snapshot now current.
+    global catalog
+    with _reload_lock:
+        if index.version == catalog.version:
+            return catalog
+        if not index.size and catalog.size:
+            raise ValueError(f"catalog {index.version} is empty; keeping {catalog.version}")
+        started = time.perf_counter()
+        # Everything the first requests on the new snapshot would otherwise build, plus the keys
+        # that translate session row ids between the two
+        index.warm()
+        index.row_lookup
+        catalog.row_keys
+        previous, catalog = catalog, index
+        retire_catalog(previous)
+        # Cached extractions name artists found by the old snapshot's matcher
+        EXTRACTION_CACHE.clear()
+        print(f"[RECOMMENDER] Catalog {index.version} ({index.size} rows) live, warmed in {time.perf_counter() - started:.1f}s")
+        return index
+
+def reload_catalog(csv_path: str = None) -> CatalogIndex:
+    # With csv_path, builds a new artifact from that file and points CATALOG_DIR/CURRENT at it,
+    # so the other workers pick it up too (reload_if_current_changed); without, re-reads the
+    # artifact CURRENT names, or the default CSV when there is none. Slow; run it off the event loop.
+    if csv_path:
+        if not os.path.isfile(csv_path):
+            raise FileNotFoundError(f"No such file: {csv_path}")
+        from catalog_build import build_catalog_artifact
+        index = CatalogIndex.open(build_catalog_artifact(csv_path, CATALOG_DIR, features), flag_words=SCORE_FLAGS)
+    else:
+        index = load_artifact_if_changed() or load_catalog(DATA_PATH)
+    return install_catalog(index)
+
+def reload_if_current_changed():
+    # Cheap enough to poll: only opens an artifact when CURRENT names a different one
+    index = load_artifact_if_changed()
+    return install_catalog(index) if index is not None else None
+
 def normalize(val):
     if isinstance(val, str):
         return val.strip().lower()
@@ -80,7 +194,7 @@ def weighted_score(row, prefs):
         if query and (query in artist or query in track_name):
             score += 10  # Stronger boost for direct match
     pop_val = row.get('track_popularity', row.get('popularity', None))
-    if pop_val is not None and not pd.isnull(pop_val):
+    if pop_val is not None and not (isinstance(pop_val, float) and math.isnan(pop_val)):
         try:
             score += float(pop_val) / 100.0
         except Exception:
@@ -93,104 +207,380 @@ def weighted_score(row, prefs):
             score -= 3
     return score
 
-def recommend_engine(preferences: dict, api_key: str):
-    must_have = ["genre", "mood", "tempo", "artist_or_song"]
-    for k in must_have:
+def label_score_terms(positions: np.ndarray, prefs: dict, index: CatalogIndex = None) -> tuple:
+    # The parts of weighted_scores that only depend on a row's genre/mood/tempo labels: the points
+    # added before the artist boost and popularity, and the mood and tempo penalties taken after
+    index = index or current_catalog()
+    flags = {}
+
+    def flag(name):
+        # Gathered on first use; most requests only need one or two of them
+        if name not in flags:
+            flags[name] = index.flags[name][positions]
+        return flags[name]
+
+    points = np.zeros(len(positions))
+    mood_penalty = np.zeros(len(positions))
+    tempo_penalty = np.zeros(len(positions))
+    if prefs.get("genre"):
+        pgenre = normalize(prefs["genre"])
+        if pgenre:
+            points += np.where(index.label_contains("genre", pgenre, positions), 8, 0)
+    if prefs.get("mood"):
+        pmood = normalize(prefs["mood"])
+        direct = index.label_contains("mood", pmood, positions) if pmood else np.zeros(len(positions), dtype=bool)
+        if pmood in SAD_MOODS:
+            points += np.where(direct | flag("mood_sad"), 8, np.where(flag("mood_happy"), -10, 0))
+            mood_penalty += np.where(flag("mood_bright"), 7, 0)
+        else:
+            points += np.where(direct, 8, 0)
+    if prefs.get("tempo"):
+        ptempo = normalize(prefs["tempo"])
+        direct = index.label_contains("tempo", ptempo, positions) if ptempo else np.zeros(len(positions), dtype=bool)
+        if ptempo in SLOW_WORDS:
+            points += np.where(direct | flag("tempo_slow"), 8, np.where(flag("tempo_upbeat"), -5, 0))
+            tempo_penalty += np.where(flag("tempo_upbeat"), 3, 0)
+        else:
+            points += np.where(direct, 8, 0)
+    return points, mood_penalty, tempo_penalty
+
+def weighted_scores(positions: np.ndarray, prefs: dict, index: CatalogIndex = None) -> np.ndarray:
+    # Batch form of weighted_score: same scores, computed for all candidate rows at once
+    index = index or current_catalog()
+    score, mood_penalty, tempo_penalty = label_score_terms(positions, prefs, index)
+    if prefs.get("artist_or_song"):
+        query = normalize(prefs["artist_or_song"])
+        if query:
+            score += np.where(index.artist_or_name_contains(query, positions), 10, 0)
+    score += index.score_popularity[positions]
+    score -= mood_penalty
+    score -= tempo_penalty
+    return score
+
+RANK_DEPTH = 10
+
+def top_k(positions: np.ndarray, scores: np.ndarray, similarity: np.ndarray = None, k: int = RANK_DEPTH) -> np.ndarray:
+    # Best k positions ordered by score, then mood similarity, then catalog position.
+    # argpartition-style selection keeps this O(n); only the k (plus boundary ties) get sorted.
+    if similarity is None:
+        similarity = np.zeros(len(positions))
+    if len(positions) > k:
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        keep = np.flatnonzero(scores >= kth)
+        positions, scores, similarity = positions[keep], scores[keep], similarity[keep]
+    order = np.lexsort((positions, -similarity, -scores))[:k]
+    return positions[order]
+
+def bucket_upper_bounds(prefs: dict, index: CatalogIndex = None, subset: np.ndarray = None) -> np.ndarray:
+    # Highest score any row of each bucket can reach: the label part is shared by the whole
+    # bucket, on top of which a row can only add the artist/title boost and its popularity.
+    # With a subset mask, buckets holding none of its rows are -inf and only buckets where a
+    # subset row matches the query keep the boost.
+    index = index or current_catalog()
+    reps = index.bucket_representatives()
+    points, mood_penalty, tempo_penalty = label_score_terms(reps, prefs, index)
+    label_part = points - mood_penalty - tempo_penalty
+    query = normalize(prefs.get("artist_or_song") or "")
+    artist_boost = 10 if query else 0
+    if subset is not None:
+        positions = np.flatnonzero(subset)
+        buckets = index.bucket_of_row[positions]
+        if query:
+            boosted = buckets[index.artist_or_name_contains(query, positions)]
+            artist_boost = np.where(np.bincount(boosted, minlength=index.bucket_count) > 0, 10, 0)
+        label_part = np.where(np.bincount(buckets, minlength=index.bucket_count) > 0, label_part, -np.inf)
+    # Slack for the different order the row scorer adds the same terms in
+    return label_part + artist_boost + index.bucket_max_popularity + 1e-9
+
+BUCKET_BATCH_ROWS = 4096
+
+def seen_tracks(history_ids, index: CatalogIndex = None) -> np.ndarray:
+    # Track codes of the history rows; ids outside the catalog are ignored
+    index = index or current_catalog()
+    ids = np.asarray(list(history_ids), dtype=np.int64)
+    return np.unique(index.track_codes[ids[(ids >= 0) & (ids < index.size)]])
+
+def unseen_rows(rows, history_ids, index: CatalogIndex = None) -> np.ndarray:
+    # Mask over rows: True where the row's track is not in history
+    index = index or current_catalog()
+    rows = np.asarray(rows, dtype=np.int64)
+    return np.isin(index.track_codes[rows], seen_tracks(history_ids, index), invert=True)
+
+def distinct_tracks(rows, index: CatalogIndex = None) -> np.ndarray:
+    # The first row of each track in rows, in order
+    index = index or current_catalog()
+    rows = np.asarray(rows, dtype=np.int64)
+    _, first = np.unique(index.track_codes[rows], return_index=True)
+    return rows[np.sort(first)]
+
+def rank_candidates(
+    prefs: dict,
+    row_filter,
+    history_ids: np.ndarray,
+    mood_vec=None,
+    k: int = RANK_DEPTH,
+    index: CatalogIndex = None,
+    subset: np.ndarray = None,
+) -> np.ndarray:
+    # Same result as scoring every row that passes row_filter and taking top_k, without scoring
+    # buckets that cannot reach the top k. Buckets are taken best bound first, in batches that
+    # start at BUCKET_BATCH_ROWS rows and double, until k rows are kept; every other bucket whose
+    # bound still reaches the k-th best score is then scored in one more batch. subset is an
+    # optional mask row_filter already implies (artist match/exclusion): a small one is scored
+    # directly, a large one only narrows which buckets are visited.
+    index = index or current_catalog()
+    # History excludes tracks, not rows: every row sharing a track code with a history row
+    seen = seen_tracks(history_ids, index)
+    kept_positions, kept_scores = [], []
+    best = np.zeros(0)
+    # Per-stage time summed over every batch, recorded once per call
+    spent = {"filter": 0.0, "history": 0.0, "scoring": 0.0}
+
+    def score(positions, track=True):
+        nonlocal best
+        start = time.perf_counter()
+        positions = positions[row_filter(positions)]
+        filtered = time.perf_counter()
+        if seen.size and positions.size:
+            positions = positions[np.isin(index.track_codes[positions], seen, invert=True)]
+        excluded = time.perf_counter()
+        spent["filter"] += filtered - start
+        spent["history"] += excluded - filtered
+        if not positions.size:
+            return
+        scores = weighted_scores(positions, prefs, index)
+        spent["scoring"] += time.perf_counter() - excluded
+        kept_positions.append(positions)
+        kept_scores.append(scores)
+        if not track:
+            return
+        best = np.concatenate([best, scores])
+        if len(best) > k:
+            best = np.partition(best, len(best) - k)[len(best) - k:]
+
+    if subset is not None and np.count_nonzero(subset) <= BUCKET_BATCH_ROWS:
+        score(np.flatnonzero(subset))
+    else:
+        bounds = bucket_upper_bounds(prefs, index, subset)
+        order = np.argsort(-bounds, kind="stable")
+        order = order[bounds[order] > -np.inf]
+        sizes = np.diff(index.bucket_offsets)
+        visited, batch_rows = 0, BUCKET_BATCH_ROWS
+        while visited < len(order) and len(best) < k:
+            end = visited + max(1, int(np.searchsorted(np.cumsum(sizes[order[visited:]]), batch_rows)))
+            score(np.concatenate([index.bucket(b) for b in order[visited:end]]))
+            visited, batch_rows = end, batch_rows * 2
+        rest = order[visited:]
+        if len(best) >= k and rest.size:
+            rest = rest[bounds[rest] >= best.min()]
+        if rest.size:
+            if sizes[rest].sum() * 4 < index.size:
+                score(np.concatenate([index.bucket(b) for b in rest]), track=False)
+            else:
+                # Most of the catalog: rescore every wanted bucket, including the ones already
+                # visited, in row order so the gathers stay sequential
+                wanted = np.zeros(index.bucket_count, dtype=bool)
+                wanted[rest] = True
+                wanted[order[:visited]] = True
+                kept_positions.clear()
+                kept_scores.clear()
+                score(np.arange(index.size) if wanted.all() else np.flatnonzero(wanted[index.bucket_of_row]), track=False)
+    ranked = np.zeros(0, dtype=np.int64)
+    if kept_positions:
+        start = time.perf_counter()
+        positions = np.concatenate(kept_positions).astype(np.int64, copy=False)
+        scores = np.concatenate(kept_scores)
+        similarity = index.similarity(mood_vec, positions) if mood_vec is not None else None
+        ranked = top_k(positions, scores, similarity, k)
+        spent["scoring"] += time.perf_counter() - start
+    for name, seconds in spent.items():
+        record(name, seconds)
+    return ranked
+
+# Entries (sets x rows) in each score matrix rank_label_batch builds, about 32MB as float64
+BATCH_CELLS = 1 << 22
+
+def _blocks(items: np.ndarray, cells_per_item: int) -> list:
+    step = max(1, BATCH_CELLS // max(1, cells_per_item))
+    return [items[i:i + step] for i in range(0, len(items), step)]
+
+def rank_label_batch(
+    prefs_list: list,
+    mood_vecs: list,
+    depth: int,
+    filter_tempo: bool = True,
+    filter_genre: bool = True,
+    index: CatalogIndex = None,
+) -> list:
+    # rank_candidates for many preference sets at once, for sets without history or an
+    # artist/title query; each set keeps its top `depth` rows. Scores come from per-bucket label
+    # terms and mood similarity from one rows-by-sets matrix product per bucket, and a bucket
+    # is only scored for the sets whose bound on it reaches their running threshold.
+    index = index or current_catalog()
+    n_sets = len(prefs_list)
+    if not n_sets or not index.size:
+        return [np.zeros(0, dtype=np.int64) for _ in prefs_list]
+    reps = index.bucket_representatives()
+    terms = [label_score_terms(reps, prefs, index) for prefs in prefs_list]
+    points, mood_penalty, tempo_penalty = (np.stack(parts) for parts in zip(*terms))
+    bounds = points - mood_penalty - tempo_penalty + index.bucket_max_popularity + 1e-9
+
+    queries = np.zeros((n_sets, index.unit_features.shape[1]))
+    for i, vec in enumerate(mood_vecs):
+        if vec is not None:
+            query = np.asarray(vec, dtype=np.float64)
+            norm = np.linalg.norm(query)
+            if norm:
+                queries[i] = query / norm
+
+    # Genre and tempo filters per set; -2 matches no genre code (missing genres are -1)
+    has_genre = np.array([filter_genre and bool(prefs.get("genre")) for prefs in prefs_list])
+    genre_code = np.full(n_sets, -2)
+    for i, prefs in enumerate(prefs_list):
+        code = index.genre_code(prefs["genre"]) if has_genre[i] else None
+        if code is not None:
+            genre_code[i] = code
+    has_tempo = np.array([filter_tempo and bool(prefs.get("tempo")) for prefs in prefs_list])
+    tempo_range = np.array([
+        convert_tempo_to_bpm(prefs["tempo"].lower()) if has else (0, 0)
+        for prefs, has in zip(prefs_list, has_tempo)
+    ], dtype=np.float64).reshape(n_sets, 2)
+
+    def cell_scores(sets, rows):
+        # Same terms in the same order as weighted_scores, so scores match it exactly;
+        # -inf where a set's genre/tempo filter rejects the row
+        buckets = index.bucket_of_row[rows]
+        score = points[sets][:, buckets] + index.score_popularity[rows]
+        score -= mood_penalty[sets][:, buckets]
+        score -= tempo_penalty[sets][:, buckets]
+        if has_genre[sets].any():
+            score[~(~has_genre[sets, None] | (index.genre_codes[rows] == genre_code[sets, None]))] = -np.inf
+        if has_tempo[sets].any():
+            bpm = index.tempo_raw[rows]
+            in_range = (bpm >= tempo_range[sets, :1]) & (bpm <= tempo_range[sets, 1:])
+            score[~(~has_tempo[sets, None] | in_range)] = -np.inf
+        return score
+
+    def kth_best(score):
+        if score.shape[1] < depth:
+            return np.full(len(score), -np.inf)
+        return np.partition(score, score.shape[1] - depth, axis=1)[:, score.shape[1] - depth]
+
+    # Each bucket's most popular rows give a lower bound on every set's depth-th best score
+    threshold = np.full(n_sets, -np.inf)
+    leaders = index.bucket_leaders(depth)
+    for sets in _blocks(np.arange(n_sets), len(leaders)):
+        threshold[sets] = kth_best(cell_scores(sets, leaders))
+
+    found_sets, found_rows, found_scores, found_similarity = [], [], [], []
+    for b in range(index.bucket_count):
+        rows = index.bucket(b)
+        for sets in _blocks(np.flatnonzero(bounds[:, b] >= threshold), len(rows)):
+            score = cell_scores(sets, rows)
+            # Everything tied with or above each set's depth-th best survives, as in top_k
+            keep = (score > -np.inf) & (score >= kth_best(score)[:, None])
+            picked, columns = np.nonzero(keep)
+            similarity = index.unit_features[rows] @ queries[sets].T
+            found_sets.append(sets[picked])
+            found_rows.append(rows[columns])
+            found_scores.append(score[picked, columns])
+            found_similarity.append(similarity[columns, picked])
+
+    if not found_sets:
+        return [np.zeros(0, dtype=np.int64) for _ in prefs_list]
+    sets = np.concatenate(found_sets)
+    rows = np.concatenate(found_rows).astype(np.int64)
+    order = np.lexsort((rows, -np.concatenate(found_similarity), -np.concatenate(found_scores), sets))
+    sets, rows = sets[order], rows[order]
+    starts = np.searchsorted(sets, np.arange(n_sets))
+    ends = np.searchsorted(sets, np.arange(n_sets), side="right")
+    return [rows[first:min(last, first + depth)] for first, last in zip(starts, ends)]
+
+SIMILARITY_REQUEST_KEYWORDS = [
+    "similar to", "like", "vibe like", "in the style of",
+    "another artist like", "by a similar artist", "reminiscent of", "same vibe as", "any artist"
+]
+# Each pass relaxes one filter: genre and tempo, then genre only, then neither
+FILTER_PASSES = ((True, True), (False, True), (False, False))
+
+def has_required_preferences(preferences: dict) -> bool:
+    for k in ["genre", "mood", "tempo", "artist_or_song"]:
         if k not in preferences or (preferences[k] is None and not preferences.get(f"no_pref_{k}", False)):
-            return None
-
-    def apply_filters(preferences, filter_tempo=True, filter_genre=True, exclude_artist=None):
-        local_df = df.copy()
-        mood_str = preferences.get("mood")
-        mood_vec = None
-        if mood_str:
-            mood_vec = get_mood_vector(mood_str, api_key)
-        if preferences.get("artist_or_song"):
-            local_df = fuzzy_match_artist_song(local_df, preferences["artist_or_song"])
+            return False
+    return True
+
+def candidate_filter(preferences: dict, base_mask, filter_tempo=True, filter_genre=True):
+    catalog = current_catalog()
+
+    def row_filter(positions):
+        keep = np.ones(len(positions), dtype=bool) if base_mask is None else base_mask[positions]
         if filter_genre and preferences.get("genre"):
-            local_df = local_df[local_df['playlist_genre'].str.lower() == preferences["genre"].lower()]
+            keep &= catalog.genre_mask(preferences["genre"], positions)
         if filter_tempo and preferences.get("tempo"):
-            bpm_range = convert_tempo_to_bpm(preferences["tempo"])
-            local_df = local_df[(local_df['tempo_raw'] >= bpm_range[0]) & (local_df['tempo_raw'] <= bpm_range[1])]
-        if mood_vec is not None and not local_df.empty:
-            similarities = cosine_similarity(np.array(mood_vec).reshape(1, -1), local_df[features].values).flatten()
-            local_df["similarity"] = similarities
-            local_df = local_df.sort_values(by="similarity", ascending=False)
-        if exclude_artist:
-            local_df = local_df[local_df["track_artist"].str.lower() != exclude_artist.lower()]
-        return local_df
-
-    def exclude_history(df, history):
-        if not history or df.empty:
-            return df
-        return df[
-            ~df.apply(lambda row: (row["track_name"], row["track_artist"]) in history, axis=1)
-        ]
-
-    exclude_artist = None
+            keep &= catalog.tempo_mask(preferences["tempo"], positions)
+        return keep
+    return row_filter
+
+def similarity_request(preferences: dict):
+    # "Similar to X": rewrites the preference to the matched artist X and returns X, else None
+    catalog = current_catalog()
     if preferences.get("artist_or_song"):
         lowered = preferences["artist_or_song"].lower()
-        similarity_request_keywords = [
-            "similar to", "like", "vibe like", "in the style of",
-            "another artist like", "by a similar artist", "reminiscent of", "same vibe as", "any artist"
-        ]
-        if any(kw in lowered for kw in similarity_request_keywords):
-            for artist in df['track_artist'].dropna().unique():
-                if artist.lower() in lowered:
-                    exclude_artist = artist
-                    preferences["artist_or_song"] = artist
-                    break
-
-    filtered = apply_filters(preferences, filter_tempo=True, filter_genre=True, exclude_artist=exclude_artist)
-    history = preferences.get("history", [])
-    filtered = exclude_history(filtered, history)
-    if filtered.empty:
-        filtered = apply_filters(preferences, filter_tempo=False, filter_genre=True, exclude_artist=exclude_artist)
-        filtered = exclude_history(filtered, history)
-    if filtered.empty:
-        filtered = apply_filters(preferences, filter_tempo=False, filter_genre=False, exclude_artist=exclude_artist)
-        filtered = exclude_history(filtered, history)
-
-    top = None
-
-    if not filtered.empty:
-        filtered = filtered.copy()
-        filtered["weighted_score"] = filtered.apply(lambda row: weighted_score(row, preferences), axis=1)
-        filtered = filtered.sort_values(by="weighted_score", ascending=False)
-        for _, row in filtered.iterrows():
-            if (row["track_name"], row["track_artist"]) not in history:
-                top = row
-                history.append((row["track_name"], row["track_artist"]))
-                break
-        if top is None and not filtered.empty:
-            top = filtered.iloc[0]
-            history.append((top["track_name"], top["track_artist"]))
-    else:
-        # Fallback: recommend the most popular song globally (never fails)
-        if not df.empty:
-            fallback = df.sort_values(by="popularity" if "popularity" in df.columns else "track_popularity", ascending=False)
-            for _, row in fallback.iterrows():
-                if (row["track_name"], row["track_artist"]) not in history:
-                    top = row
-                    history.append((row["track_name"], row["track_artist"]))
-                    break
-            if top is None and not fallback.empty:
-                top = fallback.iloc[0]
-                history.append((top["track_name"], top["track_artist"]))
-        else:
-            return {
-                "song": "N/A",
-                "artist": "N/A",
-                "genre": "N/A",
-                "mood": preferences.get("mood", "Unknown"),
-                "tempo": "Unknown",
-                "spotify_url": None
-            }
+        if any(kw in lowered for kw in SIMILARITY_REQUEST_KEYWORDS):
+            artist = catalog.artist_matcher.longest(lowered)
+            if artist is not None:
+                preferences["artist_or_song"] = artist
+                return artist
+    return None
 
-    preferences["history"] = history
+@timed("artist_match")
+def artist_subset(preferences: dict):
+    # Rows allowed by the artist/title preference, or None when every row is. "Similar to X"
+    # excludes X's own songs.
+    exclude_artist = similarity_request(preferences)
+    catalog = current_catalog()
+
+    base_mask = None
+    if preferences.get("artist_or_song"):
+        base_mask = catalog.match_artist_song(preferences["artist_or_song"])
+    if exclude_artist:
+        base_mask = (catalog.select_all() if base_mask is None else base_mask) & ~catalog.artist_mask(exclude_artist)
+    return base_mask
+
+def rank_preferences(preferences: dict, history_ids: np.ndarray, mood_vec=None, k: int = RANK_DEPTH) -> np.ndarray:
+    # Artist/title matching and artist exclusion don't change between the fallback passes
+    base_mask = artist_subset(preferences)
+    for filter_tempo, filter_genre in FILTER_PASSES:
+        row_filter = candidate_filter(preferences, base_mask, filter_tempo, filter_genre)
+        ranked = rank_candidates(preferences, row_filter, history_ids, mood_vec, k=k, subset=base_mask)
+        if ranked.size:
+            return ranked
+    return np.zeros(0, dtype=np.int64)
 
-    tempo_category = bpm_to_tempo_category(top.get("tempo_raw", 100))
-    track_id = top.get("track_id")
+def rank_distinct(preferences: dict, history_ids: np.ndarray, mood_vec=None, k: int = RANK_DEPTH) -> np.ndarray:
+    # rank_preferences keeping only the best row of each track, ranking deeper until k tracks
+    # are found or the filter pass runs out of rows
+    depth = k
+    while True:
+        ranked = rank_preferences(preferences, history_ids, mood_vec, k=depth)
+        distinct = distinct_tracks(ranked)
+        if len(distinct) >= k or len(ranked) < depth:
+            return distinct[:k]
+        depth *= 2
+
+def most_popular_unseen(history) -> int:
+    # Fallback: the most popular song globally whose track isn't in history (never fails)
+    catalog = current_catalog()
+    seen = set(seen_tracks(history, catalog).tolist())
+    for pos in catalog.popularity_order:
+        if int(catalog.track_codes[pos]) not in seen:
+            return int(pos)
+    return int(catalog.popularity_order[0])
+
+def song_response(top: int, preferences: dict) -> dict:
+    catalog = current_catalog()
+    tempo_category = bpm_to_tempo_category(catalog.tempo_raw[top])
+    track_id = catalog.track_id[top]
     spotify_url = None
     if (
         track_id 
@@ -203,9 +593,10 @@ def recommend_engine(preferences: dict, api_key: str):
         spotify_url = f"https://open.spotify.com/track/{track_id.strip()}"
 
     response = {
-        "song": top.get("track_name", "Unknown"),
-        "artist": top.get("track_artist", "Unknown"),
-        "genre": top.get("playlist_genre", "Unknown"),
+        "row_id": top,
+        "song": catalog.track_name[top],
+        "artist": catalog.track_artist[top],
+        "genre": catalog.playlist_genre[top],
         "mood": preferences.get("mood", "Unknown"),
         "tempo": tempo_category,
         "spotify_url": spotify_url
@@ -213,8 +604,193 @@ def recommend_engine(preferences: dict, api_key: str):
 
     if preferences.get("artist_or_song"):
         requested = preferences["artist_or_song"].lower()
-        if top.get("track_artist", "").lower() != requested and requested not in top.get("track_artist", "").lower():
+        top_artist = catalog.artist_lower(top)
+        if top_artist != requested and requested not in top_artist:
             response["artist_not_found"] = True
             response["requested_artist"] = requested
 
     return response
+
+# Diverse top-N: the pool of best-ranked rows diversify chooses from, how much relevance
+# outweighs novelty, and how many picks one artist may have
+DIVERSE_POOL = int(os.getenv("DIVERSE_POOL", "100"))
+DIVERSE_LAMBDA = float(os.getenv("DIVERSE_LAMBDA", "0.7"))
+DIVERSE_ARTIST_CAP = int(os.getenv("DIVERSE_ARTIST_CAP", "1"))
+
+def diversify(
+    ranked: np.ndarray,
+    prefs: dict,
+    n: int,
+    tradeoff: float = DIVERSE_LAMBDA,
+    artist_cap: int = DIVERSE_ARTIST_CAP,
+    index: CatalogIndex = None,
+) -> np.ndarray:
+    # Maximal marginal relevance over ranked (best first): each pick maximises
+    # tradeoff * relevance - (1 - tradeoff) * (cosine similarity to the closest earlier pick).
+    # Relevance is the weighted score scaled to [0, 1] over the pool, less a hair per rank so
+    # ties keep the ranking's order. Artists with artist_cap picks are skipped until the pool
+    # has nothing else left (e.g. a single-artist request).
+    index = index or current_catalog()
+    ranked = np.asarray(ranked, dtype=np.int64)
+    if len(ranked) <= 1 or n <= 1:
+        return ranked[:max(n, 0)]
+    scores = weighted_scores(ranked, prefs, index)
+    span = scores.max() - scores.min()
+    relevance = (scores - scores.min()) / span if span > 0 else np.ones(len(ranked))
+    relevance -= np.arange(len(ranked)) * 1e-9
+    vectors = np.asarray(index.unit_features[ranked], dtype=np.float64)
+    artists = index.artist_codes[ranked]
+    redundancy = np.zeros(len(ranked))
+    open_rows = np.ones(len(ranked), dtype=bool)
+    capped = np.zeros(len(ranked), dtype=bool)
+    picks = []
+    while len(picks) < min(n, len(ranked)):
+        gain = tradeoff * relevance - (1 - tradeoff) * redundancy
+        allowed = open_rows & ~capped
+        if not allowed.any():
+            allowed = open_rows
+        gain[~allowed] = -np.inf
+        i = int(np.argmax(gain))
+        picks.append(i)
+        open_rows[i] = False
+        if artist_cap and artists[i] >= 0:
+            same = artists == artists[i]
+            if np.count_nonzero(same & ~open_rows) >= artist_cap:
+                capped |= same
+        redundancy = np.maximum(redundancy, vectors @ vectors[i])
+    return ranked[picks]
+
+def recommend_engine(preferences: dict, api_key: str, mood_vector: list = None, count: int = None):
+    # mood_vector: resolve it with `await utils.get_mood_vector` first; otherwise only the
+    # local mood vector cache is consulted, since this runs off the event loop.
+    # count: diverse top-N mode, returning a list of up to count songs picked by diversify
+    # from the best DIVERSE_POOL rows, all appended to history
+    catalog = current_catalog()
+    if not has_required_preferences(preferences):
+        return None
+
+    mood_vec = mood_vector
+    if mood_vec is None and preferences.get("mood"):
+        mood_vec = lookup_mood_vector(preferences["mood"])
+
+    # Session history holds catalog row ids; ranking excludes every row of a history track
+    history = preferences.get("history", [])
+    if count is not None:
+        pool = rank_distinct(preferences, np.asarray(history, dtype=np.int64), mood_vec, k=max(DIVERSE_POOL, count))
+        if pool.size:
+            picks = diversify(pool, preferences, count).tolist()
+        else:
+            picks = [most_popular_unseen(history)] if catalog.size else []
+        history.extend(picks)
+        preferences["history"] = history
+        return [song_response(top, preferences) for top in picks]
+    ranked = rank_preferences(preferences, np.asarray(history, dtype=np.int64), mood_vec)
+
+    if ranked.size:
+        top = int(ranked[0])
+    elif catalog.size:
+        top = most_popular_unseen(history)
+    else:
+        return {
+            "song": "N/A",
+            "artist": "N/A",
+            "genre": "N/A",
+            "mood": preferences.get("mood", "Unknown"),
+            "tempo": "Unknown",
+            "spotify_url": None
+        }
+    history.append(top)
+
+    preferences["history"] = history
+    return song_response(top, preferences)
+
+# How many ranked rows a session cursor holds before it has to rank again
+CANDIDATE_DEPTH = int(os.getenv("CANDIDATE_DEPTH", "50"))
+
+def recommend_candidates(preferences: dict, exclude_ids, mood_vector: list = None, depth: int = CANDIDATE_DEPTH) -> list:
+    # The ranking recommend_engine takes its top song from, kept to depth tracks (one row each),
+    # best first and without the tracks of exclude_ids; [] when preferences are incomplete or no row passes any filter pass.
+    # Like recommend_engine, a "similar to X" preference is rewritten in place.
+    if not has_required_preferences(preferences):
+        return []
+    mood_vec = mood_vector
+    if mood_vec is None and preferences.get("mood"):
+        mood_vec = lookup_mood_vector(preferences["mood"])
+    return rank_distinct(preferences, np.asarray(list(exclude_ids), dtype=np.int64), mood_vec, k=depth).tolist()
+
+def candidate_song(row: int, preferences: dict) -> dict:
+    similarity_request(preferences)
+    return song_response(row, preferences)
+
+def fallback_song(preferences: dict, exclude_ids) -> dict:
+    # recommend_engine's answer when ranking finds nothing: the most popular song not excluded
+    catalog = current_catalog()
+    if not catalog.size:
+        return {
+            "song": "N/A",
+            "artist": "N/A",
+            "genre": "N/A",
+            "mood": preferences.get("mood", "Unknown"),
+            "tempo": "Unknown",
+            "spotify_url": None
+        }
+    return candidate_song(most_popular_unseen(exclude_ids), preferences)
+
+def _batch_songs(ranked: np.ndarray, history: list, preferences: dict) -> list:
+    catalog = current_catalog()
+    if ranked.size:
+        return [song_response(int(top), preferences) for top in ranked]
+    if catalog.size:
+        return [song_response(most_popular_unseen(history), preferences)]
+    return []
+
+def recommend_batch(preference_sets: list, k: int = 5, mood_vectors: list = None) -> list:
+    # recommend_engine for many preference sets at once (playlist generation, digests, QA
+    # sweeps): up to k songs per set, best first, or None where a set is missing preferences.
+    # History is excluded but never appended to. Sets without an artist/title query are ranked
+    # together by rank_label_batch, and identical ones only once.
+    results = [None] * len(preference_sets)
+    groups = {}
+    for i, preferences in enumerate(preference_sets):
+        if not has_required_preferences(preferences):
+            continue
+        preferences = dict(preferences)
+        history = list(preferences.get("history") or [])
+        mood_vec = mood_vectors[i] if mood_vectors is not None else None
+        if mood_vec is None and preferences.get("mood"):
+            mood_vec = lookup_mood_vector(preferences["mood"])
+        if preferences.get("artist_or_song"):
+            ranked = rank_distinct(preferences, np.asarray(history, dtype=np.int64), mood_vec, k=k)
+            results[i] = _batch_songs(ranked, history, preferences)
+            continue
+        key = (
+            preferences.get("genre"), preferences.get("mood"), preferences.get("tempo"),
+            None if mood_vec is None else tuple(mood_vec),
+        )
+        groups.setdefault(key, []).append((i, preferences, history, mood_vec))
+
+    pending = list(groups.values())
+    for filter_tempo, filter_genre in FILTER_PASSES:
+        if not pending:
+            break
+        # Rank deep enough that each member still has k rows left after dropping its history
+        depth = k + max(len(history) for members in pending for _, _, history, _ in members)
+        ranked_groups = rank_label_batch(
+            [members[0][1] for members in pending], [members[0][3] for members in pending], depth, filter_tempo, filter_genre
+        )
+        next_pending = []
+        for members, ranked in zip(pending, ranked_groups):
+            if not ranked.size:
+                next_pending.append(members)
+                continue
+            for i, preferences, history, mood_vec in members:
+                unseen = distinct_tracks(ranked[unseen_rows(ranked, history)])[:k]
+                if not unseen.size or (len(unseen) < k and len(ranked) >= depth):
+                    # History or repeated tracks used up the shared ranking; rank this member alone
+                    unseen = rank_distinct(preferences, np.asarray(history, dtype=np.int64), mood_vec, k=k)
+                results[i] = _batch_songs(unseen, history, preferences)
+        pending = next_pending
+    for members in pending:
+        for i, preferences, history, _ in members:
+            results[i] = _batch_songs(np.zeros(0, dtype=np.int64), history, preferences)
+    return results
@@ -0,0 +1,151 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from memory import Session, SessionStore, SESSION_MAX_COUNT, SESSION_TTL_SECONDS
+
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "data/sessions.db")
+SWEEP_EVERY = 256
+# A read refreshes last_seen (a write) only when it is older than this
+TOUCH_AFTER_SECONDS = 60.0
+
+
+# Sessions as JSON rows in one SQLite file in WAL mode, so every uvicorn worker on the host sees
+# the same conversations. Each edit is a single IMMEDIATE transaction: the row is read, changed
+# and written back while other writers wait, so concurrent requests never lose updates.
+class SQLiteSessionStore(SessionStore):
+    blocking = True
+
+    def __init__(
+        self,
+        path: str = SESSION_DB_PATH,
+        ttl: float = SESSION_TTL_SECONDS,
+        max_sessions: int = SESSION_MAX_COUNT,
+        clock=time.time,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._clock = clock
+        self._local = threading.local()
+        self._writes = 0
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, state TEXT NOT NULL, last_seen REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must stay on the thread that opened them
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _fresh() -> dict:
+        return Session().to_dict()
+
+    def _load(self, conn, session_id, now: float, fresh_for: float = None):
+        # None if missing or expired, or (with fresh_for) last seen more than fresh_for ago
+        row = conn.execute("SELECT state, last_seen FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None or now - row[1] >= min(self.ttl, fresh_for or self.ttl):
+            return None
+        state = self._fresh()
+        state.update(json.loads(row[0]))
+        return state
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        self._writes += 1
+        if self._writes % SWEEP_EVERY == 0:
+            self.sweep()
+
+    def _write(self, conn, session_id, state: dict, now: float):
+        conn.execute(
+            "INSERT INTO sessions (id, state, last_seen) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET state = excluded.state, last_seen = excluded.last_seen",
+            (session_id, json.dumps(state), now),
+        )
+
+    @contextmanager
+    def edit(self, session_id):
+        now = self._clock()
+        with self._transaction() as conn:
+            state = self._load(conn, session_id, now)
+            if state is None:
+                state = self._fresh()
+                self.created += 1
+            yield state
+            unknown = set(state) - set(Session.FIELDS)
+            if unknown:
+                raise KeyError(unknown.pop())
+            state["history"] = list(dict.fromkeys(state["history"] or ()))
+            self._write(conn, session_id, state, now)
+
+    def get_session(self, session_id):
+        # A plain read without the write lock; only creating the session or keeping an idle one
+        # from expiring needs a transaction
+        state = self._load(self._conn(), session_id, self._clock(), fresh_for=TOUCH_AFTER_SECONDS)
+        if state is not None:
+            return state
+        with self.edit(session_id) as state:
+            return dict(state, history=list(state["history"]))
+
+    def peek_session(self, session_id):
+        state = self._load(self._conn(), session_id, self._clock())
+        return state if state is not None else self._fresh()
+
+    def reset_session(self, session_id):
+        with self.edit(session_id) as state:
+            state.clear()
+            state.update(self._fresh())
+
+    def sweep(self) -> int:
+        # Drop idle sessions, then the least recently used beyond max_sessions
+        conn = self._conn()
+        cutoff = self._clock() - self.ttl
+        expired = conn.execute("DELETE FROM sessions WHERE last_seen <= ?", (cutoff,)).rowcount
+        evicted = conn.execute(
+            "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions ORDER BY last_seen DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,),
+        ).rowcount
+        self.expired += expired
+        self.evicted += evicted
+        return expired + evicted
+
+    def stats(self) -> dict:
+        conn = self._conn()
+        count = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "size": count,
+            "max_size": self.max_sessions,
+            "ttl_seconds": self.ttl,
+            "created": self.created,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "approx_bytes": page_count * page_size,
+        }
@@ -0,0 +1,53 @@
+import json
+
+SONG_FIELDS = ("row_id", "song", "artist", "genre", "mood", "tempo", "spotify_url", "artist_not_found")
+
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def once(text: str):
+    yield text
+
+
+# One chat turn as produced by the handlers. Either a finished HTML response, or assistant text
+# that is still being generated (rendered inside the green span) plus the chosen song (or songs,
+# for a several-song reply) and any trailing HTML such as the feedback buttons. The JSON
+# endpoints render it in one piece; the streaming endpoints send the song(s) first, then the
+# text as it arrives, then the buttons.
+class ChatReply:
+    def __init__(self, response: str = None, chunks=None, song: dict = None, tail: str = "", songs: list = None):
+        self.response = response
+        self.chunks = chunks
+        self.song = song
+        self.tail = tail
+        self.songs = songs
+
+    def _wrap(self, text: str) -> str:
+        return f"<span style='color:green'>{text}</span>{self.tail}"
+
+    async def render(self) -> str:
+        if self.chunks is None:
+            return self.response
+        return self._wrap("".join([chunk async for chunk in self.chunks]))
+
+    async def events(self):
+        if self.song:
+            yield sse("song", {k: self.song.get(k) for k in SONG_FIELDS if k in self.song})
+        if self.songs:
+            yield sse("songs", [{k: song.get(k) for k in SONG_FIELDS if k in song} for song in self.songs])
+        if self.chunks is None:
+            yield sse("done", {"response": self.response})
+            return
+        parts = []
+        try:
+            async for chunk in self.chunks:
+                parts.append(chunk)
+                yield sse("token", {"text": chunk})
+        except Exception as e:
+            print("[STREAM] Failed while streaming reply:", e)
+            yield sse("error", {"message": "The reply was interrupted."})
+        if self.tail:
+            yield sse("buttons", {"html": self.tail})
+        yield sse("done", {"response": self._wrap("".join(parts))})
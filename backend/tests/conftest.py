@@ -0,0 +1,73 @@
+import os
+import random
+import sys
+
+import pandas as pd
+import pytest
+
+# The backend modules import each other by bare name, as they do when run from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+GENRES = ["pop", "rock", "rap", "r&b", "edm", "latin", "hip hop"]
+MOODS = ["happy", "sad", "calm", "energetic", "melancholy", "party", "blue", "chill", "upbeat"]
+TEMPOS = ["slow", "medium", "fast", "chill", "upbeat", "dance", "ballad"]
+WORDS = ["love", "night", "summer", "heart", "fire", "dream", "city", "rain", "gold", "blue"]
+
+
+def songs_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    # A songs.csv-shaped frame. About one row in ten repeats an earlier track in another
+    # playlist, as the real CSV does; some popularities are missing.
+    rng = random.Random(seed)
+    records = []
+    for i in range(rows):
+        if records and rng.random() < 0.1:
+            record = dict(rng.choice(records), playlist_genre=rng.choice(GENRES))
+        else:
+            record = {
+                "track_id": f"t{i}",
+                "track_name": f"{rng.choice(WORDS)} {rng.choice(WORDS)} {rng.randint(1, 50)}",
+                "track_artist": f"Artist {rng.randint(1, rows // 8 + 2)}",
+                "track_popularity": rng.choice([None, rng.randint(0, 100), rng.randint(0, 100)]),
+                "playlist_genre": rng.choice(GENRES),
+                "mode_category": rng.choice(MOODS),
+                "tempo_category": rng.choice(TEMPOS),
+                "valence": rng.random(),
+                "energy": rng.random(),
+                "danceability": rng.random(),
+                "acousticness": rng.random(),
+                "tempo": rng.uniform(60, 180),
+            }
+        records.append(record)
+    return pd.DataFrame(records)
+
+
+@pytest.fixture
+def songs():
+    return songs_frame
+
+
+@pytest.fixture
+def build_index(tmp_path):
+    # Builds a catalog from a frame the way a worker does from the CSV
+    from catalog_build import build_catalog
+    from recommender_eng import FEATURES, SCORE_FLAGS
+
+    def build(frame: pd.DataFrame, name: str = "songs.csv"):
+        path = str(tmp_path / name)
+        frame.to_csv(path, index=False)
+        return build_catalog(path, FEATURES, flag_words=SCORE_FLAGS)
+    return build
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    # Makes an index the current snapshot for the test, with no snapshots retired
+    import recommender_eng
+    from collections import OrderedDict
+
+    monkeypatch.setattr(recommender_eng, "_retired_catalogs", OrderedDict())
+
+    def install(index):
+        monkeypatch.setattr(recommender_eng, "catalog", index)
+        return index
+    return install
@@ -0,0 +1,67 @@
+import pandas as pd
+
+import main
+import recommender_eng
+from catalog import translate_rows
+from memory import SessionMemory
+from utils import EXTRACTION_CACHE
+
+
+def track(index, row):
+    return (index.track_id[row], index.track_name[row], index.track_artist[row], index.playlist_genre[row])
+
+
+def rebuilt_frame(frame: pd.DataFrame, songs) -> pd.DataFrame:
+    # The next CSV: a tenth of the rows dropped, new rows appended, the order shuffled
+    kept = frame.drop(frame.sample(frac=0.1, random_state=1).index)
+    extra = songs(300, seed=9).assign(track_id=lambda df: "new-" + df["track_id"])
+    return pd.concat([kept, extra]).sample(frac=1, random_state=2)
+
+
+def test_translate_rows_follows_tracks(songs, build_index):
+    frame = songs(1500, seed=5)
+    old = build_index(frame, "a.csv")
+    new = build_index(rebuilt_frame(frame, songs), "b.csv")
+    translated = translate_rows(range(old.size), old, new)
+    kept = [row for row in translated if row is not None]
+    assert len(set(kept)) == len(kept)
+    for row, moved in enumerate(translated):
+        if moved is not None:
+            assert track(new, moved) == track(old, row)
+    # Every listing still in the new CSV is found, repeated listings included
+    remaining = pd.Series([track(new, row) for row in range(new.size)]).value_counts()
+    found = pd.Series([track(old, row) for row, moved in enumerate(translated) if moved is not None]).value_counts()
+    old_counts = pd.Series([track(old, row) for row in range(old.size)]).value_counts()
+    for key, count in old_counts.items():
+        assert found.get(key, 0) == min(count, remaining.get(key, 0))
+    assert translate_rows([0, old.size, -1], old, old) == [0, old.size, -1]
+
+
+def test_sessions_are_translated_after_a_reload(songs, build_index, serve, monkeypatch):
+    frame = songs(1500, seed=6)
+    old = serve(build_index(frame, "a.csv"))
+    new = build_index(rebuilt_frame(frame, songs), "b.csv")
+    monkeypatch.setattr(main, "memory", SessionMemory(shards=1))
+    history = list(range(0, old.size, 7))
+    main.memory.update_many("s", {"history": history, "last_row_id": 3, "catalog_version": old.version})
+    main.memory.update_many("lost", {"history": [1, 2], "catalog_version": "v3-000000000000"})
+
+    EXTRACTION_CACHE.set("something by artist 3", {"artist_or_song": "artist 3"})
+    assert recommender_eng.install_catalog(new) is new
+    assert EXTRACTION_CACHE.get("something by artist 3") is None
+    assert recommender_eng.current_catalog() is new
+    assert recommender_eng.catalog_snapshot(old.version) is old
+    main._translate_session("s", new)
+    main._translate_session("lost", new)
+
+    session = main.memory.get_session("s")
+    expected = [row for row in translate_rows(history, old, new) if row is not None]
+    assert session["catalog_version"] == new.version
+    assert session["history"] == expected
+    assert [track(new, row) for row in expected] == [
+        track(old, row) for row in history if translate_rows([row], old, new)[0] is not None
+    ]
+    assert session["last_row_id"] == translate_rows([3], old, new)[0]
+    # A version no snapshot or artifact knows keeps its ids
+    lost = main.memory.get_session("lost")
+    assert lost["history"] == [1, 2] and lost["catalog_version"] == new.version
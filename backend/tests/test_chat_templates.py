@@ -0,0 +1,18 @@
+from chat_templates import GENRE_TEMPLATES, TEMPLATES, genre_family, render_chat_template
+
+
+def bank(text: str) -> list:
+    # Every bank a rendered blurb could have come from
+    return [key for key, templates in list(GENRE_TEMPLATES.items()) + list(TEMPLATES.items())
+            if any(text == template.format(song="S", artist="A", mood="happy", genre_phrase=phrase, tempo="easy")
+                   for template in templates for phrase in ("a latin track", "a pop track"))]
+
+
+def test_genre_picks_the_template_bank():
+    assert genre_family("Latin") == "latin" and genre_family("hip hop") == "hip-hop"
+    assert genre_family("pop") is None and genre_family(None) is None
+    assert bank(render_chat_template("S", "A", "happy", "latin")) == [("happy", "latin")]
+    # No bank for the pair falls back to the mood group's
+    assert bank(render_chat_template("S", "A", "happy", "pop")) == ["happy"]
+    for song in ("one", "two", "three", "four"):
+        assert render_chat_template(song, "A", "happy", "latin") != render_chat_template(song, "A", "happy", "pop")
@@ -0,0 +1,38 @@
+import asyncio
+
+import main
+from memory import SessionMemory
+
+POP = {"genre": "pop", "mood": "happy", "tempo": "fast", "artist_or_song": None, "no_pref_artist_or_song": True}
+
+
+def command(session_id: str, text: str):
+    return asyncio.run(main.command_turn(main.CommandInput(session_id=session_id, command=text)))
+
+
+def test_new_preferences_during_feedback_are_used(songs, build_index, serve, monkeypatch):
+    index = serve(build_index(songs(2000, seed=7)))
+    monkeypatch.setattr(main, "memory", SessionMemory(shards=1))
+    monkeypatch.setattr(main, "PREFETCH_ENABLED", False)
+
+    async def no_vector(mood, api_key):
+        return None
+
+    async def extract(message, api_key, artist_matcher=None):
+        return {"genre": "rock"} if "rock" in message else {}
+    monkeypatch.setattr(main, "get_mood_vector", no_vector)
+    monkeypatch.setattr(main, "extract_preferences_from_message", extract)
+
+    for session_id in ("pop", "rock"):
+        main.memory.update_many(session_id, dict(POP, catalog_version=index.version, awaiting_feedback=True))
+    main.memory.update_session("rock", "genre", "rock")
+    expected = asyncio.run(main.get_valid_recommendation("rock", main.memory.get_session("rock"), advance=False))
+
+    reply = command("pop", "make it rock instead")
+    session = main.memory.get_session("pop")
+    assert session["genre"] == "rock"
+    assert reply.song["row_id"] == expected["row_id"]
+    assert index.playlist_genre[reply.song["row_id"]] == "rock"
+    # The cursor belongs to the new preferences, so the next "no" continues from it
+    assert session["candidates"]["signature"] == main.preference_signature(session)
+    assert command("pop", "no").song["genre"] == "rock"
@@ -0,0 +1,43 @@
+import asyncio
+
+import httpx
+import pytest
+
+import llm_client
+from llm_client import LLMClient, LLMError
+from metrics import METRICS
+
+
+def client_for(handler, monkeypatch, **kwargs):
+    pooled = httpx.AsyncClient
+
+    def mocked(**options):
+        return pooled(transport=httpx.MockTransport(handler), **options)
+    monkeypatch.setattr(llm_client.httpx, "AsyncClient", mocked)
+    return LLMClient(api_url="http://llm.test/v1/chat/completions", **kwargs)
+
+
+def failures() -> int:
+    return METRICS.counters.get(("llm_failures", ""), 0)
+
+
+@pytest.mark.parametrize("response", [
+    httpx.Response(401, json={"error": "bad key"}),
+    httpx.Response(200, text="not json"),
+    httpx.Response(200, json={"choices": []}),
+    httpx.Response(200, json={"choices": [{"message": {}}]}),
+])
+def test_rejected_and_unreadable_responses_raise_llm_error(monkeypatch, response):
+    client = client_for(lambda request: response, monkeypatch, max_retries=0)
+    before = failures()
+    with pytest.raises(LLMError):
+        asyncio.run(client.complete([{"role": "user", "content": "hi"}], "key"))
+    assert failures() == before + 1
+
+
+def test_a_new_event_loop_closes_the_old_pool(monkeypatch):
+    client = client_for(lambda request: httpx.Response(200, json={"choices": [{"message": {"content": " ok "}}]}), monkeypatch)
+    assert asyncio.run(client.complete([], "key")) == "ok"
+    first = client._client
+    assert asyncio.run(client.complete([], "key")) == "ok"
+    assert first.is_closed and client._client is not first
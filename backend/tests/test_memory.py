@@ -0,0 +1,93 @@
+import pytest
+
+from memory import InstrumentedSessionStore, SessionMemory, SessionStore
+from session_sqlite import SQLiteSessionStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_idle_sessions_expire_after_ttl():
+    clock = Clock()
+    store = SessionMemory(ttl=60, max_sessions=100, shards=4, clock=clock)
+    store.update_session("a", "mood", "happy")
+    store.update_session("b", "mood", "sad")
+    clock.now += 59
+    assert store.get_session("a")["mood"] == "happy"
+    clock.now += 2
+    # b was idle 61s; a was touched 2s ago
+    assert store.sweep() == 1
+    assert store.peek_session("b")["mood"] is None
+    assert store.get_session("a")["mood"] == "happy"
+    assert len(store) == 1 and store.expired == 1
+
+
+def test_peek_neither_creates_nor_refreshes():
+    clock = Clock()
+    store = SessionMemory(ttl=60, max_sessions=100, shards=1, clock=clock)
+    assert store.peek_session("ghost")["mood"] is None
+    assert len(store) == 0
+    store.update_session("a", "mood", "calm")
+    clock.now += 50
+    store.peek_session("a")
+    clock.now += 20
+    assert store.peek_session("a")["mood"] is None
+
+
+def test_least_recently_used_is_evicted_at_capacity():
+    clock = Clock()
+    store = SessionMemory(ttl=3600, max_sessions=3, shards=1, clock=clock)
+    for session_id in ("a", "b", "c"):
+        store.update_session(session_id, "genre", session_id)
+        clock.now += 1
+    store.get_session("a")
+    store.update_session("d", "genre", "d")
+    assert [store.peek_session(s)["genre"] for s in ("a", "b", "c", "d")] == ["a", None, "c", "d"]
+    assert store.evicted == 1
+    store.update_last_song("c", "song", "artist", 7)
+    store.update_session("e", "genre", "e")
+    assert store.peek_session("a")["genre"] is None
+    assert store.peek_session("c")["history"] == [7]
+    assert len(store) == 3
+
+
+def test_handlers_get_copies():
+    store = SessionMemory(shards=1)
+    store.update_many("a", {"candidates": {"signature": "s", "rows": [1, 2], "next": 0}, "history": [4]})
+    state = store.get_session("a")
+    state["candidates"]["next"] = 1
+    state["candidates"]["rows"].append(3)
+    state["history"].append(5)
+    stored = store.get_session("a")
+    assert stored["candidates"] == {"signature": "s", "rows": [1, 2], "next": 0}
+    assert stored["history"] == [4]
+
+
+def test_history_keeps_the_latest_rows_once():
+    store = SessionMemory(shards=1)
+    for row in list(range(store.HISTORY_LIMIT + 10)) + [50, 50]:
+        store.update_last_song("a", f"song {row}", "artist", row)
+    history = store.get_session("a")["history"]
+    assert len(history) == store.HISTORY_LIMIT
+    assert history == list(range(10, store.HISTORY_LIMIT + 10))
+
+
+def test_backends_implement_the_session_store(tmp_path):
+    with pytest.raises(TypeError):
+        SessionStore()
+
+    class Partial(SessionStore):
+        def get_session(self, session_id):
+            return {}
+    with pytest.raises(TypeError):
+        Partial()
+    for store in (SessionMemory(shards=1), SQLiteSessionStore(str(tmp_path / "sessions.db"))):
+        wrapped = InstrumentedSessionStore(store)
+        wrapped.update_last_song("a", "song", "artist", 3)
+        assert wrapped.get_session("a")["history"] == [3]
+        assert wrapped.blocking == store.blocking
@@ -0,0 +1,107 @@
+import itertools
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import recommender_eng
+from recommender_eng import (
+    FILTER_PASSES,
+    artist_subset,
+    candidate_filter,
+    rank_distinct,
+    rank_preferences,
+    recommend_batch,
+    weighted_score,
+    weighted_scores,
+)
+
+PREFERENCES = {
+    "genre": [None, "pop", "rock", "r&b", "hip", "jazz"],
+    "mood": [None, "happy", "sad", "blue", "calm", "party"],
+    "tempo": [None, "slow", "fast", "chill", "medium"],
+    "artist_or_song": [None, "artist 3", "love", "similar to artist 5", "zzz"],
+}
+
+
+def preference_sets(count: int, seed: int) -> list:
+    # Complete sets, as a session has them once every question is answered
+    rng = random.Random(seed)
+    sets = []
+    for _ in range(count):
+        prefs = {key: rng.choice(values) for key, values in PREFERENCES.items()}
+        prefs.update({f"no_pref_{key}": prefs[key] is None for key in PREFERENCES})
+        sets.append(prefs)
+    return sets
+
+
+def brute_force_rank(index, prefs, history, mood_vec, k):
+    # Every row through the filter passes, history tracks dropped, then a full sort by score,
+    # mood similarity and row
+    base_mask = artist_subset(prefs)
+    everything = np.arange(index.size)
+    scores = weighted_scores(everything, prefs, index)
+    similarity = index.similarity(mood_vec, everything) if mood_vec is not None else np.zeros(index.size)
+    seen = {int(index.track_codes[row]) for row in history}
+    for filter_tempo, filter_genre in FILTER_PASSES:
+        keep = candidate_filter(prefs, base_mask, filter_tempo, filter_genre)(everything)
+        rows = [int(row) for row in everything[keep] if int(index.track_codes[row]) not in seen]
+        if rows:
+            return sorted(rows, key=lambda row: (-scores[row], -similarity[row], row))[:k]
+    return []
+
+
+def test_weighted_scores_match_weighted_score(songs, build_index):
+    frame = songs(300, seed=1)
+    index = build_index(frame)
+    records = frame.to_dict("records")
+    positions = np.arange(index.size)
+    for values in itertools.product(*PREFERENCES.values()):
+        prefs = dict(zip(PREFERENCES, values))
+        expected = [weighted_score(record, prefs) for record in records]
+        assert weighted_scores(positions, prefs, index).tolist() == pytest.approx(expected), prefs
+
+
+@pytest.mark.parametrize("batch_rows", [16, recommender_eng.BUCKET_BATCH_ROWS])
+def test_rank_preferences_matches_brute_force(songs, build_index, serve, monkeypatch, batch_rows):
+    # Small batches make the bucket pruning stop early and take the rescoring paths
+    monkeypatch.setattr(recommender_eng, "BUCKET_BATCH_ROWS", batch_rows)
+    index = serve(build_index(songs(3000, seed=2)))
+    rng = np.random.default_rng(2)
+    for prefs in preference_sets(120, seed=2):
+        history = rng.choice(index.size, rng.integers(0, 60), replace=False).tolist()
+        mood_vec = rng.uniform(0, 1, 5).tolist() if rng.random() < 0.5 else None
+        k = int(rng.choice([1, 10, 50]))
+        expected = brute_force_rank(index, dict(prefs), history, mood_vec, k)
+        ranked = rank_preferences(dict(prefs), np.asarray(history, dtype=np.int64), mood_vec, k=k)
+        assert ranked.tolist() == expected, prefs
+
+
+def test_history_excludes_every_listing_of_a_track(songs, build_index, serve):
+    # Half the tracks listed twice in the same playlist: every copy ranks next to the original
+    frame = songs(2000, seed=3)
+    index = serve(build_index(pd.concat([frame, frame.sample(frac=0.5, random_state=3)])))
+    prefs = {"genre": "pop", "mood": "happy", "tempo": "fast", "artist_or_song": None, "no_pref_artist_or_song": True}
+    ranked = rank_preferences(dict(prefs), np.zeros(0, dtype=np.int64), k=index.size)
+    codes = index.track_codes[ranked]
+    repeated = next(row for row, code in zip(ranked, codes) if np.count_nonzero(codes == code) > 1)
+    picks = rank_distinct(dict(prefs), np.asarray([repeated]), k=40)
+    assert index.track_codes[repeated] not in index.track_codes[picks]
+    assert len(set(index.track_codes[picks].tolist())) == len(picks) == 40
+
+
+def test_recommend_batch_matches_ranking_each_set_alone(songs, build_index, serve):
+    index = serve(build_index(songs(3000, seed=4)))
+    rng = np.random.default_rng(4)
+    sets = []
+    for prefs in preference_sets(60, seed=4):
+        prefs["history"] = rng.choice(index.size, rng.integers(0, 40), replace=False).tolist()
+        sets.append(prefs)
+    for prefs, results in zip(sets, recommend_batch(sets, k=8)):
+        expected = rank_distinct(dict(prefs), np.asarray(prefs["history"], dtype=np.int64), k=8).tolist()
+        got = [song["row_id"] for song in results]
+        if expected:
+            assert got == expected, prefs
+        else:
+            assert got == [recommender_eng.most_popular_unseen(prefs["history"])]
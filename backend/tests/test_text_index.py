@@ -0,0 +1,119 @@
+import difflib
+import random
+
+import pytest
+
+from text_index import PhraseMatcher, TrigramIndex
+
+WORDS = [
+    "love", "night", "summer", "heart", "fire", "dream", "city", "rain", "gold", "dance",
+    "blue", "home", "wild", "light", "river", "shadow", "sky", "forever", "young", "road",
+]
+
+
+def titles(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    return [f"{rng.choice(WORDS)} {rng.choice(WORDS)} {rng.randint(1, 400)}" for _ in range(count)]
+
+
+def queries(values: list, count: int, seed: int, edits: int = 4) -> list:
+    # Catalog strings with a character dropped or doubled, then (edits > 2) with a word glued
+    # on the front, or unrelated word mixes
+    rng = random.Random(seed)
+    out = []
+    for _ in range(count):
+        text = rng.choice(values)
+        i = rng.randrange(len(text))
+        edit = rng.randrange(edits)
+        if edit == 0:
+            text = text[:i] + text[i + 1:]
+        elif edit == 1:
+            text = text[:i] + text[i] + text[i:]
+        elif edit == 2:
+            text = rng.choice(WORDS) + text
+        else:
+            text = f"{rng.choice(WORDS)}{rng.choice(WORDS)} {rng.randint(1, 400)}"
+        out.append(text)
+    return out
+
+
+def close_matches(query: str, column: list, n: int, cutoff: float) -> list:
+    # What get_close_matches picks from the catalog column: distinct strings, best first
+    return list(dict.fromkeys(difflib.get_close_matches(query, column, n=n, cutoff=cutoff)))
+
+
+def column_index(seed: int) -> tuple:
+    column = titles(3000, seed)
+    distinct = list(dict.fromkeys(column))
+    return column, TrigramIndex(distinct, [column.count(s) for s in distinct])
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_search_matches_get_close_matches_on_typos(seed):
+    column, index = column_index(seed)
+    for query in queries(index.strings, 150, seed, edits=2) + ["home", "zzzz", "x"]:
+        for n, cutoff in ((5, 0.6), (1, 0.8)):
+            found = [index.strings[i] for i in index.search(query, n=n, cutoff=cutoff)]
+            assert found == close_matches(query, column, n, cutoff), query
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_search_returns_close_matches_in_order(seed):
+    # Far-off queries may miss matches that share too few trigrams, but whatever is returned is
+    # a real close match in get_close_matches order, and most of its matches are found
+    column, index = column_index(seed)
+    expected_total, found_total = 0, 0
+    for query in queries(index.strings, 150, seed) + ["lovelove 161"]:
+        found = [index.strings[i] for i in index.search(query, n=5, cutoff=0.6)]
+        ratios = [difflib.SequenceMatcher(None, s, query).ratio() for s in found]
+        assert all(r >= 0.6 for r in ratios), query
+        assert list(zip(ratios, found)) == sorted(zip(ratios, found), reverse=True), query
+        expected = close_matches(query, column, 5, 0.6)
+        expected_total += len(expected)
+        found_total += len(set(found) & set(expected))
+    assert found_total >= 0.95 * expected_total
+
+
+def test_search_is_not_limited_to_a_shortlist():
+    # Thousands of strings share the query's trigrams; the best ratios are not the ones that
+    # share the most of them
+    strings = [f"{word} love {i}" for word in WORDS for i in range(1, 400)]
+    index = TrigramIndex(strings)
+    for query in ("love 1", "lovelove 161", "skylove 99"):
+        found = [index.strings[i] for i in index.search(query, n=5, cutoff=0.6)]
+        assert found == close_matches(query, strings, 5, 0.6), query
+
+
+def test_round_trip_through_arrays():
+    strings = titles(500, 3)
+    index = TrigramIndex(strings)
+    arrays = index.to_arrays()
+    loaded = TrigramIndex.from_arrays(
+        strings, arrays["grams"], arrays["offsets"], arrays["ids"], arrays["counts"], arrays["lengths"]
+    )
+    for query in queries(strings, 30, 3):
+        assert loaded.search(query) == index.search(query)
+        assert loaded.containing(query[:5]).tolist() == index.containing(query[:5]).tolist()
+
+
+def longest_phrase(text: str, phrases: list):
+    # Every phrase tested as a substring: the longest found, the earliest added on ties
+    best = None
+    for phrase, value in phrases:
+        if phrase and phrase in text and (best is None or len(phrase) > len(best[0])):
+            best = (phrase, value)
+    return best[1] if best else None
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_phrase_matcher_finds_the_longest_phrase(seed):
+    # Overlapping names (one inside another, shared prefixes and suffixes) and repeats
+    rng = random.Random(seed)
+    names = [" ".join(rng.sample(WORDS, rng.randint(1, 3))) for _ in range(400)] + ["", "o", "lo", "love", "a"]
+    phrases = [(name, i) for i, name in enumerate(names)]
+    matcher = PhraseMatcher(phrases)
+    for _ in range(300):
+        text = " ".join(rng.choice(WORDS + ["similar to", "the", "lovesky"]) for _ in range(rng.randint(0, 6)))
+        assert matcher.longest(text) == longest_phrase(text, phrases), text
+    assert matcher.longest("") is None
+    assert matcher.longest("zzz") is None
@@ -0,0 +1,200 @@
+import difflib
+import math
+from collections import defaultdict
+from functools import cached_property
+
+import numpy as np
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Bytes are counted modulo this many buckets for the search bound; collisions only loosen it
+CHAR_BUCKETS = 64
+# Share of the query's trigrams, per unit of cutoff, a string must have to be a search candidate.
+# A match at ratio r has about r of its characters in common blocks, and a trigram survives only
+# when all three of its characters do, so half of that is the floor.
+TRIGRAM_SHARE = 0.5
+
+
+def _char_buckets(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode("utf-8"), dtype=np.uint8) % CHAR_BUCKETS
+
+
+# Inverted trigram index over distinct strings (artist names, titles), for substring lookups,
+# plus a fuzzy search that ranks like difflib.get_close_matches over the strings sharing enough
+# trigrams with the query.
+class TrigramIndex:
+    def __init__(self, strings, counts=None):
+        self.strings = list(strings)
+        # How many catalog rows carry each string; get_close_matches counted duplicates toward n
+        self.counts = np.ones(len(self.strings), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        self.lengths = np.array([len(s) for s in self.strings], dtype=np.int32)
+        postings = defaultdict(list)
+        for i, s in enumerate(self.strings):
+            for gram in _trigrams(s):
+                postings[gram].append(i)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def to_arrays(self) -> dict:
+        # Postings flattened into one id array with per-gram offsets, for the catalog artifact
+        grams = sorted(self.postings)
+        sizes = [len(self.postings[g]) for g in grams]
+        ids = np.concatenate([self.postings[g] for g in grams]) if grams else np.zeros(0, dtype=np.int32)
+        return {
+            "grams": grams,
+            "offsets": np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)]).astype(np.int64),
+            "ids": ids.astype(np.int32),
+            "counts": self.counts,
+            "lengths": self.lengths,
+        }
+
+    @classmethod
+    def from_arrays(cls, strings, grams, offsets, ids, counts, lengths):
+        # strings only needs len() and integer indexing, so a memory-mapped string table works
+        index = cls.__new__(cls)
+        index.strings = strings
+        index.counts = counts
+        index.lengths = lengths
+        index.postings = {gram: ids[offsets[i]:offsets[i + 1]] for i, gram in enumerate(grams)}
+        return index
+
+    def containing(self, text: str) -> np.ndarray:
+        # Ids of strings that contain text as a substring: every trigram of text must be posted
+        # for the string, so intersecting those postings leaves only a few strings to check
+        grams = {text[i:i + 3] for i in range(len(text) - 2)}
+        if not grams:
+            ids = range(len(self.strings))
+        else:
+            lists = sorted((self.postings.get(g, ()) for g in grams), key=len)
+            ids = np.asarray(lists[0], dtype=np.int64)
+            for other in lists[1:]:
+                if not ids.size:
+                    break
+                ids = np.intersect1d(ids, other, assume_unique=True)
+            ids = ids.tolist()
+        return np.array([i for i in ids if text in self.strings[i]], dtype=np.int64)
+
+    @cached_property
+    def char_counts(self) -> np.ndarray:
+        # Per string, how many of its UTF-8 bytes fall in each bucket (capped at 255)
+        encoded = [str(self.strings[i]).encode("utf-8") for i in range(len(self.strings))]
+        sizes = np.array([len(b) for b in encoded], dtype=np.int64)
+        buckets = np.frombuffer(b"".join(encoded), dtype=np.uint8) % CHAR_BUCKETS
+        cells = np.repeat(np.arange(len(encoded), dtype=np.int64) * CHAR_BUCKETS, sizes) + buckets
+        counts = np.bincount(cells, minlength=len(encoded) * CHAR_BUCKETS).reshape(len(encoded), CHAR_BUCKETS)
+        return np.minimum(counts, 255).astype(np.uint8)
+
+    def search(self, query: str, n: int = 5, cutoff: float = 0.6) -> list:
+        # Returns ids into self.strings, best match first, with the ratio, cutoff, tie order and
+        # duplicate counting of get_close_matches. Candidates are the strings sharing at least
+        # TRIGRAM_SHARE * cutoff of the query's trigrams, counted from the postings. Each gets an
+        # upper bound on its ratio (2 * shared bytes / total length, like quick_ratio), and
+        # SequenceMatcher only runs in falling bound order until no bound can beat the n-th best.
+        if not query:
+            return []
+        grams = _trigrams(query)
+        lists = [self.postings[g] for g in grams if g in self.postings]
+        need = max(1, math.ceil(TRIGRAM_SHARE * cutoff * len(grams)))
+        if len(lists) < need:
+            return []
+        ids, shared = np.unique(np.concatenate(lists), return_counts=True)
+        ids = ids[shared >= need].astype(np.int64)
+        lengths = self.lengths[ids]
+        ids = ids[2 * np.minimum(lengths, len(query)) >= cutoff * (lengths + len(query))]
+        wanted = np.minimum(np.bincount(_char_buckets(query), minlength=CHAR_BUCKETS), 255).astype(np.uint8)
+        shared = np.minimum(self.char_counts[ids], wanted).sum(axis=1, dtype=np.int64)
+        bound = 2 * shared / (self.lengths[ids] + len(query))
+        keep = bound >= cutoff
+        ids, bound = ids[keep], bound[keep]
+        order = np.argsort(-bound, kind="stable")
+
+        s = difflib.SequenceMatcher()
+        s.set_seq2(query)
+        scored = []
+        threshold = -1.0
+        for j in order.tolist():
+            if bound[j] < threshold:
+                break
+            i = int(ids[j])
+            s.set_seq1(self.strings[i])
+            ratio = s.ratio()
+            if ratio < cutoff:
+                continue
+            scored.append((ratio, self.strings[i], i))
+            scored.sort(reverse=True)
+            taken = 0
+            for best, _, k in scored:
+                taken += int(self.counts[k])
+                if taken >= n:
+                    threshold = best
+                    break
+        matches, taken = [], 0
+        for _, _, i in scored:
+            if taken >= n:
+                break
+            matches.append(i)
+            taken += int(self.counts[i])
+        return matches
+
+
+# Aho-Corasick automaton over many phrases (e.g. every artist name). One pass over the text
+# finds the longest phrase occurring anywhere in it, regardless of how many phrases there are.
+class PhraseMatcher:
+    def __init__(self, phrases):
+        # phrases: iterable of (text, value); the first value wins when texts repeat
+        self._goto = [{}]
+        self._out = [-1]
+        self._out_len = [0]
+        self.values = []
+        for text, value in phrases:
+            if not text:
+                continue
+            node = 0
+            for ch in text:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._out.append(-1)
+                    self._out_len.append(0)
+                node = nxt
+            if self._out[node] == -1:
+                self._out[node] = len(self.values)
+                self._out_len[node] = len(text)
+                self.values.append(value)
+
+        # Breadth-first fail links; each node also inherits the longest phrase ending at its fail target
+        self._fail = [0] * len(self._goto)
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                if self._out[child] == -1:
+                    self._out[child] = self._out[self._fail[child]]
+                    self._out_len[child] = self._out_len[self._fail[child]]
+
+    def __len__(self):
+        return len(self.values)
+
+    def longest(self, text: str):
+        # Value of the longest phrase in text (earliest-added on ties), or None
+        best_id, best_len = -1, 0
+        node = 0
+        for ch in text:
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            phrase_id, length = self._out[node], self._out_len[node]
+            if phrase_id != -1:
+                if length > best_len or (length == best_len and phrase_id < best_id):
+                    best_id, best_len = phrase_id, length
+        return self.values[best_id] if best_id != -1 else None
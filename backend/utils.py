@@ -1,13 +1,15 @@
+import asyncio
 import difflib
-import requests
 import json
 import re
-import pandas as pd
 import base64
+import html
 import os
-
-OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
-OPENAI_MODEL = "gpt-4o"  
+from mood_cache import MoodVectorStore
+from cache import TTLCache
+from chat_templates import render_chat_template, render_set_template
+from llm_client import llm
+from metrics import stage, timed
 
 GENRES = {
     "pop", "rock", "classical", "jazz", "metal", "electronic", "hip hop", "rap",
@@ -45,47 +47,55 @@ VAGUE_TO_MOOD = {
 HARDCODED_MOOD_VECTORS = {
     # ... [no change for brevity, same as before]
 }
-_MOOD_VECTOR_CACHE = {}
+MOOD_VECTORS = MoodVectorStore()
 
-def get_mood_vector(mood, api_key, fallback=HARDCODED_MOOD_VECTORS):
-    mood = mood.lower().strip()
-    if mood in _MOOD_VECTOR_CACHE:
-        return _MOOD_VECTOR_CACHE[mood]
-    if mood in fallback:
-        return fallback[mood]
+async def _fetch_mood_vector(mood, api_key):
     prompt = (
         f"The mood '{mood}' needs to be mapped to a 5-dimensional music feature vector: "
         "valence (happiness), energy, danceability, acousticness, and tempo, each as a number between 0 and 1. "
         "Respond ONLY with a Python list of 5 floats between 0 and 1, e.g. [0.8, 0.7, 0.9, 0.2, 0.6]."
     )
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    body = {
-        "model": "gpt-4o",
-        "messages": [
-            {"role": "system", "content": "You are an expert at mapping musical moods to audio feature vectors."},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.2,
-        "max_tokens": 64
-    }
+    messages = [
+        {"role": "system", "content": "You are an expert at mapping musical moods to audio feature vectors."},
+        {"role": "user", "content": prompt}
+    ]
     try:
-        response = requests.post(OPENAI_API_URL, headers=headers, json=body, timeout=10)
-        response.raise_for_status()
-        text = response.json()["choices"][0]["message"]["content"].strip()
+        text = await llm.complete(messages, api_key, model="gpt-4o", temperature=0.2, max_tokens=64, timeout=10)
         arr = None
         match = re.search(r"\[([^\[\]]+)\]", text)
         if match:
             arr = match.group(0)
             arr = [float(x.strip()) for x in arr.strip("[]").split(",")]
         if arr and len(arr) == 5 and all(0 <= x <= 1 for x in arr):
-            _MOOD_VECTOR_CACHE[mood] = arr
             return arr
     except Exception as e:
         print("[UTILS] GPT mood vector fetch failed, fallback to hardcoded:", e)
-    return fallback.get(mood, fallback["calm"])
+    return None
+
+@timed("mood_vector")
+async def get_mood_vector(mood, api_key, fallback=HARDCODED_MOOD_VECTORS):
+    mood = mood.lower().strip()
+
+    async def fetch(m):
+        return fallback.get(m) or await _fetch_mood_vector(m, api_key)
+
+    vec = await MOOD_VECTORS.get_or_fetch(mood, fetch)
+    if vec is not None:
+        return vec
+    # Like lookup_mood_vector: None when there is no fallback either, and callers rank without one
+    return fallback.get(mood, fallback.get("calm"))
+
+def lookup_mood_vector(mood, fallback=HARDCODED_MOOD_VECTORS):
+    # Cache-only lookup for synchronous callers; never goes to the network
+    mood = mood.lower().strip()
+    vec = MOOD_VECTORS.get(mood)
+    if vec is not None:
+        return vec
+    return fallback.get(mood, fallback.get("calm"))
+
+async def prewarm_mood_vectors(api_key, moods=None):
+    # Fetch vectors for every mood not already on disk; returns how many were fetched
+    return await MOOD_VECTORS.prewarm(moods or MOODS, lambda m: _fetch_mood_vector(m, api_key))
 
 def convert_tempo_to_bpm(tempo_category: str) -> tuple:
     return {
@@ -110,35 +120,20 @@ def fuzzy_match_word(word, options, cutoff=0.75):
         return matches[0]
     return None
 
-def fuzzy_match_artist_song(df, query: str):
-    if not isinstance(query, str):
-        print(f"[UTILS] Invalid query type for fuzzy_match_artist_song: {type(query)}")
-        return df.head(5)
-    query = query.lower().strip()
-    if not query:
-        return df.head(5)
-    # Try strict match first
-    match_artist = df[df['track_artist'].str.lower() == query]
-    match_song = df[df['track_name'].str.lower() == query]
-    if not match_artist.empty or not match_song.empty:
-        return pd.concat([match_artist, match_song]).drop_duplicates()
-    # Fuzzy search
-    df['track_artist'] = df['track_artist'].fillna("").astype(str).str.lower()
-    df['track_name'] = df['track_name'].fillna("").astype(str).str.lower()
-    artist_matches = difflib.get_close_matches(query, df['track_artist'], n=5, cutoff=0.6)
-    song_matches = difflib.get_close_matches(query, df['track_name'], n=5, cutoff=0.6)
-    if artist_matches:
-        return df[df['track_artist'].str.lower().isin(artist_matches)]
-    elif song_matches:
-        return df[df['track_name'].str.lower().isin(song_matches)]
-    else:
-        return df.nlargest(5, 'popularity') if 'popularity' in df.columns else df.head(5)
+# "llm": live blurb per recommendation (cached); "template": local template bank only;
+# "hybrid": cached LLM blurb if we have one, otherwise a template now while the LLM
+# blurb is generated in the background for next time
+CHAT_RESPONSE_MODE = os.getenv("CHAT_RESPONSE_MODE", "hybrid")
+CHAT_BLURB_CACHE = TTLCache(
+    max_size=int(os.getenv("CHAT_BLURB_CACHE_SIZE", "8192")),
+    ttl=float(os.getenv("CHAT_BLURB_CACHE_TTL_SECONDS", "86400")),
+)
+_BLURB_TASKS = {}
 
-def generate_chat_response(song_dict: dict, preferences: dict, api_key: str, custom_prompt: str = None) -> str:
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+def _has_spotify_link(spotify_url) -> bool:
+    return bool(spotify_url and isinstance(spotify_url, str) and "open.spotify.com/track/" in spotify_url and len(spotify_url) > 35)
+
+def _chat_prompt(song_dict: dict, preferences: dict) -> str:
     genre = preferences.get('genre') or "any"
     mood = preferences.get('mood') or "any"
     tempo = preferences.get('tempo') or "any"
@@ -146,8 +141,7 @@ def generate_chat_response(song_dict: dict, preferences: dict, api_key: str, cus
     artist = song_dict.get('artist', 'Unknown')
     song_genre = song_dict.get('genre', 'Unknown')
     song_tempo = song_dict.get('tempo', 'Unknown')
-    spotify_url = song_dict.get('spotify_url')
-    prompt = custom_prompt or f"""
+    return f"""
 You are Moodify, a friendly and concise music recommendation assistant.
 The user wants a song that matches these preferences:
 Genre: {genre}, Mood: {mood}, Tempo: {tempo}.
@@ -156,35 +150,246 @@ If there is a Spotify link available, include 'Listen on Spotify' as a hyperlink
 Reply in a warm and friendly tone. Your response must be short and concise — no more than 1.5 sentences.
 Don't suggest alternatives or explain why. Mention only this one song.
 """
-    body = {
-        "model": OPENAI_MODEL,
-        "messages": [
-            {"role": "system", "content": "You are a helpful music assistant. Respond in under 1.5 sentences."},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.6,
-        "max_tokens": 200
-    }
+
+def _blurb_messages(prompt: str) -> list:
+    return [
+        {"role": "system", "content": "You are a helpful music assistant. Respond in under 1.5 sentences."},
+        {"role": "user", "content": prompt}
+    ]
+
+async def _llm_blurb(prompt: str, api_key: str) -> str:
+    return await llm.complete(_blurb_messages(prompt), api_key, temperature=0.6, max_tokens=200)
+
+def _blurb_key(song_dict: dict, preferences: dict) -> tuple:
+    return (
+        song_dict.get('song'), song_dict.get('artist'),
+        (preferences.get('mood') or "any").lower(), (preferences.get('genre') or "any").lower(),
+        (preferences.get('tempo') or "any").lower(),
+    )
+
+def _enrich_blurb_in_background(key: tuple, prompt: str, api_key: str):
+    if key in _BLURB_TASKS:
+        return
+
+    async def enrich():
+        try:
+            CHAT_BLURB_CACHE.set(key, await _llm_blurb(prompt, api_key))
+        except Exception as e:
+            print("[UTILS] Background chat blurb failed:", e)
+        finally:
+            _BLURB_TASKS.pop(key, None)
+
+    _BLURB_TASKS[key] = asyncio.create_task(enrich())
+
+def _spotify_link(song_dict: dict) -> str:
+    spotify_url = song_dict.get('spotify_url')
+    return f' 🎵 <a href="{spotify_url}" target="_blank">Listen on Spotify</a>' if _has_spotify_link(spotify_url) else ""
+
+def _fallback_blurb(song_dict: dict) -> str:
+    fallback = f"🎵 Here’s a great track: '{song_dict.get('song', 'Unknown')}' by {song_dict.get('artist', 'Unknown')}."
+    if _spotify_link(song_dict):
+        fallback += f' <a href="{song_dict.get("spotify_url")}" target="_blank">Listen</a>'
+    return fallback
+
+@timed("chat")
+async def generate_chat_response(song_dict: dict, preferences: dict, api_key: str, custom_prompt: str = None, mode: str = None) -> str:
+    mode = mode or CHAT_RESPONSE_MODE
+    song = song_dict.get('song', 'Unknown')
+    artist = song_dict.get('artist', 'Unknown')
+    link = _spotify_link(song_dict)
+    prompt = custom_prompt or _chat_prompt(song_dict, preferences)
+
+    key = _blurb_key(song_dict, preferences)
+    if not custom_prompt:
+        cached = CHAT_BLURB_CACHE.get(key)
+        if cached is not None:
+            return cached + link
+        if mode in ("template", "hybrid"):
+            if mode == "hybrid" and api_key:
+                _enrich_blurb_in_background(key, prompt, api_key)
+            mood = preferences.get('mood')
+            return render_chat_template(song, artist, mood, song_dict.get('genre'), song_dict.get('tempo')) + link
     try:
-        response = requests.post(OPENAI_API_URL, headers=headers, json=body)
-        response.raise_for_status()
-        message = response.json()["choices"][0]["message"]["content"].strip()
-        if spotify_url and isinstance(spotify_url, str) and "open.spotify.com/track/" in spotify_url and len(spotify_url) > 35:
-            message += f' 🎵 <a href="{spotify_url}" target="_blank">Listen on Spotify</a>'
-        return message
+        message = await _llm_blurb(prompt, api_key)
+        if not custom_prompt:
+            CHAT_BLURB_CACHE.set(key, message)
+        return message + link
     except Exception as e:
         print("[UTILS] OpenAI Chat Error:", e)
-        fallback = f"🎵 Here’s a great track: '{song}' by {artist}."
-        if spotify_url and isinstance(spotify_url, str) and "open.spotify.com/track/" in spotify_url and len(spotify_url) > 35:
-            fallback += f' <a href="{spotify_url}" target="_blank">Listen</a>'
-        return fallback
-
-def extract_preferences_from_message(message: str, api_key: str) -> dict:
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+        return _fallback_blurb(song_dict)
+
+async def stream_chat_response(song_dict: dict, preferences: dict, api_key: str, mode: str = None):
+    # Same text as generate_chat_response, yielded as it is produced; only "llm" mode streams tokens
+    mode = mode or CHAT_RESPONSE_MODE
+    if mode != "llm":
+        yield await generate_chat_response(song_dict, preferences, api_key, mode=mode)
+        return
+    key = _blurb_key(song_dict, preferences)
+    cached = CHAT_BLURB_CACHE.get(key)
+    if cached is not None:
+        yield cached + _spotify_link(song_dict)
+        return
+    parts = []
+    try:
+        with stage("chat"):
+            async for delta in llm.stream(_blurb_messages(_chat_prompt(song_dict, preferences)), api_key, temperature=0.6, max_tokens=200):
+                parts.append(delta)
+                yield delta
+    except Exception as e:
+        print("[UTILS] OpenAI Chat stream error:", e)
+        if not parts:
+            yield _fallback_blurb(song_dict)
+        return
+    CHAT_BLURB_CACHE.set(key, "".join(parts).strip())
+    yield _spotify_link(song_dict)
+
+def _set_prompt(songs: list, preferences: dict) -> str:
+    genre = preferences.get('genre') or "any"
+    mood = preferences.get('mood') or "any"
+    tempo = preferences.get('tempo') or "any"
+    listing = "\n".join(
+        f'- "{s.get("song", "Unknown")}" by {s.get("artist", "Unknown")} ({s.get("genre", "Unknown")}, {s.get("tempo", "Unknown")} tempo)'
+        for s in songs
+    )
+    return f"""
+You are Moodify, a friendly and concise music recommendation assistant.
+The user wants songs that match these preferences:
+Genre: {genre}, Mood: {mood}, Tempo: {tempo}.
+These {len(songs)} songs were picked for them:
+{listing}
+Reply with ONE short, warm sentence introducing this set. Don't list the songs or add links; they are shown after your sentence.
+"""
+
+def _song_list(songs: list) -> str:
+    items = "".join(
+        f'<li>"{html.escape(str(s.get("song", "Unknown")))}" by {html.escape(str(s.get("artist", "Unknown")))}{_spotify_link(s)}</li>'
+        for s in songs
+    )
+    return f"<ol>{items}</ol>"
+
+@timed("chat")
+async def stream_set_chat_response(songs: list, preferences: dict, api_key: str, mode: str = None):
+    # One reply for a several-song recommendation: an opening line, then the songs as a list.
+    # Only "llm" mode calls the model, once for the whole set; sets rarely repeat, so "hybrid"
+    # uses the template line rather than enriching in the background.
+    mode = mode or CHAT_RESPONSE_MODE
+    key = ("set",) + tuple((s.get('song'), s.get('artist')) for s in songs) + _blurb_key({}, preferences)[2:]
+    cached = CHAT_BLURB_CACHE.get(key)
+    if cached is not None:
+        yield cached
+    elif mode != "llm":
+        yield render_set_template(len(songs), preferences.get('mood'), preferences.get('genre'))
+    else:
+        parts = []
+        try:
+            async for delta in llm.stream(_blurb_messages(_set_prompt(songs, preferences)), api_key, temperature=0.6, max_tokens=120):
+                parts.append(delta)
+                yield delta
+            CHAT_BLURB_CACHE.set(key, "".join(parts).strip())
+        except Exception as e:
+            print("[UTILS] OpenAI set intro stream error:", e)
+            if not parts:
+                yield render_set_template(len(songs), preferences.get('mood'), preferences.get('genre'))
+    yield _song_list(songs)
+
+TEMPO_WORDS = {
+    "slow": "slow", "slower": "slow", "slowish": "slow",
+    "medium": "medium", "moderate": "medium", "mid": "medium", "midtempo": "medium", "mid-tempo": "medium",
+    "fast": "fast", "faster": "fast", "quick": "fast", "upbeat": "fast", "uptempo": "fast", "up-tempo": "fast",
+}
+
+# Words that carry no preference on their own; they neither help nor hurt local confidence
+FILLER_WORDS = {
+    "a", "an", "the", "i", "i'm", "im", "me", "my", "some", "something", "music", "song", "songs",
+    "track", "tracks", "tunes", "want", "wanna", "would", "like", "love", "please", "play", "give",
+    "feel", "feeling", "am", "in", "mood", "for", "and", "or", "to", "of", "by", "with", "listen",
+    "hear", "vibe", "vibes", "tempo", "genre", "kind", "type", "style", "really", "very", "so", "just",
+    "bit", "little", "more", "today", "now", "pretty", "kinda", "let's", "lets", "can", "you", "get",
+    "put", "on", "maybe", "quite", "beat", "beats", "pace", "paced", "stuff", "is", "it",
+}
+
+LOCAL_EXTRACTION_ENABLED = os.getenv("LOCAL_EXTRACTION", "1") == "1"
+LOCAL_CONFIDENCE_THRESHOLD = float(os.getenv("LOCAL_EXTRACTION_CONFIDENCE", "0.8"))
+_MULTIWORD_GENRES = sorted((g for g in GENRES if " " in g), key=len, reverse=True)
+
+def extract_preferences_locally(message: str, artist_matcher=None) -> tuple:
+    # Resolves genre/mood/tempo words (and a bare artist name, via the catalog's
+    # text_index.PhraseMatcher) without the LLM. Confidence is the share of meaningful
+    # words that were explained; anything unexplained lowers it.
+    prefs = {"genre": None, "mood": None, "tempo": None, "artist_or_song": None}
+    msg = normalize_message(message)
+    for genre in _MULTIWORD_GENRES:
+        if re.search(rf"\b{re.escape(genre)}\b", msg):
+            prefs["genre"] = genre
+            msg = re.sub(rf"\b{re.escape(genre)}\b", " ", msg)
+            break
+    tokens = [t for t in re.findall(r"[a-z0-9&'-]+", msg) if t not in FILLER_WORDS]
+    if not tokens:
+        return prefs, 1.0 if prefs["genre"] else 0.0
+
+    explained = 0.0
+    leftover = []
+    for token in tokens:
+        if token in GENRES and not prefs["genre"]:
+            prefs["genre"] = token
+            explained += 1
+        elif token in MOODS and not prefs["mood"]:
+            prefs["mood"] = token
+            explained += 1
+        elif token in VAGUE_TO_MOOD and not prefs["mood"]:
+            prefs["mood"] = VAGUE_TO_MOOD[token]
+            explained += 1
+        elif token in TEMPO_WORDS and not prefs["tempo"]:
+            prefs["tempo"] = TEMPO_WORDS[token]
+            explained += 1
+        else:
+            leftover.append(token)
+
+    if leftover and artist_matcher is not None:
+        # Only accept an artist when it accounts for every remaining word
+        rest = " ".join(leftover)
+        artist = artist_matcher.longest(rest)
+        if artist is not None and str(artist).lower() == rest:
+            prefs["artist_or_song"] = artist
+            explained += len(leftover)
+            leftover = []
+
+    for token in leftover:
+        # Near-miss spellings of single vocabulary words count, at a discount
+        mood = fuzzy_match_word(token, MOODS) if not prefs["mood"] else None
+        genre = fuzzy_match_word(token, GENRES) if not prefs["genre"] and not mood else None
+        if mood:
+            prefs["mood"] = mood
+            explained += 0.9
+        elif genre:
+            prefs["genre"] = genre
+            explained += 0.9
+    return prefs, explained / len(tokens)
+
+# Post-processed extractions keyed by normalized message; short messages repeat constantly
+EXTRACTION_CACHE = TTLCache(
+    max_size=int(os.getenv("EXTRACTION_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", "3600")),
+)
+
+def normalize_message(message: str) -> str:
+    return " ".join(message.strip().lower().split())
+
+@timed("extraction")
+async def extract_preferences_from_message(message: str, api_key: str, artist_matcher=None) -> dict:
+    key = normalize_message(message)
+    cached = EXTRACTION_CACHE.get(key)
+    if cached is not None:
+        return dict(cached)
+    extracted, cacheable = await _extract_preferences(message, api_key, artist_matcher)
+    # Don't pin a failed LLM call's empty result for the whole TTL
+    if cacheable:
+        EXTRACTION_CACHE.set(key, dict(extracted))
+    return extracted
+
+async def _extract_preferences(message: str, api_key: str, artist_matcher=None) -> tuple:
     msg = message.strip().lower()
+    cacheable = True
 
     def contains_none_like(val):
         for none_str in NONE_LIKE:
@@ -203,7 +408,13 @@ def extract_preferences_from_message(message: str, api_key: str) -> dict:
             break
 
     extracted = {}
-    if not any(none_fields.values()):
+    local, confidence = ({}, 0.0)
+    if LOCAL_EXTRACTION_ENABLED and not any(none_fields.values()):
+        local, confidence = extract_preferences_locally(message, artist_matcher)
+    if confidence >= LOCAL_CONFIDENCE_THRESHOLD:
+        # Fully explained by our own vocabulary; only low-confidence messages go to the LLM
+        extracted = local
+    elif not any(none_fields.values()):
         mood_list_str = ", ".join(f'"{m}"' for m in sorted(MOODS))
         system_prompt = (
             f"You are an AI that extracts ONLY music preferences from user input in English.\n"
@@ -219,25 +430,18 @@ If genre, mood, tempo, or artist/song is not mentioned or not clear, set to null
 Reply only with the JSON object, nothing else.
 Input: "{message}".
 """
-        body = {
-            "model": OPENAI_MODEL,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            "temperature": 0.2,
-            "max_tokens": 250
-        }
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
         try:
-            response = requests.post(OPENAI_API_URL, headers=headers, json=body)
-            response.raise_for_status()
-            text = response.json()["choices"][0]["message"]["content"].strip()
+            text = await llm.complete(messages, api_key, temperature=0.2, max_tokens=250)
             if text == "__NOT_ENGLISH__":
                 extracted = {"genre": None, "mood": None, "tempo": None, "artist_or_song": None, "_not_english": True}
-                return extracted
+                return extracted, cacheable
             elif text == "__NOT_MUSIC__":
                 extracted = {"genre": None, "mood": None, "tempo": None, "artist_or_song": None, "_not_music": True}
-                return extracted
+                return extracted, cacheable
             if text.startswith("```"):
                 text = text.lstrip("`")
                 text = text[text.find("{"):]
@@ -249,12 +453,15 @@ Input: "{message}".
                 except Exception as e:
                     print("[UTILS] OpenAI Extraction Error (inner):", e, "| Offending text:", repr(json_text))
                     extracted = {"genre": None, "mood": None, "tempo": None, "artist_or_song": None}
+                    cacheable = False
             else:
                 print("[UTILS] OpenAI Extraction Error: Could not find JSON object in:", repr(text))
                 extracted = {"genre": None, "mood": None, "tempo": None, "artist_or_song": None}
+                cacheable = False
         except Exception as e:
             print("[UTILS] OpenAI Extraction Error:", e)
             extracted = {"genre": None, "mood": None, "tempo": None, "artist_or_song": None}
+            cacheable = False
     else:
         extracted = {"genre": None, "mood": None, "tempo": None, "artist_or_song": None}
 
@@ -273,34 +480,10 @@ Input: "{message}".
             if key == "genre":
                 corrected = fuzzy_match_word(val, GENRES)
                 extracted[key] = corrected if corrected in GENRES else None
-    return {k: extracted.get(k, None) for k in ["genre", "mood", "tempo", "artist_or_song"]} | {k: v for k, v in extracted.items() if k.startswith("_")}
-
-def split_mode_category(mode_category: str) -> tuple:
-    if isinstance(mode_category, str):
-        parts = re.split(r'[\s_]+', mode_category.strip())
-        return (parts[0].lower(), parts[1].lower()) if len(parts) >= 2 else (parts[0].lower(), None)
-    return (None, None)
-
-def build_recommendation_key(genre: str, mood: str, energy: str, tempo: str) -> str:
-    return f"{genre}_{mood.capitalize()} {energy.capitalize()}_{tempo.capitalize()}"
-
-def precompute_recommendation_map(df: pd.DataFrame) -> dict:
-    index_map = {}
-    for _, row in df.iterrows():
-        genre = row.get("playlist_genre", "unknown")
-        tempo = row.get("tempo_category", "medium")
-        mood, energy = split_mode_category(row.get("mode_category", "calm calm"))
-        key = build_recommendation_key(genre, mood, energy, tempo)
-        if key not in index_map:
-            index_map[key] = []
-        index_map[key].append(row)
-    return index_map
-
-def next_ai_message(session: dict, last_user_message: str, api_key: str) -> str:
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+    result = {k: extracted.get(k, None) for k in ["genre", "mood", "tempo", "artist_or_song"]} | {k: v for k, v in extracted.items() if k.startswith("_")}
+    return result, cacheable
+
+def _followup_messages(session: dict, last_user_message: str) -> list:
     all_keys = ["genre", "mood", "tempo", "artist_or_song"]
     known_prefs = {k: session.get(k) for k in all_keys if session.get(k) is not None}
     missing = [k for k in all_keys if not (session.get(k) is not None or session.get(f"no_pref_{k}", False))]
@@ -327,19 +510,21 @@ def next_ai_message(session: dict, last_user_message: str, api_key: str) -> str:
         "Do not give a recommendation until everything is filled."
     )
 
-    body = {
-        "model": OPENAI_MODEL,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        "temperature": 0.7,
-        "max_tokens": 200
-    }
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+FOLLOWUP_FALLBACK = "What kind of music do you feel like today?"
+
+@timed("followup")
+async def stream_next_ai_message(session: dict, last_user_message: str, api_key: str):
+    started = False
     try:
-        response = requests.post(OPENAI_API_URL, headers=headers, json=body)
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"].strip()
+        async for delta in llm.stream(_followup_messages(session, last_user_message), api_key, temperature=0.7, max_tokens=200):
+            started = True
+            yield delta
     except Exception as e:
-        print("[UTILS] OpenAI next_ai_message error:", e)
-        return "What kind of music do you feel like today?"
+        print("[UTILS] OpenAI stream_next_ai_message error:", e)
+        if not started:
+            yield FOLLOWUP_FALLBACK
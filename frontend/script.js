@@ -5,27 +5,8 @@ window.handleBotReply = function (msg) {
   appendUserMessage(msg, true);
   showTypingIndicator();
 
-  fetch(`${backendUrl}/command`, {
-    method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ session_id: sessionId, command: msg })
-  })
-    .then(res => res.json())
-    .then(data => {
-      const resp = data.response || "<span style='color:orange'>Sorry, I didn't get that. Try a different preference or reset.</span>";
-      const delay = calculateTypingDelay(resp);
-      setTimeout(() => {
-        hideTypingIndicator();
-        appendBotMessage(resp);
-        updatePreferencesPanel();
-      }, delay);
-    })
-    .catch(error => {
-      console.error("API error:", error);
-      hideTypingIndicator();
-      appendBotMessage("<span style='color:red'>⚠️ Sorry, I lost connection to Moodify. Please check your internet or try again.</span>");
-      updatePreferencesPanel();
-    });
+  streamChat("/command", { session_id: sessionId, command: msg },
+    "<span style='color:orange'>Sorry, I didn't get that. Try a different preference or reset.</span>");
 };
 
 window.sendMessage = function () {
@@ -43,28 +24,121 @@ window.sendMessage = function () {
 
   showTypingIndicator();
 
-  fetch(`${backendUrl}/recommend`, {
+  streamChat("/recommend", preferences,
+    "<span style='color:orange'>I didn't understand. Tell me your mood, genre, or artist!</span>");
+};
+
+function streamChat(path, payload, fallbackText) {
+  // Reads the server-sent events of the streaming endpoints: song, token..., buttons, done.
+  // Tokens are shown as they arrive; "done" carries the full reply, rendered like any other message.
+  let finished = false;
+  let started = false;
+  let text = "";
+  return fetch(`${backendUrl}${path}/stream`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
-    body: JSON.stringify(preferences)
+    body: JSON.stringify(payload)
   })
-    .then(res => res.json())
-    .then(data => {
-      const resp = data.response || "<span style='color:orange'>I didn't understand. Tell me your mood, genre, or artist!</span>";
-      const delay = calculateTypingDelay(resp);
-      setTimeout(() => {
-        hideTypingIndicator();
-        appendBotMessage(resp);
-        updatePreferencesPanel();
-      }, delay);
+    .then(res => {
+      if (!res.ok || !res.body) throw new Error(`Streaming unavailable (${res.status})`);
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+
+      const handleEvent = (event, data) => {
+        started = true;
+        if (event === "token") {
+          hideTypingIndicator();
+          text += data.text;
+          updateStreamingBubble(`<span style='color:green'>${text}</span>`);
+        } else if (event === "buttons") {
+          updateStreamingBubble(`<span style='color:green'>${text}</span>${data.html}`);
+        } else if (event === "done") {
+          finished = true;
+          hideTypingIndicator();
+          finishStreamingBubble(data.response || fallbackText);
+          updatePreferencesPanel();
+        }
+      };
+
+      const pump = () => reader.read().then(({ done, value }) => {
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+          const block = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          let event = "message";
+          let data = "";
+          block.split("\n").forEach(line => {
+            if (line.startsWith("event:")) event = line.slice(6).trim();
+            else if (line.startsWith("data:")) data += line.slice(5).trim();
+          });
+          if (data) handleEvent(event, JSON.parse(data));
+        }
+        if (!done) return pump();
+        if (!finished) finishStreamingBubble(text ? `<span style='color:green'>${text}</span>` : fallbackText);
+      });
+      return pump();
     })
     .catch(error => {
-      console.error("API error:", error);
-      hideTypingIndicator();
-      appendBotMessage("<span style='color:red'>⚠️ Sorry, I lost connection to Moodify. Please check your internet or try again.</span>");
-      updatePreferencesPanel();
+      if (finished) return;
+      if (started) {
+        // The turn already ran server-side; show what arrived rather than asking again
+        console.error("Stream interrupted:", error);
+        hideTypingIndicator();
+        finishStreamingBubble(text ? `<span style='color:green'>${text}</span>` : fallbackText);
+        updatePreferencesPanel();
+        return;
+      }
+      console.warn("Streaming failed, falling back:", error);
+      removeStreamingBubble();
+      return fetch(`${backendUrl}${path}`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(payload)
+      })
+        .then(res => res.json())
+        .then(data => {
+          const resp = data.response || fallbackText;
+          const delay = calculateTypingDelay(resp);
+          setTimeout(() => {
+            hideTypingIndicator();
+            appendBotMessage(resp);
+            updatePreferencesPanel();
+          }, delay);
+        })
+        .catch(error => {
+          console.error("API error:", error);
+          hideTypingIndicator();
+          appendBotMessage("<span style='color:red'>⚠️ Sorry, I lost connection to Moodify. Please check your internet or try again.</span>");
+          updatePreferencesPanel();
+        });
     });
-};
+}
+
+function updateStreamingBubble(html) {
+  const chatBox = document.getElementById("chat-box");
+  let bubble = document.getElementById("streaming-reply");
+  if (!bubble) {
+    bubble = document.createElement("p");
+    bubble.id = "streaming-reply";
+    bubble.className = "green-response";
+    chatBox.appendChild(bubble);
+  }
+  bubble.innerHTML = `<strong>Moodify:</strong> ${html}`;
+  chatBox.scrollTop = chatBox.scrollHeight;
+}
+
+function removeStreamingBubble() {
+  const bubble = document.getElementById("streaming-reply");
+  if (bubble) bubble.remove();
+}
+
+function finishStreamingBubble(response) {
+  // Swap the live bubble for the final rendering (Spotify embed, working buttons)
+  removeStreamingBubble();
+  appendBotMessage(response);
+}
 
 window.onload = () => {
   document.getElementById("chat-box").innerHTML = "";